@@ -1,15 +1,27 @@
 from logging.handlers import RotatingFileHandler
-from flask import Flask, request, session
+from flask import Flask, g, request, session
 from utils import LiveStreamManager
 from datetime import datetime
 from config import Config
+from helpers import metrics
 
 import logging
 import atexit
 import os
+import time
 
 from routes.main import main_bp
 from routes.streaming import streaming_bp
+from services import StreamReaper, BroadcastScheduler, StreamAdmission
+from services.telemetry import process_usage
+from services.supervisor import RemoteLive
+
+HTTP_SECONDS = metrics.histogram(
+    'instream_http_request_duration_seconds',
+    'Duration of HTTP requests by method, route and status.',
+    ('method', 'route', 'status')
+)
+HTTP_IN_FLIGHT = metrics.gauge('instream_http_requests_in_flight', 'HTTP requests being served.')
 
 def create_app():
     app = Flask(__name__)
@@ -20,6 +32,15 @@ def create_app():
     app.register_blueprint(streaming_bp, url_prefix='/api')
     register_error_handlers(app)
     register_request_handlers(app)
+    register_metrics()
+    if Config.STREAM_SUPERVISOR_SOCKET:
+        if not Config.STREAM_SUPERVISOR_AUTHKEY:
+            raise RuntimeError('STREAM_SUPERVISOR_AUTHKEY must be set to use the streaming supervisor')
+        LiveStreamManager.set_resolver(RemoteLive.attach)
+    # Records of streams whose process is gone, e.g. from before a restart
+    LiveStreamManager.purge_stale()
+    StreamReaper.start(app)
+    BroadcastScheduler.start(app)
     atexit.register(lambda: cleanup_on_exit(app))
     return app
 
@@ -82,22 +103,35 @@ def register_request_handlers(app):
     
     @app.before_request
     def before_request():
+        g.request_started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
         if not request.path.startswith('/static'):
             app.logger.info(
                 f'{request.method} {request.path} - '
                 f'IP: {request.remote_addr} - '
                 f'User-Agent: {request.headers.get("User-Agent", "Unknown")}'
             )
-        
-        if hasattr(request, 'path') and request.path == '/':
-            LiveStreamManager.cleanup_old_instances()
     
     @app.after_request
     def after_request(response):
+        started = g.get('request_started')
+        if started is not None:
+            # Route patterns rather than paths keep the label set bounded
+            HTTP_SECONDS.observe(
+                time.perf_counter() - started,
+                method=request.method,
+                route=request.url_rule.rule if request.url_rule else 'unmatched',
+                status=response.status_code
+            )
         if not request.path.startswith('/static'):
             app.logger.info(f'Response: {response.status_code}')
         return response
     
+    @app.teardown_request
+    def teardown_request(error):
+        if g.pop('request_started', None) is not None:
+            HTTP_IN_FLIGHT.dec()
+    
     @app.context_processor
     def inject_template_vars():
         from __init__ import __version__, __app_name__
@@ -107,11 +141,36 @@ def register_request_handlers(app):
             'app_version': __version__
         }
 
+def register_metrics():
+    """Gauges computed when /metrics is scraped."""
+    metrics.gauge(
+        'instream_active_streams',
+        'Active live streams in the state backend: of this worker with the memory backend, of all workers with sqlite.'
+    ).set_function(lambda: sum(1 for record in LiveStreamManager.snapshot().values() if record['active']))
+    metrics.gauge(
+        'instream_stream_slots', 'Stream pipeline slots: limit, running, and waiting in this worker.', ('state',)
+    ).set_function(lambda: {(state,): value for state, value in StreamAdmission.usage().items()})
+
+    def own_usage(index):
+        usage = process_usage(os.getpid())
+        return usage[index] if usage else float('nan')
+    
+    metrics.counter(
+        'process_cpu_seconds_total', 'User and system CPU time of this worker in seconds.'
+    ).set_function(lambda: own_usage(0))
+    metrics.gauge(
+        'process_resident_memory_bytes', 'Resident memory of this worker in bytes.'
+    ).set_function(lambda: own_usage(1))
+
 def cleanup_on_exit(app):
     try:
         app.logger.info('Application shutting down, cleaning up resources...')
-        for session_id in list(LiveStreamManager._instances.keys()):
-            LiveStreamManager.remove_instance(session_id)
+        if Config.STREAM_SUPERVISOR_SOCKET:
+            # Streams belong to the supervisor and must outlive this worker
+            app.logger.info('Streams are owned by the supervisor, leaving them running')
+        else:
+            for session_id in LiveStreamManager.session_ids():
+                LiveStreamManager.remove_instance(session_id)
         
         app.logger.info('Cleanup completed successfully')
         
@@ -123,15 +182,11 @@ app = create_app()
 @app.route('/debug/sessions')
 def debug_sessions():
     if app.debug:
+        instances = LiveStreamManager.snapshot()
         return {
             'session_data': dict(session),
-            'active_instances': len(LiveStreamManager._instances),
-            'instances': {
-                k: {
-                    'active': v.get('active', False),
-                    'created_at': v.get('created_at', 0)
-                } for k, v in LiveStreamManager._instances.items()
-            }
+            'active_instances': len(instances),
+            'instances': instances
         }
     return {'message': 'Debug mode disabled'}, 403
 
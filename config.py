@@ -8,15 +8,63 @@ class Config:
     
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'static/upload')
     LOG_FOLDER = os.getenv('LOG_FOLDER', 'logs')
+    DATA_FOLDER = os.getenv('DATA_FOLDER', 'data')
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     SECRET_KEY = os.getenv('FLASK_SECRET_KEY', "ini-secret-key-paling-aman")
     DEFAULT_LIVE_TITLE = os.getenv('DEFAULT_LIVE_TITLE', 'LIVE')
     MAX_CONTENT_LENGTH = int(os.getenv('MAX_FILE_SIZE_MB', 1000)) * 1024 * 1024
+    MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE_MB', 10000)) * 1024 * 1024
+    UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE_MB', 8)) * 1024 * 1024
+    UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', 86400))
+    DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', 4))
+    DOWNLOAD_PER_HOST = int(os.getenv('DOWNLOAD_PER_HOST', 2))
+    DOWNLOAD_SEGMENT_WORKERS = int(os.getenv('DOWNLOAD_SEGMENT_WORKERS', 8))
+    DOWNLOAD_SEGMENT_SIZE = int(os.getenv('DOWNLOAD_SEGMENT_SIZE_MB', 16)) * 1024 * 1024
+    DOWNLOAD_TIMEOUT = float(os.getenv('DOWNLOAD_TIMEOUT', 30))
+    THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 1))
+    THUMBNAIL_WIDTH = int(os.getenv('THUMBNAIL_WIDTH', 320))
+    THUMBNAIL_SPRITE_WIDTH = int(os.getenv('THUMBNAIL_SPRITE_WIDTH', 160))
+    THUMBNAIL_SPRITE_FRAMES = int(os.getenv('THUMBNAIL_SPRITE_FRAMES', 10))
+    DOWNLOAD_CACHE_SIZE = int(os.getenv('DOWNLOAD_CACHE_SIZE_MB', 5120)) * 1024 * 1024
+    DOWNLOAD_CACHE_MAX_AGE = int(os.getenv('DOWNLOAD_CACHE_MAX_AGE', 86400))
+    PROBE_WORKERS = int(os.getenv('PROBE_WORKERS', 2))
+    PROBE_TIMEOUT = float(os.getenv('PROBE_TIMEOUT', 30))
+    PREPARE_WORKERS = int(os.getenv('PREPARE_WORKERS', 1))
+    PREPARE_MAX_DIMENSION = int(os.getenv('PREPARE_MAX_DIMENSION', 1280))
+    PREPARE_VIDEO_BITRATE = int(os.getenv('PREPARE_VIDEO_BITRATE', 2500))
+    PREPARE_PRESET = os.getenv('PREPARE_PRESET', 'veryfast')
     ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'flv', 'wmv'}
+    LIBRARY_PAGE_SIZE = int(os.getenv('LIBRARY_PAGE_SIZE', 50))
     MAX_STREAM_DURATION_HOURS = int(os.getenv('MAX_STREAM_DURATION_HOURS', 24))
+    STREAM_SUPERVISOR_SOCKET = os.getenv('STREAM_SUPERVISOR_SOCKET', '')
+    STREAM_SUPERVISOR_AUTHKEY = os.getenv('STREAM_SUPERVISOR_AUTHKEY', '')
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+    STREAM_START_WORKERS = int(os.getenv('STREAM_START_WORKERS', 4))
+    STREAM_START_TIMEOUT = float(os.getenv('STREAM_START_TIMEOUT', 30))
+    MAX_CONCURRENT_STREAMS = int(os.getenv('MAX_CONCURRENT_STREAMS', os.cpu_count() or 4))
+    BROADCAST_QUEUE_SIZE = int(os.getenv('BROADCAST_QUEUE_SIZE', 64))
+    SCHEDULE_PREWARM_SECONDS = float(os.getenv('SCHEDULE_PREWARM_SECONDS', 900))
+    SCHEDULE_STAGGER_SECONDS = float(os.getenv('SCHEDULE_STAGGER_SECONDS', 5))
+    SCHEDULE_POLL_INTERVAL = float(os.getenv('SCHEDULE_POLL_INTERVAL', 5))
+    REAPER_INTERVAL = float(os.getenv('REAPER_INTERVAL', 30))
+    INACTIVE_INSTANCE_TTL_HOURS = float(os.getenv('INACTIVE_INSTANCE_TTL_HOURS', 24))
+    JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', 3600))
+    COOKIE_VALIDATION_TTL = float(os.getenv('COOKIE_VALIDATION_TTL', 60))
+    COOKIE_VALIDATION_NEGATIVE_TTL = float(os.getenv('COOKIE_VALIDATION_NEGATIVE_TTL', 10))
+    SESSION_IDLE_TTL = float(os.getenv('SESSION_IDLE_TTL', 1800))
+    SESSION_HEALTH_INTERVAL = float(os.getenv('SESSION_HEALTH_INTERVAL', 300))
+    STREAM_INFO_CACHE_TTL = float(os.getenv('STREAM_INFO_CACHE_TTL', 2))
+    STREAM_COMMENT_BUFFER_SIZE = int(os.getenv('STREAM_COMMENT_BUFFER_SIZE', 500))
+    STREAM_EVENTS_INTERVAL = float(os.getenv('STREAM_EVENTS_INTERVAL', 2))
+    STREAM_EVENTS_KEEPALIVE = float(os.getenv('STREAM_EVENTS_KEEPALIVE', 15))
+    TELEMETRY_INTERVAL = float(os.getenv('TELEMETRY_INTERVAL', 5))
+    TELEMETRY_SAMPLES = int(os.getenv('TELEMETRY_SAMPLES', 720))
+    TELEMETRY_STALL_SECONDS = float(os.getenv('TELEMETRY_STALL_SECONDS', 15))
+    STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory')
+    STATE_DB_PATH = os.getenv('STATE_DB_PATH', os.path.join(DATA_FOLDER, 'state.db'))
     PERMANENT_SESSION_LIFETIME = timedelta(days=12)
     
     @staticmethod
     def init_app(app):
-        for path in [Config.UPLOAD_FOLDER, Config.LOG_FOLDER]:
+        for path in [Config.UPLOAD_FOLDER, Config.LOG_FOLDER, Config.DATA_FOLDER]:
             os.makedirs(path, exist_ok=True)
\ No newline at end of file
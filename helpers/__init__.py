@@ -1,5 +1,16 @@
 """Helper modules for validation and utilities."""
 
-from .validators import validate_duration, validate_file, validate_cookies_format
+from .validators import validate_duration, validate_file, validate_cookies_format, validate_media
+from .cache import TTLCache
+from .state import StateBackend, get_state_backend
+from .library import VideoLibrary
+from .media import MediaProbe, probe_media
+from .metrics import MetricsRegistry, metrics, timed_upstream, upstream_call
+from .process import process_alive, process_token
 
-__all__ = ['validate_duration', 'validate_file', 'validate_cookies_format']
+__all__ = [
+    'validate_duration', 'validate_file', 'validate_cookies_format', 'validate_media',
+    'TTLCache', 'StateBackend', 'get_state_backend', 'VideoLibrary',
+    'MediaProbe', 'probe_media', 'MetricsRegistry', 'metrics', 'timed_upstream', 'upstream_call',
+    'process_alive', 'process_token'
+]
@@ -0,0 +1,257 @@
+"""Metadata index of the video upload library."""
+
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from werkzeug.utils import secure_filename
+import fcntl
+import json
+import os
+import threading
+
+from config import Config
+from .validators import validate_file
+
+
+class VideoLibrary:
+    """
+    Index of the videos in the upload folder.
+
+    Entries are kept in memory and persisted as a JSON snapshot next to the
+    state database, so listing the library costs two ``stat`` calls instead
+    of several per file. The index is reconciled against the folder only
+    when the folder's mtime moves (a file was added or removed behind our
+    back) or another process rewrote the snapshot. Every change bumps
+    ``generation``, which callers can use as a cheap version tag.
+    """
+
+    # Public sort names mapped to entry fields; prefix with '-' to reverse
+    SORT_FIELDS = {'date': 'created_at', 'name': 'filename', 'size': 'size_bytes'}
+    DEFAULT_SORT = '-date'
+
+    _entries: Dict[str, Dict[str, Any]] = {}
+    _generation = 0
+    _dir_mtime: Optional[int] = None
+    _snapshot_stat: Optional[Tuple[int, int, int]] = None
+    _orders: Dict[str, List[Dict[str, Any]]] = {}
+    _lock = threading.RLock()
+
+    @classmethod
+    def page(cls, offset: int = 0, limit: Optional[int] = None,
+             sort: str = DEFAULT_SORT, query: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Return one page of the library.
+
+        Args:
+            offset: Number of entries to skip
+            limit: Maximum entries to return, None for all
+            sort: One of SORT_FIELDS, optionally prefixed with '-' for descending
+            query: Case-insensitive substring the filename must contain
+
+        Returns:
+            Dict with the page's entries, the matching total and the generation
+
+        Raises:
+            ValueError: If sort is not a known sort key
+        """
+        with cls._lock:
+            cls.refresh()
+            entries = cls._ordered(sort)
+            if query:
+                needle = query.casefold()
+                entries = [e for e in entries if needle in e['filename'].casefold()]
+            end = None if limit is None else offset + limit
+            return {
+                'items': [dict(e) for e in entries[offset:end]],
+                'total': len(entries),
+                'generation': cls._generation
+            }
+
+    @classmethod
+    def generation(cls) -> int:
+        """Current generation of the index, after reconciling."""
+        with cls._lock:
+            cls.refresh()
+            return cls._generation
+
+    @classmethod
+    def get(cls, filename: str) -> Optional[Dict[str, Any]]:
+        """Index entry of one file, or None."""
+        with cls._lock:
+            cls.refresh()
+            entry = cls._entries.get(filename)
+            return dict(entry) if entry else None
+
+    @classmethod
+    def add(cls, filename: str, **metadata: Any) -> None:
+        """Index a file that was just written to the upload folder."""
+        with cls._lock, cls._exclusive():
+            cls._load_if_changed()
+            cls._rescan()
+            entry = cls._stat_entry(filename)
+            if entry:
+                entry.update(metadata)
+                cls._entries[filename] = entry
+                cls._changed()
+            cls._save()
+
+    @classmethod
+    def annotate(cls, filename: str, **metadata: Any) -> bool:
+        """Merge metadata into an indexed file's entry; False if it is not indexed."""
+        with cls._lock, cls._exclusive():
+            cls._load_if_changed()
+            cls._rescan()
+            entry = cls._entries.get(filename)
+            if entry is None:
+                return False
+            entry.update(metadata)
+            cls._changed()
+            cls._save()
+            return True
+
+    @classmethod
+    def remove(cls, filename: str) -> None:
+        """Drop a file that was just deleted from the upload folder."""
+        with cls._lock, cls._exclusive():
+            cls._load_if_changed()
+            cls._rescan()
+            if cls._entries.pop(filename, None) is not None:
+                cls._changed()
+            cls._save()
+
+    @classmethod
+    def refresh(cls) -> None:
+        """Reconcile the index if the folder or the snapshot changed."""
+        with cls._lock:
+            cls._load_if_changed()
+            if cls._folder_mtime() == cls._dir_mtime:
+                return
+            with cls._exclusive():
+                cls._load_if_changed()
+                if cls._rescan():
+                    cls._save()
+
+    @staticmethod
+    def _snapshot_path() -> str:
+        return os.path.join(Config.DATA_FOLDER, 'library.json')
+
+    @staticmethod
+    def _folder_mtime() -> Optional[int]:
+        try:
+            return os.stat(Config.UPLOAD_FOLDER).st_mtime_ns
+        except OSError:
+            return None
+
+    @staticmethod
+    @contextmanager
+    def _exclusive() -> Iterator[None]:
+        """Serialize index writers across worker processes."""
+        os.makedirs(Config.DATA_FOLDER, exist_ok=True)
+        with open(VideoLibrary._snapshot_path() + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _stat_entry(filename: str, st: Optional[os.stat_result] = None) -> Optional[Dict[str, Any]]:
+        try:
+            st = st or os.stat(os.path.join(Config.UPLOAD_FOLDER, filename))
+        except OSError:
+            return None
+        return {
+            'filename': filename,
+            'size_bytes': st.st_size,
+            'created_at': st.st_ctime,
+            'secure_filename': secure_filename(filename)
+        }
+
+    @classmethod
+    def _rescan(cls) -> bool:
+        """Diff the folder listing against the index; stat only new files."""
+        # Take the mtime before listing so changes made meanwhile trigger another pass
+        dir_mtime = cls._folder_mtime()
+        if dir_mtime == cls._dir_mtime:
+            return False
+
+        found = {}
+        try:
+            with os.scandir(Config.UPLOAD_FOLDER) as it:
+                for entry in it:
+                    if validate_file(entry.name) and entry.is_file():
+                        found[entry.name] = entry
+        except OSError:
+            found = {}
+
+        changed = False
+        for filename in set(cls._entries) - set(found):
+            del cls._entries[filename]
+            changed = True
+        for filename in set(found) - set(cls._entries):
+            try:
+                st = found[filename].stat()
+            except OSError:
+                continue
+            cls._entries[filename] = cls._stat_entry(filename, st)
+            changed = True
+
+        cls._dir_mtime = dir_mtime
+        if changed:
+            cls._changed()
+        return True
+
+    @classmethod
+    def _changed(cls) -> None:
+        cls._generation += 1
+        cls._orders = {}
+
+    @classmethod
+    def _ordered(cls, sort: str) -> List[Dict[str, Any]]:
+        order = cls._orders.get(sort)
+        if order is None:
+            field = cls.SORT_FIELDS.get(sort.lstrip('-'))
+            if field is None:
+                raise ValueError(f'Unknown sort key: {sort}')
+            key = (lambda e: e[field].casefold()) if field == 'filename' else (lambda e: e[field])
+            order = sorted(cls._entries.values(), key=key, reverse=sort.startswith('-'))
+            cls._orders[sort] = order
+        return order
+
+    @classmethod
+    def _load_if_changed(cls) -> None:
+        path = cls._snapshot_path()
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if signature == cls._snapshot_stat:
+            return
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            # Unreadable snapshot: force a full rescan
+            cls._dir_mtime = None
+            return
+
+        cls._entries = {e['filename']: e for e in snapshot.get('entries', [])}
+        cls._generation = max(cls._generation, snapshot.get('generation', 0))
+        cls._dir_mtime = snapshot.get('dir_mtime')
+        cls._snapshot_stat = signature
+        cls._orders = {}
+
+    @classmethod
+    def _save(cls) -> None:
+        path = cls._snapshot_path()
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'generation': cls._generation,
+                'dir_mtime': cls._dir_mtime,
+                'entries': list(cls._entries.values())
+            }, f)
+        os.replace(tmp_path, path)
+        st = os.stat(path)
+        cls._snapshot_stat = (st.st_ino, st.st_mtime_ns, st.st_size)
@@ -0,0 +1,217 @@
+"""Media metadata extraction with ffprobe."""
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+import json
+import multiprocessing
+import os
+import subprocess
+import threading
+
+from config import Config
+from .library import VideoLibrary
+
+# Seconds from the start of a video scanned for keyframes
+KEYFRAME_WINDOW = 30
+
+
+def probe_media(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Read container, video and audio properties of a file with ffprobe.
+
+    Args:
+        path: Media file
+
+    Returns:
+        Dict of media properties (``video_codec`` is None if the file has no
+        video stream, ``keyframe_interval`` None if it could not be
+        measured), or None if ffprobe could not run or read the file
+    """
+    command = [
+        'ffprobe', '-v', 'error',
+        '-print_format', 'json',
+        '-show_format', '-show_streams',
+        path
+    ]
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=Config.PROBE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if completed.returncode != 0:
+        return None
+
+    try:
+        data = json.loads(completed.stdout or '{}')
+    except ValueError:
+        data = {}
+    streams = data.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), {})
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), {})
+    fmt = data.get('format', {})
+    duration = _number(fmt.get('duration'), float)
+    return {
+        'format': fmt.get('format_name'),
+        'duration': duration,
+        'bit_rate': _number(fmt.get('bit_rate'), int),
+        'video_codec': video.get('codec_name'),
+        'profile': video.get('profile'),
+        'level': video.get('level'),
+        'pix_fmt': video.get('pix_fmt'),
+        'width': video.get('width'),
+        'height': video.get('height'),
+        'fps': _frame_rate(video.get('avg_frame_rate')),
+        'video_bit_rate': _number(video.get('bit_rate'), int),
+        'keyframe_interval': _keyframe_interval(path, duration) if video else None,
+        'audio_codec': audio.get('codec_name'),
+        'sample_rate': _number(audio.get('sample_rate'), int),
+        'channels': audio.get('channels')
+    }
+
+
+class MediaProbe:
+    """
+    Probe library videos once and keep the result on their index entry.
+
+    ffprobe runs in a process pool, so parsing large containers never
+    competes with request threads for the GIL. The result is stored as
+    ``media`` on the VideoLibrary entry and survives restarts with the
+    index snapshot. Concurrent requests for the same file share one probe.
+    A file ffprobe failed on is not probed again until its size or
+    modification time changes.
+    """
+
+    _executor: Optional[ProcessPoolExecutor] = None
+    _pending: Dict[str, Future] = {}
+    # Filename -> (size, mtime) of the file when its probe failed
+    _failed: Dict[str, Tuple[int, float]] = {}
+    _lock = threading.RLock()
+
+    @classmethod
+    def get(cls, filename: str, wait: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Media properties of a library video.
+
+        Args:
+            filename: Video in the upload folder
+            wait: Block until a missing probe finishes
+
+        Returns:
+            Dict like :func:`probe_media`, or None if unknown
+        """
+        entry = VideoLibrary.get(filename)
+        if entry and entry.get('media'):
+            return entry['media']
+
+        future = cls.submit(filename)
+        if future is None or not wait:
+            return None
+        try:
+            return future.result(timeout=Config.PROBE_TIMEOUT * 2)
+        except Exception:
+            return None
+
+    @classmethod
+    def submit(cls, filename: str) -> Optional[Future]:
+        """Queue a probe of a library video unless one is already running or ffprobe failed on it."""
+        path = os.path.join(Config.UPLOAD_FOLDER, filename)
+        signature = _signature(path)
+        with cls._lock:
+            if signature is not None and cls._failed.get(filename) == signature:
+                return None
+            cls._failed.pop(filename, None)
+            future = cls._pending.get(filename)
+            if future is None:
+                if cls._executor is None:
+                    # forkserver: forking a threaded server process is unsafe
+                    cls._executor = ProcessPoolExecutor(
+                        max_workers=Config.PROBE_WORKERS,
+                        mp_context=multiprocessing.get_context('forkserver')
+                    )
+                future = cls._executor.submit(probe_media, path)
+                cls._pending[filename] = future
+                future.add_done_callback(lambda f: cls._store(filename, f, signature))
+            return future
+
+    @classmethod
+    def _store(cls, filename: str, future: Future, signature: Optional[Tuple[int, float]]) -> None:
+        try:
+            media = future.result()
+        except Exception:
+            media = None
+        try:
+            if media is None:
+                # Retrying the same file on every listing would only spawn processes
+                if signature is not None:
+                    with cls._lock:
+                        cls._failed[filename] = signature
+            else:
+                VideoLibrary.annotate(filename, media=media)
+        finally:
+            with cls._lock:
+                cls._pending.pop(filename, None)
+
+
+def _signature(path: str) -> Optional[Tuple[int, float]]:
+    """Size and modification time of a file, or None if it is missing."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+def _keyframe_interval(path: str, duration: Optional[float]) -> Optional[float]:
+    """
+    Longest gap between keyframes in the first KEYFRAME_WINDOW seconds of a video.
+
+    Args:
+        path: Media file
+        duration: Length of the file, to count the gap after the last keyframe
+
+    Returns:
+        Seconds, or None if ffprobe could not read the keyframes
+    """
+    command = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-skip_frame', 'nokey',
+        '-read_intervals', f'%+{KEYFRAME_WINDOW}',
+        '-show_entries', 'frame=best_effort_timestamp_time',
+        '-print_format', 'json',
+        path
+    ]
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=Config.PROBE_TIMEOUT)
+        frames = json.loads(completed.stdout or '{}').get('frames', [])
+    except (OSError, subprocess.TimeoutExpired, ValueError):
+        return None
+    if completed.returncode != 0:
+        return None
+
+    times = sorted(
+        t for t in (_number(f.get('best_effort_timestamp_time'), float) for f in frames) if t is not None
+    )
+    if not times:
+        return None
+    # A keyframe-less tail within the window is a gap too
+    end = times[0] + min(duration or 0, KEYFRAME_WINDOW)
+    marks = times + [end] if end > times[-1] else times
+    return round(max((b - a for a, b in zip(marks, marks[1:])), default=0.0), 3)
+
+
+def _number(value: Any, kind: type) -> Optional[Any]:
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _frame_rate(value: Optional[str]) -> Optional[float]:
+    """Parse ffprobe's ``num/den`` frame rate."""
+    if not value or '/' not in value:
+        return None
+    num, den = value.split('/', 1)
+    try:
+        return round(int(num) / int(den), 3) if int(den) else None
+    except ValueError:
+        return None
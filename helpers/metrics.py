@@ -0,0 +1,262 @@
+"""In-process metrics exported in the Prometheus text format."""
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import contextlib
+import functools
+import math
+import threading
+import time
+
+
+class _Metric:
+    """Base of named metrics with a fixed set of label names."""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._function: Optional[Callable[[], Any]] = None
+
+    def set_function(self, function: Callable[[], Any]) -> None:
+        """
+        Compute the value when scraped instead of storing it.
+
+        Args:
+            function: Returns a number, or a dict of label value tuples to
+                numbers for a labelled metric
+        """
+        self._function = function
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} takes labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _values(self) -> Dict[Tuple[str, ...], Any]:
+        if self._function is None:
+            with self._lock:
+                return dict(self._data)
+        value = self._function()
+        return value if isinstance(value, dict) else {(): value}
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {_escape_help(self.documentation)}'
+        yield f'# TYPE {self.name} {self.kind}'
+        for key, value in sorted(self._values().items()):
+            yield f'{self.name}{_labels(self.labelnames, key)} {_number(value)}'
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. requests or bytes."""
+
+    kind = 'counter'
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._data: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._data[key] = self._data.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. requests in flight."""
+
+    kind = 'gauge'
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._data: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._data[key] = value
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._data[key] = self._data.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observations in fixed buckets.
+
+    Percentiles are computed by the scraper from the bucket counts, e.g.
+    ``histogram_quantile(0.95, rate(<name>_bucket[5m]))``.
+    """
+
+    kind = 'histogram'
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: count per bucket (last one is +Inf), sum
+        self._data: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            counts, total = self._data.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {_escape_help(self.documentation)}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            data = {key: (list(counts), total[0]) for key, (counts, total) in self._data.items()}
+        names = self.labelnames + ('le',)
+        for key, (counts, total) in sorted(data.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f'{self.name}_bucket{_labels(names, key + (_number(bound),))} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.labelnames, key)} {cumulative}'
+
+
+class MetricsRegistry:
+    """
+    Named metrics of this process.
+
+    Each worker process has its own registry, so a scraper should collect
+    every worker (or run a single one). Asking for an existing name returns
+    the registered metric, so modules can declare the metrics they use.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = Histogram.DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                # A failing callback must not take the whole scrape down
+                continue
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, kind: type, name: str, documentation: str,
+                  labelnames: Sequence[str], **kwargs: Any) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = kind(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, kind) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f'Metric {name} is already registered differently')
+            return metric
+
+
+metrics = MetricsRegistry()
+
+UPSTREAM_SECONDS = metrics.histogram(
+    'instream_upstream_call_duration_seconds',
+    'Duration of calls to Instagram and remote hosts by service, operation and outcome.',
+    ('service', 'operation', 'outcome')
+)
+
+
+def timed_upstream(service: str, operation: str) -> Callable:
+    """
+    Record the duration of a call to an upstream service.
+
+    The outcome is ``error`` if the call raised, ``failed`` if it returned a
+    result dict with a false ``success`` or a falsy value, else ``ok``.
+
+    Args:
+        service: Service label, e.g. stream or video
+        operation: Operation label, e.g. start or info
+    """
+    def decorate(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = function(*args, **kwargs)
+                failed = not result.get('success', True) if isinstance(result, dict) else not result
+                outcome = 'failed' if failed else 'ok'
+                return result
+            finally:
+                UPSTREAM_SECONDS.observe(
+                    time.perf_counter() - started,
+                    service=service, operation=operation, outcome=outcome
+                )
+        return wrapper
+    return decorate
+
+
+@contextlib.contextmanager
+def upstream_call(service: str, operation: str) -> Iterator[None]:
+    """
+    Record the duration of a block calling an upstream service.
+
+    For calls whose result does not tell success from failure; the outcome
+    is ``error`` if the block raised, else ``ok``.
+
+    Args:
+        service: Service label, e.g. video
+        operation: Operation label, e.g. direct_download
+    """
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        UPSTREAM_SECONDS.observe(
+            time.perf_counter() - started,
+            service=service, operation=operation, outcome=outcome
+        )
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape_label(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _escape_help(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _number(value: Any) -> str:
+    value = float(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    return str(int(value)) if value.is_integer() and abs(value) < 1e15 else repr(value)
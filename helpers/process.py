@@ -0,0 +1,67 @@
+"""Identity of processes on this host, to tell live owners from stale ones."""
+
+from typing import Optional
+import os
+
+_boot_id: Optional[str] = None
+
+
+def boot_id() -> str:
+    """Id of the current host boot, or '' where the kernel does not expose one."""
+    global _boot_id
+    if _boot_id is None:
+        try:
+            with open('/proc/sys/kernel/random/boot_id', 'r') as f:
+                _boot_id = f.read().strip()
+        except OSError:
+            _boot_id = ''
+    return _boot_id
+
+
+def process_token(pid: Optional[int] = None) -> Optional[str]:
+    """
+    Token naming one run of a process: host boot, pid and start time.
+
+    A pid can be reused after its process exits and a host reboot resets
+    pids altogether; the token changes in both cases.
+
+    Args:
+        pid: Process id, this process if omitted
+
+    Returns:
+        The token, or None if the process is gone or ``/proc`` is unavailable
+    """
+    pid = os.getpid() if pid is None else pid
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            # The command name may contain spaces; fields follow its closing paren
+            fields = f.read().rsplit(b')', 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    # starttime is field 22 of stat, index 19 after the name
+    return f'{boot_id()}:{pid}:{fields[19].decode()}'
+
+
+def process_alive(pid: Optional[int], token: Optional[str] = None) -> bool:
+    """
+    Whether a process of this host is still running.
+
+    Args:
+        pid: Process id
+        token: process_token recorded for it, to rule out a reused pid or
+            a pid from before a reboot
+
+    Returns:
+        True if the process (that run of it, with a token) is running
+    """
+    if not pid:
+        return False
+    if token and process_token() is not None:
+        return process_token(pid) == token
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
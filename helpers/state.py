@@ -0,0 +1,227 @@
+"""Shared state backends for data that must be visible to every worker."""
+
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import Config
+
+
+class StateBackend(ABC):
+    """
+    Namespaced key/value store of JSON-serializable dicts.
+
+    Implementations must make :meth:`delete`, :meth:`update` and
+    :meth:`modify` atomic, so callers can use them to claim or transition a
+    record exactly once.
+    """
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[Dict[str, Any]]:
+        """Return the value stored under key, or None."""
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        """Store value under key, optionally expiring after ttl seconds."""
+
+    @abstractmethod
+    def update(self, namespace: str, key: str, **fields: Any) -> Optional[Dict[str, Any]]:
+        """Merge fields into an existing value; returns the new value or None."""
+
+    @abstractmethod
+    def modify(self, namespace: str, key: str,
+               fn: Callable[[Dict[str, Any]], Dict[str, Any]],
+               default: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Replace an existing value with fn(value), keeping its expiry; returns the new value or None.
+
+        With a default, a missing key is created as fn(default) instead.
+        """
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> bool:
+        """Remove key; returns True only for the caller that removed it."""
+
+    @abstractmethod
+    def items(self, namespace: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """All live (key, value) pairs of a namespace."""
+
+
+class MemoryStateBackend(StateBackend):
+    """Process-local backend; fine for a single worker process."""
+
+    def __init__(self):
+        self._data: Dict[str, Dict[str, Tuple[Optional[float], Dict[str, Any]]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._live_entry(namespace, key)
+            return dict(entry[1]) if entry else None
+
+    def set(self, namespace, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data.setdefault(namespace, {})[key] = (expires_at, dict(value))
+
+    def update(self, namespace, key, **fields):
+        return self.modify(namespace, key, lambda value: {**value, **fields})
+
+    def modify(self, namespace, key, fn, default=None):
+        with self._lock:
+            entry = self._live_entry(namespace, key)
+            if not entry:
+                if default is None:
+                    return None
+                entry = (None, default)
+            value = dict(fn(dict(entry[1])))
+            self._data.setdefault(namespace, {})[key] = (entry[0], value)
+            return dict(value)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            existed = self._live_entry(namespace, key) is not None
+            self._data.get(namespace, {}).pop(key, None)
+            return existed
+
+    def items(self, namespace):
+        now = time.time()
+        with self._lock:
+            entries = self._data.get(namespace, {})
+            expired = [k for k, (exp, _) in entries.items() if exp is not None and exp <= now]
+            for k in expired:
+                del entries[k]
+            return [(k, dict(v)) for k, (_, v) in entries.items()]
+
+    def _live_entry(self, namespace, key):
+        entry = self._data.get(namespace, {}).get(key)
+        if entry and entry[0] is not None and entry[0] <= time.time():
+            del self._data[namespace][key]
+            return None
+        return entry
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    SQLite backend in WAL mode, shared by every process on the host.
+
+    Each thread keeps its own connection; writers serialize on SQLite's
+    database lock while readers proceed concurrently thanks to WAL.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS state ('
+            ' namespace TEXT NOT NULL,'
+            ' key TEXT NOT NULL,'
+            ' value TEXT NOT NULL,'
+            ' expires_at REAL,'
+            ' PRIMARY KEY (namespace, key))'
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace, key):
+        row = self._conn().execute(
+            'SELECT value FROM state WHERE namespace = ? AND key = ?'
+            ' AND (expires_at IS NULL OR expires_at > ?)',
+            (namespace, key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        self._conn().execute(
+            'INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)',
+            (namespace, key, json.dumps(value), expires_at)
+        )
+
+    def update(self, namespace, key, **fields):
+        return self.modify(namespace, key, lambda value: {**value, **fields})
+
+    def modify(self, namespace, key, fn, default=None):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT value FROM state WHERE namespace = ? AND key = ?'
+                ' AND (expires_at IS NULL OR expires_at > ?)',
+                (namespace, key, time.time())
+            ).fetchone()
+            if not row:
+                if default is None:
+                    conn.execute('COMMIT')
+                    return None
+                value = fn(dict(default))
+                conn.execute(
+                    'INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, NULL)',
+                    (namespace, key, json.dumps(value))
+                )
+                conn.execute('COMMIT')
+                return value
+            value = fn(json.loads(row[0]))
+            conn.execute(
+                'UPDATE state SET value = ? WHERE namespace = ? AND key = ?',
+                (json.dumps(value), namespace, key)
+            )
+            conn.execute('COMMIT')
+            return value
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def delete(self, namespace, key):
+        cursor = self._conn().execute(
+            'DELETE FROM state WHERE namespace = ? AND key = ?'
+            ' AND (expires_at IS NULL OR expires_at > ?)',
+            (namespace, key, time.time())
+        )
+        return cursor.rowcount > 0
+
+    def items(self, namespace):
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            'DELETE FROM state WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?',
+            (namespace, now)
+        )
+        rows = conn.execute(
+            'SELECT key, value FROM state WHERE namespace = ?', (namespace,)
+        ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+
+_backend: Optional[StateBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_state_backend() -> StateBackend:
+    """Return the process-wide backend selected by Config.STATE_BACKEND."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if Config.STATE_BACKEND == 'sqlite':
+                    _backend = SQLiteStateBackend(Config.STATE_DB_PATH)
+                elif Config.STATE_BACKEND == 'memory':
+                    _backend = MemoryStateBackend()
+                else:
+                    raise ValueError(f'Unknown state backend: {Config.STATE_BACKEND}')
+    return _backend
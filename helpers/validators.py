@@ -1,6 +1,6 @@
 """Validation helper functions."""
 
-from typing import Tuple, Optional
+from typing import Any, Dict, Tuple, Optional
 from config import Config
 
 
@@ -29,6 +29,31 @@ def validate_duration(hours: int, minutes: int, seconds: int) -> Tuple[bool, Opt
     return True, None
 
 
+def validate_media(media: Optional[Dict[str, Any]]) -> Tuple[bool, Optional[str]]:
+    """
+    Check that a probed video can be streamed at all.
+    
+    Durations longer than the clip are fine, the stream loops it.
+    
+    Args:
+        media: Media properties from ffprobe, None if they are unknown
+        
+    Returns:
+        Tuple of (is_valid, error_message)
+    """
+    if media is None:
+        # Not probed (ffprobe unavailable); let the stream start decide
+        return True, None
+    
+    if not media.get('video_codec'):
+        return False, "Video file has no readable video stream"
+    
+    if not media.get('duration') or media['duration'] < 1:
+        return False, "Video is too short to stream"
+    
+    return True, None
+
+
 def validate_file(filename: str) -> bool:
     """
     Check if file extension is allowed.
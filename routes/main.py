@@ -1,8 +1,15 @@
-from flask import Blueprint, render_template, jsonify, session
-from utils import get_video_files, LiveStreamManager
+from flask import Blueprint, Response, render_template, jsonify, session, request, current_app, abort, send_from_directory
+from config import Config
+from helpers import MediaProbe, VideoLibrary, metrics
+from utils import get_video_page, LiveStreamManager
+from services import StreamReaper, ThumbnailService
+import os
+import re
 
 main_bp = Blueprint('main', __name__)
 
+THUMBNAIL_NAME = re.compile(r'[0-9a-f]{64}(_sprite)?\.jpg')
+
 @main_bp.route('/')
 def index():
     return render_template('index.html')
@@ -10,14 +17,14 @@ def index():
 @main_bp.route('/dashboard')
 def dashboard():
     try:
-        videos = get_video_files()
+        page = get_video_page(limit=Config.LIBRARY_PAGE_SIZE)
         session_id = session.get('session_id')
         is_live = LiveStreamManager.is_active(session_id) if session_id else False
         
         context = {
-            'videos': videos,
+            'videos': page['items'],
             'is_live': is_live,
-            'total_videos': len(videos),
+            'total_videos': page['total'],
             'error': None
         }
         
@@ -36,15 +43,17 @@ def dashboard():
 def status():
     try:
         session_id = session.get('session_id')
-        is_live = LiveStreamManager.is_active(session_id) if session_id else False
-        broadcast_id = session.get('broadcast_id')
+        record = LiveStreamManager.get_metadata(session_id) if session_id else None
+        is_live = bool(record and record['active'])
+        broadcast_id = record.get('broadcast_id') if record else None
         
         return jsonify({
             'success': True,
             'is_live': is_live,
             'broadcast_id': broadcast_id,
             'session_active': session_id is not None,
-            'session_id': session_id
+            'session_id': session_id,
+            'start_job_id': session.get('start_job_id')
         })
     except Exception as e:
         return jsonify({
@@ -52,15 +61,65 @@ def status():
             'message': f"Failed to get status: {str(e)}"
         })
 
+@main_bp.route('/thumbnails/<name>')
+def thumbnail(name):
+    if not THUMBNAIL_NAME.fullmatch(name):
+        abort(404)
+    
+    # Named after the video's content digest, so the bytes behind a URL never change
+    response = send_from_directory(
+        os.path.abspath(os.path.join(Config.UPLOAD_FOLDER, ThumbnailService.THUMBS_DIR)), name
+    )
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def _library_etag(generation):
+    return f'library-{generation}'
+
 @main_bp.route('/videos')
 def list_videos():
     try:
-        videos = get_video_files()
-        return jsonify({
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', type=int)
+        if offset < 0 or (limit is not None and limit < 0):
+            return jsonify({'success': False, 'message': 'Invalid offset or limit'})
+        
+        # Every page of a given query only changes when the library does,
+        # so revalidation never needs to touch the index entries
+        etag = _library_etag(VideoLibrary.generation())
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        
+        try:
+            page = get_video_page(
+                offset=offset,
+                limit=limit,
+                sort=request.args.get('sort', '-date'),
+                query=request.args.get('q', '').strip() or None
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)})
+        
+        # Videos indexed before they were probed get probed in the background
+        for video in page['items']:
+            if 'media' not in video:
+                MediaProbe.submit(video['filename'])
+            if 'thumbnail' not in video:
+                ThumbnailService.schedule(video['filename'])
+        
+        response = jsonify({
             'success': True,
-            'videos': videos,
-            'total': len(videos)
+            'videos': page['items'],
+            'total': page['total'],
+            'offset': offset,
+            'limit': limit
         })
+        response.set_etag(_library_etag(page['generation']))
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         return jsonify({
             'success': False, 
@@ -93,7 +152,8 @@ def health_check():
                 'disk_usage': f'{disk_usage:.1f}%' if disk_usage > 0 else 'unknown',
                 'session_active': 'session_id' in session,
                 'cookies_configured': 'ig_cookies' in session
-            }
+            },
+            'reaper': StreamReaper.metrics()
         }
         
         if not upload_folder_ok:
@@ -112,4 +172,9 @@ def health_check():
             'timestamp': datetime.utcnow().isoformat(),
             'error': str(e),
             'version': __version__
-        }), 500
\ No newline at end of file
+        }), 500
+
+@main_bp.route('/metrics')
+def metrics_endpoint():
+    """Metrics of this worker in the Prometheus text format."""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,17 +1,44 @@
 """Streaming routes - refactored with service layer."""
 
-from flask import Blueprint, request, jsonify, session, current_app
+from flask import Blueprint, Response, request, jsonify, session, current_app
 from werkzeug.utils import secure_filename
+import hmac
 import os
 
 from config import Config
 from utils import LiveStreamManager
-from services import StreamService, VideoService
-from helpers import validate_duration
+from services import (
+    StreamService, VideoService, StreamEventHub, UploadService,
+    BroadcastService, StreamAdmission, BroadcastScheduler, StreamReaper
+)
+from services.session_pool import SessionPool
+from helpers import MediaProbe, validate_duration, validate_media
 
 streaming_bp = Blueprint('streaming', __name__)
 
 
+def _caller_account():
+    """Account whose broadcasts and schedules the caller may manage.
+    
+    That is the Instagram user id of the session's cookies, or None (every
+    account) for a request carrying ``Authorization: Bearer <ADMIN_TOKEN>``.
+    A caller without either gets '', which owns nothing.
+    """
+    if Config.ADMIN_TOKEN:
+        header = request.headers.get('Authorization', '')
+        token = header[len('Bearer '):].strip() if header.startswith('Bearer ') else ''
+        if hmac.compare_digest(token.encode(), Config.ADMIN_TOKEN.encode()):
+            return None
+    cookies = session.get('ig_cookies')
+    return SessionPool.account_key(cookies) if cookies else ''
+
+
+def _owned(record):
+    """Whether the caller may see and manage a broadcast or schedule"""
+    account = _caller_account()
+    return record is not None and (account is None or record['account'] == account)
+
+
 @streaming_bp.route('/download', methods=['POST'])
 def download_video():
     """Download video from URL (supports Instagram)."""
@@ -21,15 +48,53 @@ def download_video():
             return jsonify({'success': False, 'message': 'URL is required'})
         
         cookies = session.get('ig_cookies')
-        result = VideoService.download_video(url, cookies)
         
-        return jsonify(result)
+        # Download in the background; the client polls /api/download/<job_id>
+        job_id = VideoService.queue_download(url, cookies)
+        
+        return jsonify({
+            'success': True,
+            'message': 'Download queued',
+            'job_id': job_id,
+            'status': 'queued'
+        })
         
     except Exception as e:
         current_app.logger.error(f"Download endpoint error: {str(e)}", exc_info=True)
         return jsonify({'success': False, 'message': f'Download process failed: {str(e)}'})
 
 
+@streaming_bp.route('/download/<job_id>', methods=['GET'])
+def download_status(job_id):
+    """Get progress of a background download."""
+    try:
+        job = VideoService.download_jobs.get(job_id)
+        if not job:
+            return jsonify({'success': False, 'message': 'Download job not found'})
+        
+        response = {
+            'success': job['status'] not in ('failed', 'cancelled'),
+            'job_id': job_id,
+            'status': job['status'],
+            'message': job['message'],
+            'progress': job.get('progress')
+        }
+        if job['status'] == 'done' and job['result']:
+            response.update(job['result'])
+        
+        return jsonify(response)
+        
+    except Exception as e:
+        current_app.logger.error(f"Download status endpoint error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to get download status: {str(e)}'})
+
+
+@streaming_bp.route('/download/<job_id>', methods=['DELETE'])
+def cancel_download(job_id):
+    """Cancel a queued or running download."""
+    return jsonify(VideoService.cancel_download(job_id))
+
+
 @streaming_bp.route('/upload', methods=['POST'])
 def upload_video():
     """Upload video file."""
@@ -47,6 +112,64 @@ def upload_video():
         return jsonify({'success': False, 'message': f'Upload failed: {str(e)}'})
 
 
+@streaming_bp.route('/upload/init', methods=['POST'])
+def init_upload():
+    """Start a resumable chunked upload."""
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            size = int(data.get('size', 0))
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'Invalid file size'})
+        
+        result = UploadService.init_upload(data.get('filename', ''), size)
+        return jsonify(result)
+        
+    except Exception as e:
+        current_app.logger.error(f"Upload init endpoint error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to start upload: {str(e)}'})
+
+
+@streaming_bp.route('/upload/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Write one chunk of a chunked upload at ?offset=."""
+    try:
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            return jsonify({'success': False, 'message': 'Chunk offset is required'})
+        
+        result = UploadService.write_chunk(upload_id, offset, request.stream, request.content_length)
+        return jsonify(result)
+        
+    except Exception as e:
+        current_app.logger.error(f"Upload chunk endpoint error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to write chunk: {str(e)}'})
+
+
+@streaming_bp.route('/upload/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """Get received ranges of a chunked upload."""
+    return jsonify(UploadService.get_upload(upload_id))
+
+
+@streaming_bp.route('/upload/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    """Complete a chunked upload."""
+    try:
+        result = UploadService.finalize_upload(upload_id)
+        return jsonify(result)
+        
+    except Exception as e:
+        current_app.logger.error(f"Upload finalize endpoint error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to finalize upload: {str(e)}'})
+
+
+@streaming_bp.route('/upload/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    """Cancel a chunked upload."""
+    return jsonify(UploadService.abort_upload(upload_id))
+
+
 @streaming_bp.route('/start', methods=['POST'])
 def start_stream():
     """Start Instagram live stream."""
@@ -78,40 +201,86 @@ def start_stream():
         if not os.path.exists(filepath):
             return jsonify({'success': False, 'message': 'Video file not found'})
         
+        # Reject unstreamable files here instead of after a broadcast was created
+        media_valid, media_error = validate_media(MediaProbe.get(secure_filename(filename)))
+        if not media_valid:
+            return jsonify({'success': False, 'message': media_error})
+        
         # Check for active stream
         session_id = session.get('session_id')
         if session_id and LiveStreamManager.is_active(session_id):
             return jsonify({'success': False, 'message': 'A live stream is already active'})
         
-        # Start stream
-        result = StreamService.start_stream(cookies, filepath, title, hours, minutes, seconds)
+        pending_job = StreamService.start_jobs.get(session.get('start_job_id', ''))
+        if pending_job and not pending_job['done']:
+            return jsonify({'success': False, 'message': 'A live stream is already starting'})
         
-        if result['success']:
-            # Save session info
-            session_id = result['session_id']
-            session['session_id'] = session_id
-            session['broadcast_id'] = result['broadcast_id']
-            session['stream_title'] = title
-            session['start_time'] = result['start_time']
-            session.permanent = True
+        # Start stream in the background; the client polls /api/start/<job_id>
+        job_id = StreamService.queue_start(cookies, filepath, title, hours, minutes, seconds)
+        session['start_job_id'] = job_id
+        session.permanent = True
+        
+        return jsonify({
+            'success': True,
+            'message': 'Live stream is starting',
+            'job_id': job_id,
+            'status': 'queued'
+        })
             
-            # Store live instance
-            LiveStreamManager.create_instance(session_id, result['live_instance'])
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid input values: {str(e)}'})
+    except Exception as e:
+        current_app.logger.error(f"Start stream endpoint error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to start stream: {str(e)}'})
+
+
+@streaming_bp.route('/start/<job_id>')
+def start_stream_status(job_id):
+    """Get progress of a background stream start."""
+    try:
+        job = StreamService.start_jobs.get(job_id)
+        
+        if not job or session.get('start_job_id') != job_id:
+            if session.get('start_job_id') == job_id:
+                session.pop('start_job_id', None)
+            return jsonify({'success': False, 'message': 'Start job not found'})
+        
+        if job['status'] == 'failed':
+            session.pop('start_job_id', None)
+            return jsonify({
+                'success': False,
+                'job_id': job_id,
+                'status': 'failed',
+                'message': f"Failed to start stream: {job['message']}"
+            })
+        
+        if job['status'] == 'live' and job['result']:
+            # Adopt the started stream into this browser session; the
+            # stream's details live in the shared stream record
+            result = job['result']
+            session.pop('start_job_id', None)
+            session['session_id'] = result['session_id']
+            session.permanent = True
             
             return jsonify({
                 'success': True,
+                'job_id': job_id,
+                'status': 'live',
                 'message': 'Live stream started successfully',
                 'broadcast_id': result['broadcast_id'],
-                'session_id': session_id
+                'session_id': result['session_id']
             })
-        else:
-            return jsonify(result)
-            
-    except ValueError as e:
-        return jsonify({'success': False, 'message': f'Invalid input values: {str(e)}'})
+        
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': job['status'],
+            'message': 'Live stream is starting'
+        })
+        
     except Exception as e:
-        current_app.logger.error(f"Start stream endpoint error: {str(e)}")
-        return jsonify({'success': False, 'message': f'Failed to start stream: {str(e)}'})
+        current_app.logger.error(f"Start status endpoint error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to get start status: {str(e)}'})
 
 
 @streaming_bp.route('/stop', methods=['POST'])
@@ -123,19 +292,17 @@ def stop_stream():
         if not session_id:
             return jsonify({'success': False, 'message': 'No active session found'})
         
-        if not LiveStreamManager.is_active(session_id):
+        # Claiming is atomic, so concurrent stops cannot stop the stream twice
+        live_instance = LiveStreamManager.claim_instance(session_id)
+        if not live_instance:
             return jsonify({'success': False, 'message': 'No active live stream found'})
         
         # Stop stream
-        live_instance = LiveStreamManager.get_instance(session_id)
         result = StreamService.stop_stream(live_instance)
+        StreamReaper.cancel_stop(session_id)
         
         # Clean up session
-        LiveStreamManager.remove_instance(session_id)
         session.pop('session_id', None)
-        session.pop('broadcast_id', None)
-        session.pop('stream_title', None)
-        session.pop('start_time', None)
         
         return jsonify(result)
         
@@ -153,14 +320,19 @@ def stream_info():
         if not session_id or not LiveStreamManager.is_active(session_id):
             return jsonify({'success': False, 'message': 'No active live stream found'})
         
+        since = request.args.get('since', type=int)
+        if since is None and request.args.get('since'):
+            return jsonify({'success': False, 'message': 'Invalid comment cursor'})
+        
         live_instance = LiveStreamManager.get_instance(session_id)
-        result = StreamService.get_stream_info(live_instance)
+        result = StreamService.get_stream_info(live_instance, since=since)
         
         if result['success']:
             # Add session info
+            record = LiveStreamManager.get_metadata(session_id) or {}
             result['data']['session_info'] = {
-                'title': session.get('stream_title', 'N/A'),
-                'start_time': session.get('start_time', 0)
+                'title': record.get('title', 'N/A'),
+                'start_time': record.get('start_time', 0)
             }
         
         return jsonify(result)
@@ -170,6 +342,68 @@ def stream_info():
         return jsonify({'success': False, 'message': f'Failed to get stream information: {str(e)}'})
 
 
+@streaming_bp.route('/telemetry')
+def stream_telemetry():
+    """Get the ingest health time series of the session's live stream."""
+    try:
+        session_id = session.get('session_id')
+        
+        if not session_id or not LiveStreamManager.is_active(session_id):
+            return jsonify({'success': False, 'message': 'No active live stream found'})
+        
+        limit = request.args.get('limit', type=int)
+        health = StreamService.get_stream_health(LiveStreamManager.get_instance(session_id), limit=limit)
+        if health is None:
+            return jsonify({'success': False, 'message': 'No telemetry for this stream'})
+        
+        return jsonify({'success': True, 'data': health})
+        
+    except Exception as e:
+        current_app.logger.error(f"Stream telemetry endpoint error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to get stream telemetry: {str(e)}'})
+
+
+@streaming_bp.route('/telemetry/host')
+def host_telemetry():
+    """Get the ingest load of all streams run by this process."""
+    try:
+        return jsonify({'success': True, 'data': StreamService.get_host_health()})
+        
+    except Exception as e:
+        current_app.logger.error(f"Host telemetry endpoint error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to get host telemetry: {str(e)}'})
+
+
+@streaming_bp.route('/events')
+def stream_events():
+    """Push live stream stats and new comments as server-sent events."""
+    try:
+        session_id = session.get('session_id')
+        
+        if not session_id or not LiveStreamManager.is_active(session_id):
+            return jsonify({'success': False, 'message': 'No active live stream found'})
+        
+        record = LiveStreamManager.get_metadata(session_id) or {}
+        key = str(record.get('broadcast_id') or session_id)
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        subscription = StreamEventHub.subscribe(
+            current_app._get_current_object(), key, session_id, since=last_event_id
+        )
+        
+        return Response(
+            StreamEventHub.stream(subscription),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+        
+    except Exception as e:
+        current_app.logger.error(f"Stream events endpoint error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to open event stream: {str(e)}'})
+
+
 @streaming_bp.route('/comment', methods=['POST'])
 def stream_comment():
     """Post comment to live stream."""
@@ -193,6 +427,187 @@ def stream_comment():
         return jsonify({'success': False, 'message': f'Failed to post comment: {str(e)}'})
 
 
+@streaming_bp.route('/broadcasts', methods=['GET'])
+def list_broadcasts():
+    """List the caller's broadcasts and pipeline slot usage."""
+    try:
+        return jsonify({
+            'success': True,
+            'broadcasts': BroadcastService.list(account=_caller_account()),
+            'slots': StreamAdmission.usage()
+        })
+        
+    except Exception as e:
+        current_app.logger.error(f"List broadcasts endpoint error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to list broadcasts: {str(e)}'})
+
+
+@streaming_bp.route('/broadcasts', methods=['POST'])
+def create_broadcast():
+    """Queue a broadcast of a video or a playlist; cookies default to the session's."""
+    try:
+        data = request.get_json(silent=True) or request.form
+        cookies = (data.get('cookies') or session.get('ig_cookies') or '').strip()
+        if not cookies:
+            return jsonify({'success': False, 'message': 'Instagram session cookies required'})
+        
+        playlist = data.get('playlist')
+        if playlist is not None and not isinstance(playlist, list):
+            return jsonify({'success': False, 'message': 'Playlist must be a list'})
+        
+        result = BroadcastService.create(
+            cookies,
+            str(data.get('filename', '')).strip(),
+            str(data.get('title', Config.DEFAULT_LIVE_TITLE)).strip(),
+            int(data.get('hours', 0)),
+            int(data.get('minutes', 0)),
+            int(data.get('seconds', 0)),
+            playlist=playlist
+        )
+        return jsonify(result)
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid input values: {str(e)}'})
+    except Exception as e:
+        current_app.logger.error(f"Create broadcast endpoint error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to create broadcast: {str(e)}'})
+
+
+@streaming_bp.route('/broadcasts/<broadcast_id>', methods=['GET'])
+def broadcast_status(broadcast_id):
+    """Get a broadcast, with live stream information once it is live."""
+    try:
+        broadcast = BroadcastService.get(broadcast_id)
+        if not _owned(broadcast):
+            return jsonify({'success': False, 'message': 'Broadcast not found'})
+        
+        response = {'success': True, 'broadcast': broadcast}
+        if broadcast['status'] == 'live':
+            live_instance = LiveStreamManager.get_instance(broadcast['session_id'])
+            info = StreamService.get_stream_info(live_instance, since=request.args.get('since', type=int))
+            if info['success']:
+                response['info'] = info['data']
+        
+        return jsonify(response)
+        
+    except Exception as e:
+        current_app.logger.error(f"Broadcast status endpoint error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to get broadcast: {str(e)}'})
+
+
+@streaming_bp.route('/broadcasts/<broadcast_id>/telemetry')
+def broadcast_telemetry(broadcast_id):
+    """Get the ingest health time series of a live broadcast."""
+    try:
+        broadcast = BroadcastService.get(broadcast_id)
+        if not _owned(broadcast):
+            return jsonify({'success': False, 'message': 'Broadcast not found'})
+        if broadcast['status'] != 'live':
+            return jsonify({'success': False, 'message': f"Broadcast is {broadcast['status']}"})
+        
+        live_instance = LiveStreamManager.get_instance(broadcast['session_id'])
+        health = StreamService.get_stream_health(live_instance, limit=request.args.get('limit', type=int))
+        if health is None:
+            return jsonify({'success': False, 'message': 'No telemetry for this broadcast'})
+        
+        return jsonify({'success': True, 'data': health})
+        
+    except Exception as e:
+        current_app.logger.error(f"Broadcast telemetry endpoint error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to get broadcast telemetry: {str(e)}'})
+
+
+@streaming_bp.route('/broadcasts/<broadcast_id>', methods=['PATCH'])
+def update_broadcast(broadcast_id):
+    """Change video, title or duration of a queued broadcast."""
+    try:
+        data = dict(request.get_json(silent=True) or request.form)
+        for field in ('hours', 'minutes', 'seconds'):
+            if field in data:
+                data[field] = int(data[field])
+        
+        if not _owned(BroadcastService.get(broadcast_id)):
+            return jsonify({'success': False, 'message': 'Broadcast not found'})
+        return jsonify(BroadcastService.update(broadcast_id, **data))
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid input values: {str(e)}'})
+    except Exception as e:
+        current_app.logger.error(f"Update broadcast endpoint error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to update broadcast: {str(e)}'})
+
+
+@streaming_bp.route('/broadcasts/<broadcast_id>', methods=['DELETE'])
+def delete_broadcast(broadcast_id):
+    """Cancel a queued broadcast or stop a running one."""
+    if not _owned(BroadcastService.get(broadcast_id)):
+        return jsonify({'success': False, 'message': 'Broadcast not found'})
+    return jsonify(BroadcastService.delete(broadcast_id))
+
+
+@streaming_bp.route('/schedules', methods=['GET'])
+def list_schedules():
+    """List the caller's scheduled broadcasts by air time."""
+    try:
+        return jsonify({'success': True, 'schedules': BroadcastScheduler.list(account=_caller_account())})
+        
+    except Exception as e:
+        current_app.logger.error(f"List schedules endpoint error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to list schedules: {str(e)}'})
+
+
+@streaming_bp.route('/schedules', methods=['POST'])
+def create_schedule():
+    """Schedule a playlist to go live at a given time; cookies default to the session's."""
+    try:
+        data = request.get_json(silent=True) or {}
+        cookies = (data.get('cookies') or session.get('ig_cookies') or '').strip()
+        if not cookies:
+            return jsonify({'success': False, 'message': 'Instagram session cookies required'})
+        
+        start_at = BroadcastScheduler.parse_time(data.get('start_at'))
+        if start_at is None:
+            return jsonify({'success': False, 'message': 'Start time must be a Unix timestamp or ISO 8601 time'})
+        
+        playlist = data.get('playlist') or ([data['filename']] if data.get('filename') else [])
+        if not isinstance(playlist, list):
+            return jsonify({'success': False, 'message': 'Playlist must be a list'})
+        
+        result = BroadcastScheduler.create(
+            cookies,
+            str(data.get('title', Config.DEFAULT_LIVE_TITLE)).strip(),
+            playlist,
+            start_at
+        )
+        return jsonify(result)
+        
+    except Exception as e:
+        current_app.logger.error(f"Create schedule endpoint error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to schedule broadcast: {str(e)}'})
+
+
+@streaming_bp.route('/schedules/<schedule_id>', methods=['GET'])
+def schedule_status(schedule_id):
+    """Get a scheduled broadcast."""
+    schedule = BroadcastScheduler.get(schedule_id)
+    if not _owned(schedule):
+        return jsonify({'success': False, 'message': 'Schedule not found'})
+    return jsonify({'success': True, 'schedule': schedule})
+
+
+@streaming_bp.route('/schedules/<schedule_id>', methods=['DELETE'])
+def cancel_schedule(schedule_id):
+    """Cancel a scheduled broadcast, stopping it if it is on air."""
+    try:
+        if not _owned(BroadcastScheduler.get(schedule_id)):
+            return jsonify({'success': False, 'message': 'Schedule not found'})
+        return jsonify(BroadcastScheduler.cancel(schedule_id))
+        
+    except Exception as e:
+        current_app.logger.error(f"Cancel schedule endpoint error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to cancel schedule: {str(e)}'})
+
+
 @streaming_bp.route('/delete/<filename>', methods=['DELETE'])
 def delete_video(filename):
     """Delete uploaded video file."""
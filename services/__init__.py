@@ -2,5 +2,12 @@
 
 from .stream_service import StreamService
 from .video_service import VideoService
+from .event_service import StreamEventHub
+from .reaper_service import StreamReaper
+from .upload_service import UploadService
+from .thumbnail_service import ThumbnailService
+from .broadcast_service import BroadcastService
+from .admission import StreamAdmission
+from .scheduler_service import BroadcastScheduler
 
-__all__ = ['StreamService', 'VideoService']
+__all__ = ['StreamService', 'VideoService', 'StreamEventHub', 'StreamReaper', 'UploadService', 'ThumbnailService', 'BroadcastService', 'StreamAdmission', 'BroadcastScheduler']
@@ -0,0 +1,222 @@
+"""Admission control for concurrent ffmpeg pipelines."""
+
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+from flask import Flask, current_app, has_app_context
+import os
+import threading
+import time
+
+from config import Config
+from helpers import get_state_backend, process_alive, process_token
+from utils import LiveStreamManager
+
+
+class StreamAdmission:
+    """
+    Cap the number of simultaneous ffmpeg pipelines across all workers.
+
+    Slots are held in a single record of the shared state backend, so the
+    cap holds for every worker process. An Instagram account can only be
+    live once, so an account holds at most one slot; its further
+    broadcasts wait until that one ends.
+
+    Waiters of this process are admitted by a dispatcher thread, round-robin
+    by account: each account has a FIFO queue, and an account moves to the
+    back of the rotation once admitted, so one account queuing many
+    broadcasts cannot starve the others. A waiter's start callback only runs
+    once it holds a slot, so nothing sits on a worker thread while queued.
+
+    A slot is released when its stream is stopped through
+    :meth:`StreamService.stop_stream`; slots whose stream vanished some
+    other way (a crashed worker, a stop from a process without the live
+    object) are reclaimed by :meth:`reconcile`.
+    """
+
+    NAMESPACE = 'admission'
+    KEY = 'slots'
+    POLL_INTERVAL = 1.0  # slots freed by other workers are noticed by polling
+
+    _queues: 'OrderedDict[str, Deque[Tuple[str, Callable[[], None]]]]' = OrderedDict()
+    _condition = threading.Condition()
+    _thread: Optional[threading.Thread] = None
+    _app: Optional[Flask] = None
+
+    @classmethod
+    def enqueue(cls, ticket: str, account: str, on_admit: Callable[[], None]) -> None:
+        """
+        Wait for a pipeline slot in the background.
+
+        Args:
+            ticket: Unique id of the waiter, used to withdraw or release it
+            account: Instagram account the pipeline streams to
+            on_admit: Called once the slot is held, in an app context;
+                should hand the actual start to a job and return quickly
+        """
+        with cls._condition:
+            if has_app_context():
+                cls._app = current_app._get_current_object()
+            cls._queues.setdefault(account, deque()).append((ticket, on_admit))
+            if not (cls._thread and cls._thread.is_alive()):
+                cls._thread = threading.Thread(target=cls._dispatch, name='stream-admission', daemon=True)
+                cls._thread.start()
+            cls._condition.notify_all()
+
+    @classmethod
+    def withdraw(cls, ticket: str) -> bool:
+        """Remove a waiter that has not been admitted yet; returns True if it was waiting."""
+        with cls._condition:
+            for account, queue in list(cls._queues.items()):
+                for waiter in queue:
+                    if waiter[0] == ticket:
+                        queue.remove(waiter)
+                        if not queue:
+                            del cls._queues[account]
+                        return True
+        return False
+
+    @classmethod
+    def attach(cls, ticket: str, session_id: str) -> None:
+        """Record the stream session a slot is used by, once it is live."""
+        def set_session(slots: Dict[str, Any]) -> Dict[str, Any]:
+            if ticket in slots['holders']:
+                slots['holders'][ticket]['session_id'] = session_id
+            return slots
+
+        get_state_backend().modify(cls.NAMESPACE, cls.KEY, set_session)
+
+    @classmethod
+    def release(cls, ticket: str) -> bool:
+        """Give a slot back; returns True if it was held."""
+        released = []
+
+        def drop(slots: Dict[str, Any]) -> Dict[str, Any]:
+            if slots['holders'].pop(ticket, None) is not None:
+                released.append(ticket)
+            return slots
+
+        get_state_backend().modify(cls.NAMESPACE, cls.KEY, drop)
+        with cls._condition:
+            cls._condition.notify_all()
+        return bool(released)
+
+    @classmethod
+    def reconcile(cls) -> int:
+        """
+        Reclaim slots whose pipeline is gone.
+
+        A live slot is kept while its stream is: the stream record must
+        exist and be active, and its owner (or the supervisor's stream) be
+        alive, which LiveStreamManager.purge_stale checks first. A slot
+        that is still starting is kept while the process that took it is
+        alive.
+
+        Returns:
+            Number of slots reclaimed
+        """
+        backend = get_state_backend()
+        LiveStreamManager.purge_stale()
+        # An inactive stream's ffmpeg has exited, so it no longer needs its slot
+        sessions = {
+            session_id for session_id, record in backend.items(LiveStreamManager.NAMESPACE)
+            if record['active']
+        }
+        reclaimed = []
+
+        def prune(slots: Dict[str, Any]) -> Dict[str, Any]:
+            for ticket, holder in list(slots['holders'].items()):
+                if holder.get('session_id'):
+                    alive = holder['session_id'] in sessions
+                else:
+                    alive = process_alive(holder['pid'], holder.get('token'))
+                if not alive:
+                    del slots['holders'][ticket]
+                    reclaimed.append(ticket)
+            return slots
+
+        backend.modify(cls.NAMESPACE, cls.KEY, prune)
+        if reclaimed:
+            with cls._condition:
+                cls._condition.notify_all()
+        return len(reclaimed)
+
+    @classmethod
+    def usage(cls) -> Dict[str, Any]:
+        """Slot usage across workers and this process's waiters."""
+        holders = cls._holders()
+        with cls._condition:
+            waiting = sum(len(queue) for queue in cls._queues.values())
+        return {
+            'limit': Config.MAX_CONCURRENT_STREAMS,
+            'running': len(holders),
+            'waiting': waiting
+        }
+
+    @classmethod
+    def _dispatch(cls) -> None:
+        while True:
+            with cls._condition:
+                admitted = cls._admit_next() if cls._queues else None
+                if admitted is None:
+                    cls._condition.wait(cls.POLL_INTERVAL if cls._queues else None)
+                    continue
+                app = cls._app
+
+            ticket, on_admit = admitted
+            try:
+                if app is not None:
+                    with app.app_context():
+                        on_admit()
+                else:
+                    on_admit()
+            except Exception as e:
+                cls.release(ticket)
+                if app is not None:
+                    app.logger.error(f"Stream admission error: {str(e)}")
+
+    @classmethod
+    def _admit_next(cls) -> Optional[Tuple[str, Callable[[], None]]]:
+        """Claim a slot for the next waiter in rotation; called with the condition held."""
+        holders = cls._holders()
+        if len(holders) >= Config.MAX_CONCURRENT_STREAMS:
+            return None
+
+        busy = {holder['account'] for holder in holders.values()}
+        account = next((a for a in cls._queues if a not in busy), None)
+        if account is None:
+            return None
+
+        queue = cls._queues[account]
+        ticket = queue[0][0]
+        if not cls._claim(ticket, account):
+            # Taken by another worker in the meantime
+            return None
+
+        waiter = queue.popleft()
+        if queue:
+            cls._queues.move_to_end(account)
+        else:
+            del cls._queues[account]
+        return waiter
+
+    @classmethod
+    def _holders(cls) -> Dict[str, Dict[str, Any]]:
+        slots = get_state_backend().get(cls.NAMESPACE, cls.KEY)
+        return slots['holders'] if slots else {}
+
+    @classmethod
+    def _claim(cls, ticket: str, account: str) -> bool:
+        def claim(slots: Dict[str, Any]) -> Dict[str, Any]:
+            holders = slots['holders']
+            busy = any(holder['account'] == account for holder in holders.values())
+            if len(holders) < Config.MAX_CONCURRENT_STREAMS and not busy:
+                holders[ticket] = {
+                    'account': account,
+                    'pid': os.getpid(),
+                    'token': process_token(),
+                    'acquired_at': time.time()
+                }
+            return slots
+
+        slots = get_state_backend().modify(cls.NAMESPACE, cls.KEY, claim, default={'holders': {}})
+        return ticket in slots['holders']
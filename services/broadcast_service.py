@@ -0,0 +1,430 @@
+"""Broadcasts of many Instagram accounts driven by one deployment."""
+
+from typing import Any, Dict, List, Optional, Tuple
+from flask import current_app
+from werkzeug.utils import secure_filename
+import math
+import os
+import time
+import uuid
+
+from config import Config
+from helpers import MediaProbe, get_state_backend, process_alive, process_token, validate_duration, validate_media
+from utils import LiveStreamManager
+from .admission import StreamAdmission
+from .job_service import JobManager
+from .stream_service import StreamService
+
+
+class BroadcastService:
+    """
+    Broadcasts as resources keyed by broadcast id.
+
+    Unlike ``/api/start``, which ties one stream to one browser session, a
+    broadcast carries its own account, so any number of accounts can be
+    live from one deployment. Each broadcast waits for a pipeline slot from
+    StreamAdmission, then starts like any other stream and is registered
+    with LiveStreamManager under its own session id.
+
+    Records live in the shared state backend and never contain cookies;
+    those only travel with the broadcast's start job. A broadcast moves
+    through queued -> starting -> ingesting -> live -> ended, or ends as
+    cancelled or failed.
+
+    A broadcast of a playlist plays its videos back to back through one
+    ffmpeg process, so the broadcast is never restarted between them.
+    """
+
+    NAMESPACE = 'broadcasts'
+    FINISHED = ('ended', 'cancelled', 'failed')
+    EDITABLE = ('filename', 'title', 'hours', 'minutes', 'seconds')
+
+    jobs = JobManager('broadcast', Config.MAX_CONCURRENT_STREAMS)
+
+    @staticmethod
+    def create(cookies: str, filename: str, title: str,
+               hours: int, minutes: int, seconds: int,
+               playlist: Optional[List[Any]] = None) -> Dict[str, Any]:
+        """
+        Queue a broadcast.
+
+        Args:
+            cookies: Instagram session cookies of the account to stream to
+            filename: Video in the upload folder
+            title: Stream title
+            hours: Duration hours
+            minutes: Duration minutes
+            seconds: Duration seconds
+            playlist: Videos to play back to back instead of filename, see
+                normalize_playlist; the duration is then their total
+
+        Returns:
+            Dict with success status and the broadcast or error message
+        """
+        try:
+            items = None
+            if playlist:
+                items, error = BroadcastService.normalize_playlist(playlist)
+                if error:
+                    return {'success': False, 'message': error}
+                filename = items[0]['filename']
+                hours, minutes, seconds = BroadcastService.split_duration(sum(i['duration'] for i in items))
+
+            account = StreamService.validate_cookies(cookies)
+            if not account['success']:
+                return account
+
+            fields = {
+                'filename': secure_filename(filename),
+                'title': title or Config.DEFAULT_LIVE_TITLE,
+                'hours': hours,
+                'minutes': minutes,
+                'seconds': seconds
+            }
+            error = BroadcastService._validate(fields)
+            if error:
+                return {'success': False, 'message': error}
+
+            pending = [b for b in BroadcastService.list() if b['status'] not in BroadcastService.FINISHED]
+            if len(pending) >= Config.BROADCAST_QUEUE_SIZE:
+                return {'success': False, 'message': 'Broadcast queue is full'}
+
+            broadcast_id = uuid.uuid4().hex
+            now = time.time()
+            record = {
+                'id': broadcast_id,
+                'account': account['userid'],
+                'username': account['username'],
+                **fields,
+                'playlist': items,
+                'status': 'queued',
+                'message': None,
+                'session_id': None,
+                'instagram_broadcast_id': None,
+                'start_time': None,
+                'stop_requested': False,
+                'owner_pid': os.getpid(),
+                'owner_token': process_token(),
+                'created_at': now,
+                'updated_at': now
+            }
+            get_state_backend().set(BroadcastService.NAMESPACE, broadcast_id, record)
+            StreamAdmission.enqueue(
+                broadcast_id,
+                record['account'],
+                lambda: BroadcastService.jobs.submit(BroadcastService.run_broadcast_job, broadcast_id, cookies)
+            )
+
+            return {
+                'success': True,
+                'message': 'Broadcast queued',
+                'broadcast': record
+            }
+
+        except Exception as e:
+            current_app.logger.error(f"Create broadcast error: {str(e)}")
+            return {'success': False, 'message': f'Failed to create broadcast: {str(e)}'}
+
+    @staticmethod
+    def get(broadcast_id: str) -> Optional[Dict[str, Any]]:
+        """Current state of a broadcast, or None if unknown."""
+        record = get_state_backend().get(BroadcastService.NAMESPACE, broadcast_id)
+        return BroadcastService._refresh(record) if record else None
+
+    @staticmethod
+    def list(account: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Known broadcasts, oldest first.
+
+        Args:
+            account: Only broadcasts of this Instagram user id (None for all)
+        """
+        records = [
+            BroadcastService._refresh(record)
+            for _, record in get_state_backend().items(BroadcastService.NAMESPACE)
+            if account is None or record['account'] == account
+        ]
+        return sorted(records, key=lambda record: record['created_at'])
+
+    @staticmethod
+    def update(broadcast_id: str, **changes: Any) -> Dict[str, Any]:
+        """
+        Change video, title or duration of a broadcast that is still queued.
+
+        Args:
+            broadcast_id: Id of the broadcast
+            **changes: New values for any of EDITABLE
+
+        Returns:
+            Dict with success status and the broadcast or error message
+        """
+        record = BroadcastService.get(broadcast_id)
+        if not record:
+            return {'success': False, 'message': 'Broadcast not found'}
+
+        unknown = set(changes) - set(BroadcastService.EDITABLE)
+        if unknown:
+            return {'success': False, 'message': f'Cannot change: {", ".join(sorted(unknown))}'}
+        if record.get('playlist') and set(changes) - {'title'}:
+            return {'success': False, 'message': 'Only the title of a playlist broadcast can be changed'}
+        if 'filename' in changes:
+            changes['filename'] = secure_filename(changes['filename'])
+
+        error = BroadcastService._validate({**record, **changes})
+        if error:
+            return {'success': False, 'message': error}
+
+        record = BroadcastService._transition(broadcast_id, ('queued',), **changes)
+        if not record:
+            return {'success': False, 'message': 'Only queued broadcasts can be changed'}
+        return {'success': True, 'message': 'Broadcast updated', 'broadcast': record}
+
+    @staticmethod
+    def delete(broadcast_id: str) -> Dict[str, Any]:
+        """
+        Cancel a queued broadcast or stop a started one.
+
+        Args:
+            broadcast_id: Id of the broadcast
+
+        Returns:
+            Dict with success status or error message
+        """
+        try:
+            record = BroadcastService.get(broadcast_id)
+            if not record:
+                return {'success': False, 'message': 'Broadcast not found'}
+
+            if BroadcastService._transition(broadcast_id, ('queued',), status='cancelled'):
+                StreamAdmission.withdraw(broadcast_id)
+                BroadcastService._retire(broadcast_id)
+                return {'success': True, 'message': 'Broadcast cancelled'}
+
+            # Still starting: the start job stops it as soon as it is live
+            if BroadcastService._transition(broadcast_id, ('starting', 'ingesting'), stop_requested=True):
+                return {'success': True, 'message': 'Broadcast will stop once started'}
+
+            if record['status'] != 'live':
+                return {'success': False, 'message': f"Broadcast already {record['status']}"}
+
+            LiveStreamManager.remove_instance(record['session_id'], stop=StreamService.stop_stream)
+            if LiveStreamManager.get_metadata(record['session_id']):
+                return {'success': False, 'message': 'Broadcast is owned by another process'}
+
+            from .reaper_service import StreamReaper
+            StreamReaper.cancel_stop(record['session_id'])
+
+            BroadcastService._transition(broadcast_id, ('live',), status='ended')
+            BroadcastService._retire(broadcast_id)
+            return {'success': True, 'message': 'Broadcast stopped'}
+
+        except Exception as e:
+            current_app.logger.error(f"Delete broadcast error: {str(e)}")
+            return {'success': False, 'message': f'Failed to stop broadcast: {str(e)}'}
+
+    @staticmethod
+    def run_broadcast_job(job_id: str, broadcast_id: str, cookies: str) -> Dict[str, Any]:
+        """
+        Start a broadcast as a background job, once it was granted a pipeline slot.
+
+        Args:
+            job_id: Id of the job in BroadcastService.jobs
+            broadcast_id: Id of the broadcast, also its admission ticket
+            cookies: Instagram session cookies of the broadcast's account
+
+        Returns:
+            Dict with the session id, or empty if the broadcast did not go live
+        """
+        try:
+            # Cancelled after the slot was granted: hand it straight back
+            record = BroadcastService._transition(broadcast_id, ('queued',), status='starting')
+            if not record:
+                StreamAdmission.release(broadcast_id)
+                BroadcastService.jobs.update(job_id, status='cancelled')
+                return {}
+
+            result = StreamService.start_stream(
+                cookies,
+                os.path.join(Config.UPLOAD_FOLDER, record['filename']),
+                record['title'], record['hours'], record['minutes'], record['seconds'],
+                on_status=lambda status: BroadcastService._transition(broadcast_id, ('starting',), status=status),
+                playlist=record.get('playlist')
+            )
+            if not result['success']:
+                StreamAdmission.release(broadcast_id)
+                BroadcastService._transition(
+                    broadcast_id, ('starting', 'ingesting'), status='failed', message=result['message']
+                )
+                BroadcastService._retire(broadcast_id)
+                BroadcastService.jobs.update(job_id, status='failed', message=result['message'])
+                return {}
+
+            session_id = result['session_id']
+            StreamService.hold_slot(result, broadcast_id)
+            LiveStreamManager.create_instance(
+                session_id,
+                result['live_instance'],
+                broadcast_id=result['broadcast_id'],
+                title=record['title'],
+                start_time=result['start_time']
+            )
+            record = BroadcastService._transition(
+                broadcast_id, ('starting', 'ingesting'),
+                status='live',
+                message='Live stream started successfully',
+                session_id=session_id,
+                instagram_broadcast_id=result['broadcast_id'],
+                start_time=result['start_time']
+            )
+            BroadcastService.jobs.update(job_id, status='live')
+
+            if not record:
+                # Record expired while starting; nothing can reach the stream anymore
+                LiveStreamManager.remove_instance(session_id, stop=StreamService.stop_stream)
+            elif record['stop_requested']:
+                BroadcastService.delete(broadcast_id)
+            else:
+                duration = record['hours'] * 3600 + record['minutes'] * 60 + record['seconds']
+                if duration > 0:
+                    from .reaper_service import StreamReaper
+                    StreamReaper.schedule_stop(session_id, time.time() + duration)
+            return {'session_id': session_id}
+        except Exception as e:
+            # A broadcast that already went live keeps its slot until it is stopped
+            if BroadcastService._transition(broadcast_id, ('starting', 'ingesting'), status='failed', message=str(e)):
+                StreamAdmission.release(broadcast_id)
+                BroadcastService._retire(broadcast_id)
+            raise
+
+    @staticmethod
+    def normalize_playlist(playlist: List[Any]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Validate a playlist and fill in each item's duration.
+
+        Args:
+            playlist: Library filenames, or dicts with ``filename`` and an
+                optional ``duration`` in seconds (default: the whole video, at
+                most its length)
+
+        Returns:
+            Tuple of items as dicts with filename and duration, and an error
+            message if the playlist is invalid
+        """
+        if not playlist:
+            return [], 'Playlist is empty'
+
+        items = []
+        audio = set()
+        for item in playlist:
+            if not isinstance(item, dict):
+                item = {'filename': item}
+            filename = secure_filename(str(item.get('filename') or ''))
+            if not filename or not os.path.exists(os.path.join(Config.UPLOAD_FOLDER, filename)):
+                return [], f'Video file not found: {filename or item.get("filename")}'
+
+            media = MediaProbe.get(filename)
+            media_valid, media_error = validate_media(media)
+            if not media_valid:
+                return [], f'{filename}: {media_error}'
+            if media:
+                audio.add(bool(media.get('audio_codec')))
+
+            try:
+                duration = int(item.get('duration') or math.ceil((media or {}).get('duration') or 0))
+            except (TypeError, ValueError):
+                return [], f'{filename}: invalid duration'
+            if duration <= 0:
+                return [], f'Duration of {filename} is unknown; set it explicitly'
+            # The concat outpoint only cuts a video short, it cannot extend one
+            probed = (media or {}).get('duration')
+            if probed and duration > math.ceil(probed):
+                return [], f'Duration of {filename} exceeds its length of {math.ceil(probed)}s'
+            items.append({'filename': filename, 'duration': duration})
+
+        # One ingest carries one set of streams for the whole playlist
+        if len(audio) > 1:
+            return [], 'Playlist mixes videos with and without audio'
+
+        duration_valid, duration_error = validate_duration(
+            *BroadcastService.split_duration(sum(i['duration'] for i in items))
+        )
+        if not duration_valid:
+            return [], duration_error
+        return items, None
+
+    @staticmethod
+    def split_duration(seconds: int) -> Tuple[int, int, int]:
+        """Split seconds into hours, minutes and seconds."""
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return hours, minutes, seconds
+
+    @staticmethod
+    def _validate(fields: Dict[str, Any]) -> Optional[str]:
+        """Error message for invalid broadcast settings, or None."""
+        if not fields['filename']:
+            return 'Video filename is required'
+
+        duration_valid, duration_error = validate_duration(fields['hours'], fields['minutes'], fields['seconds'])
+        if not duration_valid:
+            return duration_error
+
+        if not os.path.exists(os.path.join(Config.UPLOAD_FOLDER, fields['filename'])):
+            return 'Video file not found'
+
+        media_valid, media_error = validate_media(MediaProbe.get(fields['filename']))
+        return None if media_valid else media_error
+
+    @staticmethod
+    def _transition(broadcast_id: str, from_statuses: tuple, **fields: Any) -> Optional[Dict[str, Any]]:
+        """Atomically update a broadcast that is in one of from_statuses; returns it or None."""
+        moved = []
+
+        def apply(record: Dict[str, Any]) -> Dict[str, Any]:
+            if record['status'] in from_statuses:
+                moved.append(True)
+                return {**record, **fields, 'updated_at': time.time()}
+            return record
+
+        record = get_state_backend().modify(BroadcastService.NAMESPACE, broadcast_id, apply)
+        return record if moved else None
+
+    @staticmethod
+    def _refresh(record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Settle broadcasts whose outcome can no longer change.
+
+        A live broadcast whose stream is gone (stopped elsewhere or reaped)
+        has ended; one whose stream went inactive is stopped first, so it
+        does not stay open on Instagram. One still waiting or starting in a
+        process that exited never will start, since its cookies died with
+        that process.
+        """
+        status = record['status']
+        session_id = record['session_id']
+        if status == 'live' and not LiveStreamManager.is_active(session_id):
+            if LiveStreamManager.get_metadata(session_id) is not None:
+                LiveStreamManager.remove_instance(session_id, stop=StreamService.stop_stream)
+                if LiveStreamManager.get_metadata(session_id) is not None:
+                    # Owned by a worker we cannot reach; it ends the broadcast
+                    return record
+            settled = BroadcastService._transition(record['id'], ('live',), status='ended')
+        elif status in ('queued', 'starting', 'ingesting') and not process_alive(record['owner_pid'], record.get('owner_token')):
+            settled = BroadcastService._transition(
+                record['id'], (status,), status='failed', message='Worker exited before the broadcast started'
+            )
+        else:
+            return record
+
+        if settled:
+            BroadcastService._retire(record['id'])
+            return settled
+        return record
+
+    @staticmethod
+    def _retire(broadcast_id: str) -> None:
+        """Let a finished broadcast expire after the job retention period."""
+        backend = get_state_backend()
+        record = backend.get(BroadcastService.NAMESPACE, broadcast_id)
+        if record:
+            backend.set(BroadcastService.NAMESPACE, broadcast_id, record, ttl=Config.JOB_RETENTION_SECONDS)
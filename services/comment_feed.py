@@ -0,0 +1,78 @@
+"""Bounded per-broadcast comment feed with monotonic cursors."""
+
+from collections import deque
+from itertools import islice
+from typing import Any, Dict, List, Optional
+import threading
+
+
+class CommentFeed:
+    """
+    Ring buffer of a broadcast's most recent comments.
+
+    Every comment gets a monotonically increasing id, so clients can ask for
+    only the comments newer than the last id (cursor) they have seen.
+    """
+
+    def __init__(self, maxlen: int):
+        self._comments: deque = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._consumed = 0
+
+    @property
+    def cursor(self) -> int:
+        """Id of the newest comment, or 0 if none were seen yet."""
+        with self._lock:
+            return self._next_id - 1
+
+    def ingest(self, comment_users: List[Dict[str, Any]]) -> int:
+        """
+        Append comments not seen yet from a cumulative comment list.
+
+        Args:
+            comment_users: Cumulative comment list kept by the live instance
+
+        Returns:
+            Number of new comments added
+        """
+        with self._lock:
+            if len(comment_users) < self._consumed:
+                # The live instance reset its list (e.g. after a restart)
+                self._consumed = 0
+
+            added = 0
+            for comment in comment_users[self._consumed:]:
+                self._comments.append({
+                    'id': self._next_id,
+                    'user': comment.get('user', 'unknown'),
+                    'text': comment.get('text', ''),
+                    'time': comment.get('time', '')
+                })
+                self._next_id += 1
+                added += 1
+
+            self._consumed = len(comment_users)
+            return added
+
+    def since(self, cursor: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Return buffered comments newer than cursor.
+
+        Args:
+            cursor: Last comment id the caller has seen; None for all
+
+        Returns:
+            Comments in arrival order
+        """
+        with self._lock:
+            if not self._comments:
+                return []
+            if cursor is None:
+                return list(self._comments)
+
+            # Ids are contiguous, so count the new ones and walk back from the end
+            count = min(len(self._comments), max(0, self._next_id - 1 - cursor))
+            newest = list(islice(reversed(self._comments), count))
+            newest.reverse()
+            return newest
@@ -0,0 +1,188 @@
+"""Content-addressed storage behind the files in the upload folder."""
+
+from typing import Any, BinaryIO, Dict, Iterable, Optional, Tuple
+from flask import current_app
+import hashlib
+import os
+import uuid
+
+from config import Config
+
+
+class ContentStore:
+    """
+    Deduplicate library files by content.
+
+    Every stored file is hashed with BLAKE2b while it is written and
+    hardlinked into ``UPLOAD_FOLDER/.objects/<digest>``. The user-facing
+    name in the upload folder is just another link to that object, so the
+    same clip uploaded or downloaded again only costs a directory entry.
+    An object whose only remaining link is its own store entry is garbage
+    unless the download cache still holds it.
+    """
+
+    OBJECTS_DIR = '.objects'
+    BLOCK_SIZE = 1024 * 1024
+
+    @staticmethod
+    def new_hash() -> Any:
+        """Hash object used for content digests."""
+        return hashlib.blake2b(digest_size=32)
+
+    @staticmethod
+    def write_stream(stream: BinaryIO, path: str) -> Tuple[str, int]:
+        """
+        Copy a stream to path, hashing it in the same pass.
+
+        Args:
+            stream: Readable binary stream
+            path: Destination file path
+
+        Returns:
+            Tuple of hex digest and byte count
+        """
+        digest = ContentStore.new_hash()
+        size = 0
+        with open(path, 'wb') as f:
+            while True:
+                block = stream.read(ContentStore.BLOCK_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+                f.write(block)
+                size += len(block)
+        return digest.hexdigest(), size
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        """Hex digest of a file written by someone else."""
+        digest = ContentStore.new_hash()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(ContentStore.BLOCK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def store(path: str, digest: str, filename: str) -> Dict[str, Any]:
+        """
+        Publish a fully written file under filename, sharing storage with
+        any identical file already in the store.
+
+        Args:
+            path: Written file; it is consumed (renamed or removed)
+            digest: Hex digest of the file's content
+            filename: Name to publish in the upload folder
+
+        Returns:
+            Dict with filename, digest and whether the content was deduplicated
+
+        Raises:
+            FileExistsError: Another file is already published under filename
+        """
+        final_path = os.path.join(Config.UPLOAD_FOLDER, filename)
+        if path != final_path and os.path.lexists(final_path):
+            raise FileExistsError(f'{filename} already exists')
+        object_path = ContentStore.object_path(digest)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+
+        try:
+            os.link(path, object_path)
+            deduplicated = False
+        except FileExistsError:
+            deduplicated = True
+        except OSError as e:
+            # Filesystem without hardlinks: keep the file, skip deduplication
+            current_app.logger.error(f"Content store link error: {str(e)}")
+            if path != final_path:
+                os.replace(path, final_path)
+            return {'filename': filename, 'digest': digest, 'deduplicated': False}
+
+        if path == final_path:
+            if deduplicated:
+                ContentStore._link(object_path, final_path)
+        else:
+            # A plain link never replaces a file published meanwhile
+            os.link(object_path if deduplicated else path, final_path)
+            os.remove(path)
+
+        return {'filename': filename, 'digest': digest, 'deduplicated': deduplicated}
+
+    @staticmethod
+    def publish(digest: str, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Make a stored object visible in the upload folder under filename.
+
+        Args:
+            digest: Hex digest of the stored content
+            filename: Name to publish in the upload folder
+
+        Returns:
+            Dict like :meth:`store`, or None if the object is not stored
+        """
+        object_path = ContentStore.object_path(digest)
+        try:
+            ContentStore._link(object_path, os.path.join(Config.UPLOAD_FOLDER, filename))
+        except FileNotFoundError:
+            return None
+        return {'filename': filename, 'digest': digest, 'deduplicated': True}
+
+    @staticmethod
+    def release(digest: Optional[str]) -> None:
+        """Drop an object once no library file links to it anymore."""
+        if not digest:
+            return
+        object_path = ContentStore.object_path(digest)
+        try:
+            if os.stat(object_path).st_nlink == 1:
+                os.remove(object_path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def collect(keep: Iterable[str] = ()) -> int:
+        """
+        Remove every object no library file links to.
+
+        Args:
+            keep: Digests to keep even when unlinked
+
+        Returns:
+            Number of objects removed
+        """
+        keep = set(keep)
+        removed = 0
+        root = os.path.join(Config.UPLOAD_FOLDER, ContentStore.OBJECTS_DIR)
+        if not os.path.isdir(root):
+            return 0
+
+        for prefix in os.scandir(root):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.name in keep:
+                    continue
+                try:
+                    if entry.stat().st_nlink == 1:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError:
+                    continue
+        return removed
+
+    @staticmethod
+    def object_path(digest: str) -> str:
+        """Path of the stored object for a digest."""
+        return os.path.join(Config.UPLOAD_FOLDER, ContentStore.OBJECTS_DIR, digest[:2], digest)
+
+    @staticmethod
+    def _link(source: str, target: str) -> None:
+        """Atomically make target a hardlink of source."""
+        # Unique per call: concurrent jobs are threads of one process
+        tmp_path = f'{target}.{uuid.uuid4().hex}.link'
+        os.link(source, tmp_path)
+        try:
+            os.replace(tmp_path, target)
+        finally:
+            # rename() does nothing if target already links the same file
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
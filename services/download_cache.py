@@ -0,0 +1,201 @@
+"""Cache of downloaded videos keyed by normalized URL or Instagram shortcode."""
+
+from typing import Any, Dict, Optional, Set
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import os
+import re
+import time
+
+from config import Config
+from helpers import get_state_backend
+from .content_store import ContentStore
+
+
+class DownloadCache:
+    """
+    Map download URLs to content already in the content store.
+
+    Instagram posts are keyed by shortcode, so ``/p/``, ``/reel/`` and
+    share links with tracking parameters all hit the same entry; posts do
+    not change, so those hits never call Instagram. Direct URLs are keyed
+    by a normalized form and revalidated against the ETag or Last-Modified
+    seen when they were cached. Cached objects survive deletion from the
+    library; the bytes only the cache keeps alive are bounded by
+    DOWNLOAD_CACHE_SIZE_MB and evicted least recently used first.
+    """
+
+    NAMESPACE = 'download_cache'
+    TRACKING_PARAMS = {'igsh', 'igshid', 'fbclid', 'gclid', 'si'}
+    INSTAGRAM_HOST = re.compile(r'^(?:www\.|m\.)?instagram\.com$')
+    SHORTCODE_PATH = re.compile(r'^/(?:[^/]+/)?(?:p|reel|reels|tv)/([A-Za-z0-9_-]+)')
+
+    @staticmethod
+    def cache_key(url: str) -> str:
+        """
+        Normalize a URL into a cache key.
+
+        Args:
+            url: Download URL
+
+        Returns:
+            ``ig:<shortcode>`` for Instagram posts, otherwise the URL with a
+            lowercase scheme and host, no default port, fragment or tracking
+            parameters, and sorted query parameters
+        """
+        parts = urlsplit(url.strip())
+        host = (parts.hostname or '').lower()
+
+        if DownloadCache.INSTAGRAM_HOST.match(host):
+            match = DownloadCache.SHORTCODE_PATH.match(parts.path)
+            if match:
+                return f'ig:{match.group(1)}'
+
+        scheme = parts.scheme.lower()
+        netloc = host
+        if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+            netloc = f'{host}:{parts.port}'
+        query = sorted(
+            (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+            if k.lower() not in DownloadCache.TRACKING_PARAMS and not k.lower().startswith('utm_')
+        )
+        return urlunsplit((scheme, netloc, parts.path or '/', urlencode(query), ''))
+
+    @staticmethod
+    def lookup(key: str) -> Optional[Dict[str, Any]]:
+        """Cache entry for a key whose object is still stored, or None."""
+        entry = get_state_backend().get(DownloadCache.NAMESPACE, key)
+        if not entry:
+            return None
+        if not os.path.exists(ContentStore.object_path(entry['digest'])):
+            get_state_backend().delete(DownloadCache.NAMESPACE, key)
+            return None
+        return entry
+
+    @staticmethod
+    def is_fresh(entry: Dict[str, Any], probe: Dict[str, Any]) -> bool:
+        """
+        Decide whether a cached direct download still matches the remote file.
+
+        Args:
+            entry: Cache entry
+            probe: Result of RangedDownloader.probe for the URL
+
+        Returns:
+            True if the cached content can be served
+        """
+        if entry.get('size') and probe.get('size') and entry['size'] != probe['size']:
+            return False
+        if entry.get('etag') and probe.get('etag'):
+            return entry['etag'] == probe['etag']
+        if entry.get('last_modified') and probe.get('last_modified'):
+            return entry['last_modified'] == probe['last_modified']
+        # No validators: trust the entry for a limited time only
+        return time.time() - entry['cached_at'] < Config.DOWNLOAD_CACHE_MAX_AGE
+
+    @staticmethod
+    def serve(key: str, entry: Dict[str, Any], filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Publish a cached entry in the library.
+
+        Reuses the file the entry was cached under if it is still in the
+        library, otherwise links the object under filename with the cached
+        file's extension.
+
+        Args:
+            key: Cache key
+            entry: Cache entry
+            filename: Name to publish if the earlier file is gone
+
+        Returns:
+            Dict like ContentStore.store, or None if the object vanished
+        """
+        object_path = ContentStore.object_path(entry['digest'])
+        known_path = os.path.join(Config.UPLOAD_FOLDER, entry['filename'])
+        try:
+            if os.path.samefile(known_path, object_path):
+                stored = {'filename': entry['filename'], 'digest': entry['digest'], 'deduplicated': True}
+                get_state_backend().update(DownloadCache.NAMESPACE, key, last_used=time.time())
+                return stored
+        except OSError:
+            pass
+
+        stem, _ = os.path.splitext(filename)
+        _, ext = os.path.splitext(entry['filename'])
+        stored = ContentStore.publish(entry['digest'], stem + ext)
+        if stored:
+            get_state_backend().update(
+                DownloadCache.NAMESPACE, key, filename=stored['filename'], last_used=time.time()
+            )
+        return stored
+
+    @staticmethod
+    def put(key: str, digest: str, filename: str, probe: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Remember which content a URL resolved to, then enforce the budget.
+
+        Args:
+            key: Cache key from :meth:`cache_key`
+            digest: Hex digest of the downloaded content
+            filename: Library file it was published as
+            probe: Result of RangedDownloader.probe, for revalidation
+        """
+        now = time.time()
+        probe = probe or {}
+        get_state_backend().set(DownloadCache.NAMESPACE, key, {
+            'digest': digest,
+            'filename': filename,
+            'size': probe.get('size'),
+            'etag': probe.get('etag'),
+            'last_modified': probe.get('last_modified'),
+            'cached_at': now,
+            'last_used': now
+        })
+        DownloadCache.enforce_budget()
+
+    @staticmethod
+    def pinned_digests() -> Set[str]:
+        """Digests the cache keeps alive."""
+        return {entry['digest'] for _, entry in get_state_backend().items(DownloadCache.NAMESPACE)}
+
+    @staticmethod
+    def enforce_budget() -> int:
+        """
+        Evict least recently used entries until the objects only the cache
+        holds fit in DOWNLOAD_CACHE_SIZE_MB.
+
+        Returns:
+            Number of entries evicted
+        """
+        backend = get_state_backend()
+        entries = backend.items(DownloadCache.NAMESPACE)
+        referenced: Dict[str, int] = {}
+        for _, entry in entries:
+            referenced[entry['digest']] = referenced.get(entry['digest'], 0) + 1
+
+        # Objects still linked from the library cost nothing extra to keep
+        candidates = []
+        cached_only = 0
+        counted: Set[str] = set()
+        for key, entry in entries:
+            try:
+                st = os.stat(ContentStore.object_path(entry['digest']))
+            except OSError:
+                backend.delete(DownloadCache.NAMESPACE, key)
+                continue
+            if st.st_nlink == 1:
+                candidates.append((entry['last_used'], key, entry['digest'], st.st_size))
+                if entry['digest'] not in counted:
+                    counted.add(entry['digest'])
+                    cached_only += st.st_size
+
+        evicted = 0
+        for _, key, digest, size in sorted(candidates):
+            if cached_only <= Config.DOWNLOAD_CACHE_SIZE:
+                break
+            backend.delete(DownloadCache.NAMESPACE, key)
+            evicted += 1
+            referenced[digest] -= 1
+            if referenced[digest] == 0:
+                ContentStore.release(digest)
+                cached_only -= size
+        return evicted
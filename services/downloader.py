@@ -0,0 +1,345 @@
+"""Parallel ranged HTTP downloads with resume."""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from requests.adapters import HTTPAdapter
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+
+from config import Config
+from helpers import metrics
+
+DOWNLOADED_BYTES = metrics.counter(
+    'instream_download_bytes_total',
+    'Bytes of video downloaded into the library, by source.',
+    ('source',)
+)
+DOWNLOAD_THROUGHPUT = metrics.histogram(
+    'instream_download_throughput_bytes_per_second',
+    'Average throughput of each finished download, by source.',
+    ('source',),
+    buckets=(64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2, 256 * 1024 ** 2)
+)
+
+
+class DownloadError(Exception):
+    """Raised when a download cannot be completed."""
+
+
+class DownloadCancelled(DownloadError):
+    """Raised when the progress callback asked the download to stop."""
+
+
+class RangeIgnored(DownloadError):
+    """Raised when a range request got the whole file, e.g. because it changed."""
+
+
+class RangedDownloader:
+    """
+    Download a URL into a part file, in parallel segments when possible.
+
+    The server is probed first; if it advertises ``Accept-Ranges: bytes``
+    and a length, the file is preallocated and split into fixed-size
+    segments that a shared thread pool fetches concurrently and writes in
+    place with ``os.pwrite``. Finished segments are recorded in a sidecar
+    ``.state`` file, so a retry of the same URL only fetches what is
+    missing. Servers without range support get a single sequential stream,
+    as does a file that changed since the probe (the server answers a range
+    request with the whole file).
+
+    Use it as a context manager: the part file stays locked against other
+    downloads of the same URL until the caller has moved it away. The
+    progress callback receives ``(bytes_done, total)`` and may return False
+    to cancel; finished segments are kept so the download can resume.
+    """
+
+    BLOCK_SIZE = 1024 * 1024
+    RETRIES = 3
+
+    _executor = ThreadPoolExecutor(
+        max_workers=Config.DOWNLOAD_SEGMENT_WORKERS,
+        thread_name_prefix='download-segment'
+    )
+    _local = threading.local()
+
+    def __init__(self, url: str, on_progress: Optional[Callable[[int, Optional[int]], None]] = None):
+        self.url = url
+        self.on_progress = on_progress
+        self.part_path = os.path.join(
+            Config.UPLOAD_FOLDER,
+            f"dl_{hashlib.sha256(url.encode()).hexdigest()[:16]}.part"
+        )
+        self.state_path = self.part_path + '.state'
+        self.content_type = ''
+        self.size: Optional[int] = None
+        self._received = 0
+        self._written = 0
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._cancelled = threading.Event()
+
+    def __enter__(self) -> 'RangedDownloader':
+        while True:
+            fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                raise DownloadError('This URL is already being downloaded')
+            # The previous holder may have renamed the file after we opened it
+            try:
+                if os.stat(self.part_path).st_ino == os.fstat(fd).st_ino:
+                    self._fd = fd
+                    return self
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    @classmethod
+    def session(cls) -> requests.Session:
+        """Keep-alive session of the calling thread."""
+        session = getattr(cls._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=Config.DOWNLOAD_SEGMENT_WORKERS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            cls._local.session = session
+        return session
+
+    def probe(self) -> Dict[str, Any]:
+        """
+        Find out size, range support and validators of the URL.
+
+        Returns:
+            Dict with url (after redirects), size, ranges, etag and last_modified
+        """
+        response = self.session().head(self.url, allow_redirects=True, timeout=Config.DOWNLOAD_TIMEOUT)
+        if response.status_code >= 400:
+            # Some servers reject HEAD; ask for the first byte instead
+            response = self.session().get(
+                self.url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=Config.DOWNLOAD_TIMEOUT
+            )
+            response.close()
+            response.raise_for_status()
+
+        headers = response.headers
+        size = None
+        ranges = headers.get('Accept-Ranges', '').lower() == 'bytes'
+        if response.status_code == 206 and '/' in headers.get('Content-Range', ''):
+            total = headers['Content-Range'].rsplit('/', 1)[1]
+            size = int(total) if total.isdigit() else None
+            ranges = True
+        elif headers.get('Content-Length', '').isdigit():
+            size = int(headers['Content-Length'])
+
+        self.content_type = headers.get('Content-Type', '')
+        self.size = size
+        return {
+            'url': response.url,
+            'size': size,
+            'ranges': ranges and bool(size),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified')
+        }
+
+    def download(self, probe: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """
+        Fetch the URL into :attr:`part_path`.
+
+        Args:
+            probe: Result of :meth:`probe`, probed here if omitted
+
+        Returns:
+            Hex BLAKE2b digest when the file was streamed sequentially, None
+            when it was assembled out of order and still needs hashing
+
+        Raises:
+            DownloadError: If a segment keeps failing
+        """
+        probe = probe or self.probe()
+        started = time.monotonic()
+        digest = None
+        if probe['ranges'] and probe['size'] > Config.DOWNLOAD_SEGMENT_SIZE:
+            try:
+                self._download_segments(probe)
+            except RangeIgnored:
+                # The file changed since the probe: start over with one stream
+                if os.path.exists(self.state_path):
+                    os.remove(self.state_path)
+                with self._lock:
+                    self._received = 0
+                self.size = None
+                digest = self._download_stream(probe)
+        else:
+            digest = self._download_stream(probe)
+        # Only bytes fetched now count; resumed segments were already on disk
+        DOWNLOAD_THROUGHPUT.observe(self._written / max(time.monotonic() - started, 1e-3), source='direct')
+        return digest
+
+    def _download_stream(self, probe: Dict[str, Any]) -> str:
+        from .content_store import ContentStore
+
+        digest = ContentStore.new_hash()
+        os.ftruncate(self._fd, 0)
+        with self.session().get(probe['url'], stream=True, timeout=Config.DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            position = 0
+            for block in response.iter_content(chunk_size=self.BLOCK_SIZE):
+                if block:
+                    digest.update(block)
+                    self._write_at(block, position)
+                    position += len(block)
+        return digest.hexdigest()
+
+    def _download_segments(self, probe: Dict[str, Any]) -> None:
+        size = probe['size']
+        segment_size = Config.DOWNLOAD_SEGMENT_SIZE
+        state = self._load_state(probe, segment_size)
+        done = set(state['done'])
+
+        if not done or os.fstat(self._fd).st_size != size:
+            done.clear()
+            os.ftruncate(self._fd, 0)
+            try:
+                os.posix_fallocate(self._fd, 0, size)
+            except (AttributeError, OSError):
+                os.ftruncate(self._fd, size)
+
+        segments = [
+            (index, start, min(start + segment_size, size))
+            for index, start in enumerate(range(0, size, segment_size))
+        ]
+        self._advance(sum(end - start for index, start, end in segments if index in done))
+
+        pending = [(index, start, end) for index, start, end in segments if index not in done]
+        futures = [
+            self._executor.submit(self._fetch_segment, probe, start, end)
+            for _, start, end in pending
+        ]
+        errors: List[Exception] = []
+        for (index, _, _), future in zip(pending, futures):
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            done.add(index)
+            state['done'] = sorted(done)
+            self._save_state(state)
+
+        cancelled = [e for e in errors if isinstance(e, DownloadCancelled)]
+        if cancelled:
+            raise cancelled[0]
+        ignored = [e for e in errors if isinstance(e, RangeIgnored)]
+        if ignored:
+            raise ignored[0]
+        if errors:
+            raise DownloadError(f'{len(errors)} segment(s) failed, retry to resume: {errors[0]}')
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def _fetch_segment(self, probe: Dict[str, Any], start: int, end: int) -> None:
+        headers = {}
+        validator = self._validator(probe)
+        if validator:
+            # A changed file answers 200 with the whole body instead of our range
+            headers['If-Range'] = validator
+
+        position = start
+        for attempt in range(self.RETRIES):
+            if self._cancelled.is_set():
+                raise DownloadCancelled('Download cancelled')
+            try:
+                headers['Range'] = f'bytes={position}-{end - 1}'
+                with self.session().get(probe['url'], headers=headers, stream=True,
+                                        timeout=Config.DOWNLOAD_TIMEOUT) as response:
+                    # Server errors are retried; a 200 means the range was ignored
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise RangeIgnored(f'Server ignored the range request (HTTP {response.status_code})')
+                    for block in response.iter_content(chunk_size=self.BLOCK_SIZE):
+                        block = block[:end - position]
+                        self._write_at(block, position)
+                        position += len(block)
+                        if position >= end:
+                            return
+                if position >= end:
+                    return
+                raise DownloadError('Segment ended early')
+            except DownloadError:
+                raise
+            except requests.RequestException:
+                if attempt == self.RETRIES - 1:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def _write_at(self, data: bytes, position: int) -> None:
+        view = memoryview(data)
+        while view:
+            count = os.pwrite(self._fd, view, position)
+            view = view[count:]
+            position += count
+        with self._lock:
+            self._written += len(data)
+        DOWNLOADED_BYTES.inc(len(data), source='direct')
+        self._advance(len(data))
+
+    def _advance(self, count: int) -> None:
+        with self._lock:
+            self._received += count
+            received = self._received
+        if self.on_progress and self.on_progress(received, self.size) is False:
+            self._cancelled.set()
+        if self._cancelled.is_set():
+            raise DownloadCancelled('Download cancelled')
+
+    def _load_state(self, probe: Dict[str, Any], segment_size: int) -> Dict[str, Any]:
+        fresh = {
+            'url': self.url,
+            'size': probe['size'],
+            'etag': probe['etag'],
+            'last_modified': probe['last_modified'],
+            'segment_size': segment_size,
+            'done': []
+        }
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return fresh
+
+        # Resume only if the remote file is provably the same one
+        same = all(state.get(k) == fresh[k] for k in ('url', 'size', 'etag', 'last_modified', 'segment_size'))
+        if not same or not self._validator(probe):
+            return fresh
+        return state
+
+    @staticmethod
+    def _validator(probe: Dict[str, Any]) -> Optional[str]:
+        """
+        Validator proving the remote file unchanged: a strong ETag, else
+        Last-Modified. If-Range does not accept weak ETags (RFC 9110), and
+        they do not promise byte-identical content anyway.
+        """
+        etag = probe['etag']
+        if etag and not etag.startswith('W/'):
+            return etag
+        return probe['last_modified']
+
+    def _save_state(self, state: Dict[str, Any]) -> None:
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
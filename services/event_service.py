@@ -0,0 +1,198 @@
+"""Event service for pushing live stream updates to connected viewers."""
+
+from typing import Any, Dict, Optional, Set
+from flask import Flask
+import json
+import queue
+import threading
+import time
+
+from config import Config
+from utils import LiveStreamManager
+from .comment_feed import CommentFeed
+from .stream_service import StreamService
+
+
+class Subscription:
+    """Queue of pending events for one connected viewer."""
+
+    MAX_PENDING = 100
+
+    def __init__(self, poller: 'BroadcastPoller'):
+        self.poller = poller
+        self.queue: queue.Queue = queue.Queue(maxsize=self.MAX_PENDING)
+
+    def push(self, event: str, data: Dict[str, Any]) -> None:
+        """Queue an event, resyncing the viewer if it has fallen behind."""
+        try:
+            self.queue.put_nowait((event, data))
+        except queue.Full:
+            # Slow client: drop the backlog and start over from a snapshot
+            while not self.queue.empty():
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait(('snapshot', self.poller.snapshot()))
+
+    def get(self, timeout: float) -> Optional[tuple]:
+        """Wait for the next event, returning None on timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class BroadcastPoller(threading.Thread):
+    """Poll one broadcast and fan out changes to its subscribers."""
+
+    def __init__(self, app: Flask, key: str, session_id: str):
+        super().__init__(name=f'stream-events-{key}', daemon=True)
+        self.app = app
+        self.key = key
+        self.session_id = session_id
+        self.subscribers: Set[Subscription] = set()
+        self._state: Optional[Dict[str, Any]] = None
+        self._feed: Optional[CommentFeed] = None
+
+    def snapshot(self, since: Optional[int] = None) -> Dict[str, Any]:
+        """View of the broadcast for newly connected or resyncing viewers."""
+        state = self._state or {}
+        return {
+            'broadcast_id': state.get('broadcast_id'),
+            'viewer_count': state.get('viewer_count', 0),
+            'comment_count': state.get('comment_count', 0),
+            'cursor': state.get('cursor', 0),
+            'comments': self._feed.since(since) if self._feed else []
+        }
+
+    def run(self) -> None:
+        while True:
+            with StreamEventHub._lock:
+                if not self.subscribers:
+                    StreamEventHub._pollers.pop(self.key, None)
+                    return
+
+            if not LiveStreamManager.is_active(self.session_id):
+                with StreamEventHub._lock:
+                    StreamEventHub._pollers.pop(self.key, None)
+                    subscribers = list(self.subscribers)
+                for subscription in subscribers:
+                    subscription.push('end', {'broadcast_id': self.key})
+                return
+
+            try:
+                with self.app.app_context():
+                    live_instance = LiveStreamManager.get_instance(self.session_id)
+                    cursor = self._state['cursor'] if self._state else None
+                    result = StreamService.get_stream_info(live_instance, since=cursor)
+                if result['success']:
+                    self._feed = StreamService.get_comment_feed(live_instance)
+                    self._apply(result['data'])
+            except Exception as e:
+                self.app.logger.error(f"Stream events poll error: {str(e)}")
+
+            time.sleep(Config.STREAM_EVENTS_INTERVAL)
+
+    def _apply(self, data: Dict[str, Any]) -> None:
+        """Diff fresh stream info against the last state and publish deltas."""
+        previous = self._state
+        self._state = data
+
+        if previous is None:
+            self._broadcast('snapshot', self.snapshot())
+            return
+
+        if (data['viewer_count'] != previous['viewer_count']
+                or data['comment_count'] != previous['comment_count']):
+            self._broadcast('stats', {
+                'viewer_count': data['viewer_count'],
+                'comment_count': data['comment_count']
+            })
+
+        if data['comments']:
+            self._broadcast('comments', {
+                'comments': data['comments'],
+                'cursor': data['cursor']
+            })
+
+    def _broadcast(self, event: str, data: Dict[str, Any]) -> None:
+        with StreamEventHub._lock:
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            subscription.push(event, data)
+
+
+class StreamEventHub:
+    """Run one poller per broadcast, shared by all of its viewers."""
+
+    _pollers: Dict[str, BroadcastPoller] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def subscribe(
+        cls,
+        app: Flask,
+        key: str,
+        session_id: str,
+        since: Optional[int] = None
+    ) -> Subscription:
+        """
+        Subscribe to updates for a broadcast, starting its poller if needed.
+
+        Args:
+            app: Flask application used for the poller's app context
+            key: Broadcast key (broadcast id, or session id as fallback)
+            session_id: Session owning the live stream instance
+            since: Comment cursor the viewer already has (on reconnect)
+
+        Returns:
+            Subscription to read events from
+        """
+        with cls._lock:
+            poller = cls._pollers.get(key)
+            start = poller is None
+            if start:
+                poller = BroadcastPoller(app, key, session_id)
+                cls._pollers[key] = poller
+            subscription = Subscription(poller)
+            poller.subscribers.add(subscription)
+            has_state = poller._state is not None
+
+        if has_state:
+            subscription.push('snapshot', poller.snapshot(since))
+        if start:
+            poller.start()
+        return subscription
+
+    @classmethod
+    def unsubscribe(cls, subscription: Subscription) -> None:
+        """Detach a viewer; the poller exits once nobody is listening."""
+        with cls._lock:
+            subscription.poller.subscribers.discard(subscription)
+
+    @staticmethod
+    def format_event(event: str, data: Dict[str, Any]) -> str:
+        """Encode an event in text/event-stream format."""
+        # The comment cursor doubles as the event id, so a reconnecting
+        # EventSource resumes from it via Last-Event-ID.
+        event_id = f"id: {data['cursor']}\n" if 'cursor' in data else ''
+        return f"{event_id}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    @classmethod
+    def stream(cls, subscription: Subscription):
+        """Yield encoded events for a subscription until the broadcast ends."""
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                item = subscription.get(timeout=Config.STREAM_EVENTS_KEEPALIVE)
+                if item is None:
+                    yield ': keep-alive\n\n'
+                    continue
+
+                event, data = item
+                yield cls.format_event(event, data)
+                if event == 'end':
+                    break
+        finally:
+            cls.unsubscribe(subscription)
@@ -0,0 +1,198 @@
+"""Helpers for the ffmpeg process pushing video to Instagram."""
+
+from typing import Any, Dict, List, Optional, Tuple
+import os
+import re
+import subprocess
+import threading
+import time
+
+
+class IngestWatcher:
+    """
+    Drain an ingest ffmpeg process's stderr and detect when frames flow.
+
+    ffmpeg is spawned with its stderr on a pipe; if nobody reads it the
+    pipe fills up and ffmpeg blocks mid-stream, so the watcher keeps it
+    drained for the lifetime of the process. The latest progress line
+    (``frame= ... fps= ... bitrate= ... drop= ... speed=``) is parsed on
+    the way, for IngestTelemetry.
+    """
+
+    PROGRESS_MARKERS = (b'frame=', b'size=')
+    PROGRESS_FIELD = re.compile(rb'(frame|fps|bitrate|drop|dup|speed|time)=\s*(\S+)')
+    TAIL_BYTES = 4096
+
+    def __init__(self, process: Any):
+        self.process = process
+        self.started = threading.Event()
+        self.progress: Dict[str, Optional[float]] = {}
+        self.progress_at: Optional[float] = None
+        self._tail = bytearray()
+        self._thread = threading.Thread(
+            target=self._drain,
+            name=f'ingest-watch-{process.pid}',
+            daemon=True
+        )
+        self._thread.start()
+
+    def wait_started(self, timeout: float) -> bool:
+        """
+        Wait until ffmpeg reports encoding progress.
+
+        Args:
+            timeout: Maximum seconds to wait
+
+        Returns:
+            True once frames are flowing, False if ffmpeg exited or timed out
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.started.wait(0.25):
+                return True
+            if self.process.poll() is not None:
+                return self.started.is_set()
+        return False
+
+    @property
+    def last_output(self) -> str:
+        """Last non-empty line ffmpeg wrote, useful in error messages."""
+        lines = bytes(self._tail).replace(b'\r', b'\n').split(b'\n')
+        for line in reversed(lines):
+            if line.strip():
+                return line.strip().decode('utf-8', errors='replace')
+        return ''
+
+    def _drain(self) -> None:
+        stream = self.process.stderr
+        if stream is None:
+            return
+
+        fd = stream.fileno()
+        while True:
+            try:
+                chunk = os.read(fd, 4096)
+            except OSError:
+                break
+            if not chunk:
+                break
+
+            self._tail.extend(chunk)
+            del self._tail[:-self.TAIL_BYTES]
+            if not self.started.is_set() and any(m in self._tail for m in self.PROGRESS_MARKERS):
+                self.started.set()
+            if self.started.is_set():
+                self._parse_progress()
+
+    def _parse_progress(self) -> None:
+        """Keep the fields of the last complete progress line."""
+        # The last segment may still be cut off mid-line
+        for line in reversed(re.split(rb'[\r\n]', bytes(self._tail))[:-1]):
+            fields = dict(self.PROGRESS_FIELD.findall(line))
+            if b'frame' in fields or b'time' in fields:
+                break
+        else:
+            return
+
+        progress = {
+            'frame': _progress_number(fields.get(b'frame'), int),
+            'fps': _progress_number(fields.get(b'fps'), float),
+            'bitrate_kbps': _progress_number(fields.get(b'bitrate', b'').replace(b'kbits/s', b''), float),
+            'dropped_frames': _progress_number(fields.get(b'drop'), int),
+            'duplicated_frames': _progress_number(fields.get(b'dup'), int),
+            'speed': _progress_number(fields.get(b'speed', b'').rstrip(b'x'), float),
+            'media_time': _progress_time(fields.get(b'time'))
+        }
+        if progress != self.progress:
+            self.progress = progress
+            self.progress_at = time.monotonic()
+
+
+def _progress_number(value: Optional[bytes], kind: type) -> Optional[Any]:
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        # 'N/A' before the first packet, or absent in stream-copy mode
+        return None
+
+
+def _progress_time(value: Optional[bytes]) -> Optional[float]:
+    """Seconds from an ffmpeg ``HH:MM:SS.ms`` timestamp."""
+    try:
+        hours, minutes, seconds = value.split(b':')
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except (AttributeError, ValueError):
+        return None
+
+
+def spawn_copy_ingest(video: str, url: str) -> subprocess.Popen:
+    """
+    Push an already ingest-ready file to Instagram without re-encoding.
+
+    Only for files the preparation stage wrote (H.264/yuv420p video, AAC
+    44.1 kHz stereo audio); anything else must go through pygramcl's
+    transcoding ``Video.stream``.
+
+    Args:
+        video: Prepared MP4 file
+        url: RTMP upload URL of the broadcast
+
+    Returns:
+        The ffmpeg process, with stdout and stderr on pipes
+    """
+    command = [
+        'ffmpeg', '-re',
+        '-i', video,
+        '-map', '0:v:0', '-map', '0:a:0?',
+        '-c', 'copy',
+        '-f', 'flv',
+        url
+    ]
+    return subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def spawn_playlist_ingest(items: List[Tuple[str, Optional[float]]], url: str,
+                          codec_args: List[str]) -> subprocess.Popen:
+    """
+    Push several videos to Instagram back to back through one ffmpeg process.
+
+    The videos are joined by ffmpeg's concat demuxer, so the broadcast sees
+    one continuous stream with no reconnect between them. The concat script
+    is written to ffmpeg's stdin, so no list file is left behind.
+
+    Args:
+        items: Path of each video and the seconds to play of it (None for all)
+        url: RTMP upload URL of the broadcast
+        codec_args: ``-c copy`` for prepared videos with identical stream
+            parameters, otherwise arguments encoding one uniform stream
+
+    Returns:
+        The ffmpeg process, with stdout and stderr on pipes
+    """
+    script = ['ffconcat version 1.0']
+    for path, duration in items:
+        escaped = path.replace("'", "'\\''")
+        script.append(f"file '{escaped}'")
+        if duration:
+            script.append(f'outpoint {duration:.3f}')
+
+    command = [
+        'ffmpeg', '-re',
+        '-f', 'concat', '-safe', '0',
+        '-protocol_whitelist', 'file,pipe',
+        '-i', 'pipe:0',
+        '-map', '0:v:0', '-map', '0:a:0?',
+        *codec_args,
+        '-f', 'flv',
+        url
+    ]
+    process = subprocess.Popen(
+        command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    try:
+        process.stdin.write(('\n'.join(script) + '\n').encode('utf-8'))
+        process.stdin.close()
+    except OSError:
+        # ffmpeg exited right away; the ingest watcher reports why
+        pass
+    return process
@@ -0,0 +1,142 @@
+"""Background job execution with pollable status."""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, NamedTuple, Optional
+from flask import current_app, has_app_context
+import time
+import uuid
+
+from config import Config
+from helpers import get_state_backend
+
+
+class JobOutcome(NamedTuple):
+    """Final status, message and result of a job, stored in one write."""
+
+    status: str
+    message: Optional[str] = None
+    result: Any = None
+
+
+class JobManager:
+    """
+    Run jobs on a bounded thread pool and keep their status for polling.
+
+    A job function is called as ``fn(job_id, *args, **kwargs)`` and reports
+    progress through :meth:`update`. Whatever it returns is stored as the
+    job's ``result``; a returned :class:`JobOutcome` also sets the final
+    status and message in the same write, so a poller never sees the final
+    status without its result. An exception marks the job ``failed``. Job
+    state is kept in the shared state backend, so any worker can answer a
+    poll.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.namespace = f'jobs:{name}'
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=f'{name}-job'
+        )
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> str:
+        """
+        Queue a job for execution.
+
+        Args:
+            fn: Job function, receives the job id as first argument
+            *args: Positional arguments for fn
+            **kwargs: Keyword arguments for fn
+
+        Returns:
+            Job id
+        """
+        job_id = self.create()
+        self.run(job_id, fn, *args, **kwargs)
+        return job_id
+
+    def create(self, status: str = 'pending') -> str:
+        """
+        Register a job that is started later with :meth:`run`.
+
+        Args:
+            status: Initial status reported to pollers
+
+        Returns:
+            Job id
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        get_state_backend().set(self.namespace, job_id, {
+            'id': job_id,
+            'status': status,
+            'message': None,
+            'result': None,
+            'done': False,
+            'created_at': now,
+            'updated_at': now
+        })
+        return job_id
+
+    def run(self, job_id: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+        """Queue execution of a job registered with :meth:`create`."""
+        app = current_app._get_current_object() if has_app_context() else None
+        self._executor.submit(self._run, app, job_id, fn, args, kwargs)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the job's state, or None if unknown."""
+        if not job_id:
+            return None
+        return get_state_backend().get(self.namespace, job_id)
+
+    def update(self, job_id: str, **fields: Any) -> Optional[Dict[str, Any]]:
+        """Merge fields into the job's state; returns the new state or None."""
+        return get_state_backend().update(self.namespace, job_id, updated_at=time.time(), **fields)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Ask a running job to stop.
+
+        Job functions that support cancellation poll ``cancel_requested``;
+        one that cannot stop at the moment sets ``cancellable`` to False.
+
+        Args:
+            job_id: Id of the job
+
+        Returns:
+            True if the job exists, had not finished yet and can be cancelled
+        """
+        def request_cancel(job: Dict[str, Any]) -> Dict[str, Any]:
+            if not job['done'] and job.get('cancellable', True):
+                job['cancel_requested'] = True
+            return job
+
+        job = get_state_backend().modify(self.namespace, job_id, request_cancel)
+        return bool(job and job.get('cancel_requested') and not job['done'])
+
+    def finish(self, job_id: str, outcome: JobOutcome) -> None:
+        """Finish a job with its outcome, e.g. one cancelled before it ran."""
+        self._finish(job_id, status=outcome.status, message=outcome.message, result=outcome.result)
+
+    def _finish(self, job_id: str, **fields: Any) -> None:
+        """Mark the job done and let it expire after the retention period."""
+        backend = get_state_backend()
+        job = backend.update(self.namespace, job_id, done=True, updated_at=time.time(), **fields)
+        if job:
+            backend.set(self.namespace, job_id, job, ttl=Config.JOB_RETENTION_SECONDS)
+
+    def _run(self, app: Any, job_id: str, fn: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        try:
+            if app is not None:
+                with app.app_context():
+                    result = fn(job_id, *args, **kwargs)
+            else:
+                result = fn(job_id, *args, **kwargs)
+            if isinstance(result, JobOutcome):
+                self.finish(job_id, result)
+            else:
+                self._finish(job_id, result=result)
+        except Exception as e:
+            if app is not None:
+                app.logger.error(f"{self.name} job {job_id} failed: {str(e)}", exc_info=True)
+            self._finish(job_id, status='failed', message=str(e))
@@ -0,0 +1,302 @@
+"""Preparation of library videos into an ingest-ready format."""
+
+from typing import Any, Dict, List, Optional, Tuple
+from flask import current_app
+import os
+import subprocess
+
+from config import Config
+from helpers import MediaProbe, VideoLibrary, probe_media
+from .content_store import ContentStore
+from .job_service import JobManager, JobOutcome
+
+
+class PrepareService:
+    """
+    Convert library videos ahead of time into what the ingest pushes.
+
+    Instagram takes H.264 (yuv420p) video with AAC 44.1 kHz stereo audio
+    over FLV. Without preparation every broadcast transcodes its source in
+    real time. After a video enters the library it is probed and written
+    to ``UPLOAD_FOLDER/.prepared/<digest>.mp4``: streams that already match
+    the profile, video with a keyframe at least every KEYFRAME_SECONDS,
+    are copied, only the others are re-encoded. Broadcasts of a
+    prepared video then push it with ``-c copy``. Prepared files are keyed
+    by content digest, so duplicates share them.
+    """
+
+    PREPARED_DIR = '.prepared'
+    AUDIO_BITRATE = '128k'
+    AUDIO_RATE = 44100
+    AUDIO_CHANNELS = 2
+    KEYFRAME_SECONDS = 2
+    PLAYLIST_FPS = 30
+    # Stream parameters prepared files must share to be concatenated with -c copy
+    STREAM_LAYOUT = (
+        'video_codec', 'profile', 'level', 'pix_fmt', 'width', 'height', 'fps',
+        'audio_codec', 'sample_rate', 'channels'
+    )
+
+    jobs = JobManager('prepare', Config.PREPARE_WORKERS)
+
+    @staticmethod
+    def schedule(filename: str) -> Optional[str]:
+        """
+        Queue preparation of a library video; never raises.
+
+        Args:
+            filename: Video in the upload folder
+
+        Returns:
+            Job id, or None if it could not be queued
+        """
+        try:
+            VideoLibrary.annotate(filename, prepared='pending')
+            return PrepareService.jobs.submit(PrepareService.run_prepare_job, filename)
+        except Exception as e:
+            current_app.logger.error(f"Prepare schedule error: {str(e)}")
+            return None
+
+    @staticmethod
+    def run_prepare_job(job_id: str, filename: str) -> JobOutcome:
+        """
+        Prepare a video as a background job.
+
+        The job moves through pending -> preparing -> done, or failed. The
+        outcome is also recorded as ``prepared`` (ready / failed) on the
+        library entry.
+
+        Args:
+            job_id: Id of the job in PrepareService.jobs
+            filename: Video in the upload folder
+
+        Returns:
+            Outcome whose result is a dict with the preparation mode, or
+            empty on failure
+        """
+        PrepareService.jobs.update(job_id, status='preparing')
+        result = PrepareService.prepare(filename)
+        if not result['success']:
+            VideoLibrary.annotate(filename, prepared='failed')
+            return JobOutcome('failed', result['message'], {})
+
+        return JobOutcome('done', result['message'], {'mode': result['mode']})
+
+    @staticmethod
+    def prepare(filename: str) -> Dict[str, Any]:
+        """
+        Write the ingest-ready copy of a library video, if not done already.
+
+        Args:
+            filename: Video in the upload folder
+
+        Returns:
+            Dict with success status and mode (cached, remux, transcode) or error message
+        """
+        try:
+            path = os.path.join(Config.UPLOAD_FOLDER, filename)
+            entry = VideoLibrary.get(filename) or {}
+            digest = entry.get('digest') or ContentStore.hash_file(path)
+            output = PrepareService._output_path(digest)
+
+            if os.path.exists(output):
+                mode = 'cached'
+            else:
+                info = MediaProbe.get(filename)
+                if not info or not info['video_codec']:
+                    return {'success': False, 'message': 'No video stream found'}
+
+                codec_args, mode = PrepareService.plan(info)
+                os.makedirs(os.path.dirname(output), exist_ok=True)
+                tmp_path = f'{output}.{os.getpid()}.tmp.mp4'
+                command = [
+                    'ffmpeg', '-y', '-v', 'error',
+                    '-i', path,
+                    '-map', '0:v:0', '-map', '0:a:0?',
+                    *codec_args,
+                    # Index up front so the ingest can start reading immediately
+                    '-movflags', '+faststart',
+                    tmp_path
+                ]
+                completed = subprocess.run(command, capture_output=True, text=True)
+                if completed.returncode != 0:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    detail = completed.stderr.strip().splitlines()[-1:] or ['ffmpeg failed']
+                    return {'success': False, 'message': f'Preparation failed: {detail[0]}'}
+                os.replace(tmp_path, output)
+
+            VideoLibrary.annotate(filename, digest=digest, prepared='ready')
+            return {
+                'success': True,
+                'message': f'Video prepared ({mode})',
+                'mode': mode
+            }
+
+        except Exception as e:
+            current_app.logger.error(f"Prepare error: {str(e)}")
+            return {
+                'success': False,
+                'message': f'Preparation failed: {str(e)}'
+            }
+
+    @staticmethod
+    def prepared_path(filename: str) -> Optional[str]:
+        """Ingest-ready copy of a library video, or None if it has none yet."""
+        entry = VideoLibrary.get(filename)
+        if not entry or entry.get('prepared') != 'ready' or not entry.get('digest'):
+            return None
+        path = PrepareService._output_path(entry['digest'])
+        return path if os.path.exists(path) else None
+
+    @staticmethod
+    def plan(info: Dict[str, Any]) -> Tuple[List[str], str]:
+        """
+        Choose per-stream codec arguments for a probed video.
+
+        Args:
+            info: Media properties from MediaProbe
+
+        Returns:
+            Tuple of ffmpeg codec arguments and mode (remux or transcode)
+        """
+        bitrate = Config.PREPARE_VIDEO_BITRATE
+        largest = Config.PREPARE_MAX_DIMENSION
+        # Allow a frame of jitter around the keyframe interval; unknown means re-encode
+        gop = info.get('keyframe_interval')
+        gop_limit = PrepareService.KEYFRAME_SECONDS + 1 / (info['fps'] or PrepareService.PLAYLIST_FPS)
+        video_ok = (
+            info['video_codec'] == 'h264'
+            and info['pix_fmt'] == 'yuv420p'
+            and max(info['width'] or 0, info['height'] or 0) <= largest
+            and (info['video_bit_rate'] or 0) <= bitrate * 1000 * 1.5
+            and gop is not None and gop <= gop_limit
+        )
+        audio_ok = info['audio_codec'] is None or (
+            info['audio_codec'] == 'aac'
+            and info['sample_rate'] == PrepareService.AUDIO_RATE
+            and info['channels'] == PrepareService.AUDIO_CHANNELS
+        )
+
+        if video_ok:
+            args = ['-c:v', 'copy']
+        else:
+            args = [
+                '-c:v', 'libx264',
+                '-preset', Config.PREPARE_PRESET,
+                '-b:v', f'{bitrate}k',
+                '-maxrate', f'{bitrate}k',
+                '-bufsize', f'{bitrate * 2}k',
+                '-pix_fmt', 'yuv420p',
+                # Cap the long side, keep the aspect ratio and even dimensions
+                '-vf', (
+                    f"scale=w='if(gte(iw,ih),min({largest},iw),-2)'"
+                    f":h='if(gte(iw,ih),-2,min({largest},ih))'"
+                ),
+                '-force_key_frames', f'expr:gte(t,n_forced*{PrepareService.KEYFRAME_SECONDS})'
+            ]
+
+        if audio_ok:
+            args += ['-c:a', 'copy']
+        else:
+            args += [
+                '-c:a', 'aac',
+                '-b:a', PrepareService.AUDIO_BITRATE,
+                '-ar', str(PrepareService.AUDIO_RATE),
+                '-ac', str(PrepareService.AUDIO_CHANNELS)
+            ]
+
+        return args, 'remux' if video_ok and audio_ok else 'transcode'
+
+    @staticmethod
+    def playlist_plan(filenames: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Choose sources and codec arguments to play videos back to back in one ingest.
+
+        The concat demuxer only stream-copies files whose streams match
+        exactly. When every video has a prepared copy and the copies agree
+        on STREAM_LAYOUT (H.264 profile and level included: remuxed copies
+        keep their source's), those are pushed with ``-c copy``. Otherwise
+        the playlist is encoded once into a uniform stream: frame size of the
+        first video, padded to fit, at PLAYLIST_FPS.
+
+        Args:
+            filenames: Videos in the upload folder, in play order
+
+        Returns:
+            Tuple of the file path per video and ffmpeg codec arguments
+        """
+        prepared = [PrepareService.prepared_path(filename) for filename in filenames]
+        if all(prepared):
+            layouts = {
+                tuple((probe_media(path) or {}).get(key) for key in PrepareService.STREAM_LAYOUT)
+                for path in set(prepared)
+            }
+            if len(layouts) == 1 and next(iter(layouts))[0]:
+                return prepared, ['-c', 'copy']
+
+        sources = [
+            path or os.path.join(Config.UPLOAD_FOLDER, filename)
+            for path, filename in zip(prepared, filenames)
+        ]
+        width, height = PrepareService._frame_size(MediaProbe.get(filenames[0]) or {})
+        bitrate = Config.PREPARE_VIDEO_BITRATE
+        args = [
+            '-c:v', 'libx264',
+            '-preset', Config.PREPARE_PRESET,
+            '-b:v', f'{bitrate}k',
+            '-maxrate', f'{bitrate}k',
+            '-bufsize', f'{bitrate * 2}k',
+            '-pix_fmt', 'yuv420p',
+            # The encoder cannot change frame size mid-stream: fit every video into one frame
+            '-vf', (
+                f'scale={width}:{height}:force_original_aspect_ratio=decrease,'
+                f'pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,'
+                f'fps={PrepareService.PLAYLIST_FPS}'
+            ),
+            '-force_key_frames', f'expr:gte(t,n_forced*{PrepareService.KEYFRAME_SECONDS})',
+            '-c:a', 'aac',
+            '-b:a', PrepareService.AUDIO_BITRATE,
+            '-ar', str(PrepareService.AUDIO_RATE),
+            '-ac', str(PrepareService.AUDIO_CHANNELS),
+            # Keep audio in step with video across the joins
+            '-af', 'aresample=async=1'
+        ]
+        return sources, args
+
+    @staticmethod
+    def collect() -> int:
+        """Remove prepared files no library video refers to anymore."""
+        root = os.path.join(Config.UPLOAD_FOLDER, PrepareService.PREPARED_DIR)
+        if not os.path.isdir(root):
+            return 0
+
+        live = {e.get('digest') for e in VideoLibrary.page()['items']}
+        removed = 0
+        for entry in os.scandir(root):
+            # Loop files of running broadcasts are named after the digest too
+            digest = entry.name.split('.', 1)[0].split('_', 1)[0]
+            # Temp files of running jobs carry the pid; leave those alone
+            if digest in live or '.tmp' in entry.name:
+                continue
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except OSError:
+                continue
+        return removed
+
+    @staticmethod
+    def _frame_size(info: Dict[str, Any]) -> Tuple[int, int]:
+        """Even frame size of a video with its long side capped; portrait 9:16 if unknown."""
+        largest = Config.PREPARE_MAX_DIMENSION
+        width, height = info.get('width'), info.get('height')
+        if not width or not height:
+            return largest * 9 // 16 // 2 * 2, largest
+        scale = min(1.0, largest / max(width, height))
+        return int(width * scale) // 2 * 2, int(height * scale) // 2 * 2
+
+    @staticmethod
+    def _output_path(digest: str) -> str:
+        return os.path.join(Config.UPLOAD_FOLDER, PrepareService.PREPARED_DIR, f'{digest}.mp4')
+
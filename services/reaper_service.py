@@ -0,0 +1,255 @@
+"""Background reaper for expired and stale live stream instances."""
+
+from typing import Any, Dict, List, Optional, Tuple
+from flask import Flask
+import heapq
+import itertools
+import threading
+import time
+
+from config import Config
+from helpers.state import get_state_backend
+from utils import LiveStreamManager
+from .admission import StreamAdmission
+from .stream_service import StreamService
+from .upload_service import UploadService
+from .content_store import ContentStore
+from .download_cache import DownloadCache
+from .prepare_service import PrepareService
+from .session_pool import SessionPool
+from .thumbnail_service import ThumbnailService
+
+
+class StreamReaper:
+    """
+    Stop streams when their duration elapses and reap stale instances.
+
+    Stop deadlines live in a min-heap keyed by expiry time, so each wake-up
+    only looks at streams that are actually due. They are also kept in the
+    state backend and loaded again when the reaper starts, so a restart
+    does not leave a stream running past its duration; deadlines of streams
+    stopped early are dropped. A stream whose ingest process exited has
+    its broadcast ended, and inactive instances are reaped through
+    LiveStreamManager's age-ordered inactive index; part
+    files of expired chunked uploads and unreferenced content store objects
+    are removed on the same sweep, as are idle pooled Instagram sessions
+    and pipeline slots whose stream is gone.
+    """
+
+    STOPS_NAMESPACE = 'stream_stops'
+
+    _heap: List[Tuple[float, int, str]] = []
+    _counter = itertools.count()
+    _condition = threading.Condition()
+    _thread: Optional[threading.Thread] = None
+    _app: Optional[Flask] = None
+    _metrics: Dict[str, Any] = {
+        'runs': 0,
+        'auto_stopped': 0,
+        'reaped': 0,
+        'ended_ingests': 0,
+        'stale_records': 0,
+        'stale_uploads': 0,
+        'released_objects': 0,
+        'cache_evictions': 0,
+        'evicted_sessions': 0,
+        'reclaimed_slots': 0,
+        'errors': 0,
+        'last_run_at': None,
+        'last_run_ms': 0.0
+    }
+
+    @classmethod
+    def start(cls, app: Flask) -> None:
+        """Start the reaper thread once per process."""
+        with cls._condition:
+            if cls._thread and cls._thread.is_alive():
+                return
+            cls._app = app
+            for session_id, stop in get_state_backend().items(cls.STOPS_NAMESPACE):
+                heapq.heappush(cls._heap, (stop['expires_at'], next(cls._counter), session_id))
+            cls._thread = threading.Thread(target=cls._run, name='stream-reaper', daemon=True)
+            cls._thread.start()
+
+    @classmethod
+    def schedule_stop(cls, session_id: str, expires_at: float) -> None:
+        """
+        Stop a session's stream at the given time.
+
+        Args:
+            session_id: Session owning the live stream instance
+            expires_at: Unix timestamp at which to stop the stream
+        """
+        record = LiveStreamManager.get_metadata(session_id) or {}
+        get_state_backend().set(
+            cls.STOPS_NAMESPACE, session_id,
+            {'expires_at': expires_at, 'broadcast_id': record.get('broadcast_id')},
+            ttl=max(expires_at - time.time(), 0) + Config.REAPER_INTERVAL * 10
+        )
+        with cls._condition:
+            heapq.heappush(cls._heap, (expires_at, next(cls._counter), session_id))
+            cls._condition.notify()
+
+    @classmethod
+    def cancel_stop(cls, session_id: str) -> None:
+        """Forget a session's stop deadline, e.g. once it was stopped by hand."""
+        get_state_backend().delete(cls.STOPS_NAMESPACE, session_id)
+        with cls._condition:
+            cls._heap = [entry for entry in cls._heap if entry[2] != session_id]
+            heapq.heapify(cls._heap)
+
+    @classmethod
+    def metrics(cls) -> Dict[str, Any]:
+        """Reaper counters and queue depth."""
+        with cls._condition:
+            return {
+                **cls._metrics,
+                'pending_stops': len(cls._heap),
+                'next_stop_in': round(cls._heap[0][0] - time.time(), 1) if cls._heap else None,
+                'running': bool(cls._thread and cls._thread.is_alive())
+            }
+
+    @classmethod
+    def _run(cls) -> None:
+        next_sweep = time.time()
+        while True:
+            with cls._condition:
+                now = time.time()
+                wake_at = next_sweep
+                if cls._heap:
+                    wake_at = min(wake_at, cls._heap[0][0])
+                if wake_at > now:
+                    cls._condition.wait(wake_at - now)
+                    continue
+
+                due = []
+                while cls._heap and cls._heap[0][0] <= now:
+                    due.append(heapq.heappop(cls._heap)[2])
+
+            sweep = now >= next_sweep
+            if sweep:
+                next_sweep = now + Config.REAPER_INTERVAL
+            cls._run_once(due, sweep)
+
+    @classmethod
+    def _mark_ended(cls) -> int:
+        """End the broadcasts of streams of this process whose ffmpeg exited."""
+        ended = 0
+        for session_id in LiveStreamManager.session_ids():
+            live = LiveStreamManager.get_instance(session_id)
+            process = getattr(live, 'live_process', None)
+            if process is None or process.poll() is None:
+                continue
+            # The broadcast stays open on Instagram until it is stopped
+            LiveStreamManager.remove_instance(session_id, stop=StreamService.stop_stream)
+            if LiveStreamManager.get_metadata(session_id) is None:
+                ended += 1
+                cls._app.logger.info(f"Ingest of session {session_id} exited, broadcast ended")
+        return ended
+
+    @classmethod
+    def _prune_stops(cls) -> None:
+        """Drop deadlines of streams that no longer exist."""
+        with cls._condition:
+            session_ids = {entry[2] for entry in cls._heap}
+        gone = {session_id for session_id in session_ids if LiveStreamManager.get_metadata(session_id) is None}
+        if not gone:
+            return
+        backend = get_state_backend()
+        for session_id in gone:
+            backend.delete(cls.STOPS_NAMESPACE, session_id)
+        with cls._condition:
+            cls._heap = [entry for entry in cls._heap if entry[2] not in gone]
+            heapq.heapify(cls._heap)
+
+    @classmethod
+    def _stop_due(cls, session_id: str) -> bool:
+        """Stop a session's stream whose deadline passed; True if it was stopped."""
+        backend = get_state_backend()
+        stop = backend.get(cls.STOPS_NAMESPACE, session_id)
+        if stop is None or stop['expires_at'] > time.time():
+            # Already handled, or pushed back by a later schedule_stop
+            return False
+        record = LiveStreamManager.get_metadata(session_id)
+        if record and record.get('broadcast_id') != stop['broadcast_id']:
+            # The session has started another stream since
+            backend.delete(cls.STOPS_NAMESPACE, session_id)
+            return False
+        # An inactive stream may still hold its broadcast open; stop it all the same
+        if record:
+            LiveStreamManager.remove_instance(session_id, stop=StreamService.stop_stream)
+        if LiveStreamManager.get_metadata(session_id) is not None:
+            # Owned by a worker we cannot reach; its own reaper stops it
+            return False
+        backend.delete(cls.STOPS_NAMESPACE, session_id)
+        return record is not None
+
+    @classmethod
+    def _run_once(cls, due: List[str], sweep: bool) -> None:
+        started = time.perf_counter()
+        auto_stopped = reaped = ended_ingests = stale_records = stale_uploads = released_objects = cache_evictions = evicted_sessions = reclaimed_slots = errors = 0
+
+        with cls._app.app_context():
+            for session_id in due:
+                try:
+                    if cls._stop_due(session_id):
+                        auto_stopped += 1
+                        cls._app.logger.info(f"Auto-stopped stream for session {session_id}")
+                except Exception as e:
+                    errors += 1
+                    cls._app.logger.error(f"Reaper auto-stop error: {str(e)}")
+
+            if sweep:
+                try:
+                    ended_ingests = cls._mark_ended()
+                    stale_records = LiveStreamManager.purge_stale()
+                    cls._prune_stops()
+                    reaped = LiveStreamManager.cleanup_old_instances(
+                        max_age_hours=Config.INACTIVE_INSTANCE_TTL_HOURS,
+                        stop=StreamService.stop_stream
+                    )
+                except Exception as e:
+                    errors += 1
+                    cls._app.logger.error(f"Reaper cleanup error: {str(e)}")
+
+                try:
+                    stale_uploads = UploadService.cleanup_stale_parts()
+                except Exception as e:
+                    errors += 1
+                    cls._app.logger.error(f"Reaper upload cleanup error: {str(e)}")
+
+                try:
+                    cache_evictions = DownloadCache.enforce_budget()
+                    released_objects = ContentStore.collect(keep=DownloadCache.pinned_digests())
+                    PrepareService.collect()
+                    ThumbnailService.collect()
+                except Exception as e:
+                    errors += 1
+                    cls._app.logger.error(f"Reaper content store cleanup error: {str(e)}")
+
+                try:
+                    evicted_sessions = SessionPool.evict_idle()
+                except Exception as e:
+                    errors += 1
+                    cls._app.logger.error(f"Reaper session pool cleanup error: {str(e)}")
+
+                try:
+                    reclaimed_slots = StreamAdmission.reconcile()
+                except Exception as e:
+                    errors += 1
+                    cls._app.logger.error(f"Reaper admission cleanup error: {str(e)}")
+
+        with cls._condition:
+            cls._metrics['runs'] += 1
+            cls._metrics['auto_stopped'] += auto_stopped
+            cls._metrics['reaped'] += reaped
+            cls._metrics['ended_ingests'] += ended_ingests
+            cls._metrics['stale_records'] += stale_records
+            cls._metrics['stale_uploads'] += stale_uploads
+            cls._metrics['released_objects'] += released_objects
+            cls._metrics['cache_evictions'] += cache_evictions
+            cls._metrics['evicted_sessions'] += evicted_sessions
+            cls._metrics['reclaimed_slots'] += reclaimed_slots
+            cls._metrics['errors'] += errors
+            cls._metrics['last_run_at'] = time.time()
+            cls._metrics['last_run_ms'] = round((time.perf_counter() - started) * 1000, 2)
@@ -0,0 +1,373 @@
+"""Scheduled broadcasts that start and play a playlist on their own."""
+
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+from flask import Flask, current_app
+import fcntl
+import heapq
+import itertools
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+from config import Config
+from helpers import VideoLibrary
+from .broadcast_service import BroadcastService
+from .prepare_service import PrepareService
+from .stream_service import StreamService
+
+
+class BroadcastScheduler:
+    """
+    Start broadcasts of a playlist at a set time.
+
+    Schedules are persisted as a JSON snapshot in ``DATA_FOLDER``, so they
+    survive restarts; it holds the account cookies, so it is only readable
+    by the app's user. One process, the holder of an exclusive lock next to
+    the snapshot, runs the scheduler thread; other workers only write the
+    snapshot, which the leader picks up within SCHEDULE_POLL_INTERVAL.
+
+    Each schedule has one pending step at ``due_at``, kept in a min-heap
+    like the reaper's stop deadlines: pre-warming SCHEDULE_PREWARM_SECONDS
+    before air time (preparing the videos and logging the account in),
+    starting, and then polling the broadcast until it ends. The whole
+    playlist is one broadcast, played gaplessly by a single ffmpeg process.
+    Starts go through BroadcastService, so they are subject to stream
+    admission, and scheduled starts due at the same time are spread
+    SCHEDULE_STAGGER_SECONDS apart.
+    """
+
+    ACTIVE = ('scheduled', 'running')
+
+    _heap: List[Tuple[float, int, str]] = []
+    _counter = itertools.count()
+    _condition = threading.Condition()
+    _thread: Optional[threading.Thread] = None
+    _app: Optional[Flask] = None
+    _leader_file: Optional[IO] = None
+    _snapshot_stat: Optional[Tuple[int, int, int]] = None
+    _last_start = 0.0
+
+    @classmethod
+    def start(cls, app: Flask) -> None:
+        """Start the scheduler thread once per process."""
+        with cls._condition:
+            if cls._thread and cls._thread.is_alive():
+                return
+            cls._app = app
+            cls._thread = threading.Thread(target=cls._run, name='broadcast-scheduler', daemon=True)
+            cls._thread.start()
+
+    @classmethod
+    def create(cls, cookies: str, title: str, playlist: List[Any], start_at: float) -> Dict[str, Any]:
+        """
+        Schedule a playlist to go live at a given time.
+
+        Args:
+            cookies: Instagram session cookies of the account to stream to
+            title: Stream title
+            playlist: Library filenames, or dicts with ``filename`` and an
+                optional ``duration`` in seconds (default: the whole video)
+            start_at: Unix timestamp of the air time
+
+        Returns:
+            Dict with success status and the schedule or error message
+        """
+        try:
+            if start_at < time.time() - Config.SCHEDULE_POLL_INTERVAL:
+                return {'success': False, 'message': 'Start time is in the past'}
+
+            items, error = BroadcastService.normalize_playlist(playlist)
+            if error:
+                return {'success': False, 'message': error}
+
+            account = StreamService.validate_cookies(cookies)
+            if not account['success']:
+                return account
+
+            now = time.time()
+            show = {
+                'id': uuid.uuid4().hex,
+                'account': account['userid'],
+                'username': account['username'],
+                'cookies': cookies,
+                'title': title or Config.DEFAULT_LIVE_TITLE,
+                'playlist': items,
+                'start_at': start_at,
+                'status': 'scheduled',
+                'message': None,
+                'prewarmed': False,
+                'broadcast_id': None,
+                'due_at': start_at - Config.SCHEDULE_PREWARM_SECONDS,
+                'created_at': now,
+                'updated_at': now
+            }
+            with cls._exclusive():
+                shows = cls._read()
+                shows[show['id']] = show
+                cls._write(shows)
+            with cls._condition:
+                cls._condition.notify()
+
+            return {
+                'success': True,
+                'message': 'Broadcast scheduled',
+                'schedule': cls._public(show)
+            }
+
+        except Exception as e:
+            current_app.logger.error(f"Schedule broadcast error: {str(e)}")
+            return {'success': False, 'message': f'Failed to schedule broadcast: {str(e)}'}
+
+    @classmethod
+    def get(cls, schedule_id: str) -> Optional[Dict[str, Any]]:
+        """A schedule without its cookies, or None if unknown."""
+        show = cls._read().get(schedule_id)
+        return cls._public(show) if show else None
+
+    @classmethod
+    def list(cls, account: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Schedules without their cookies, by air time.
+
+        Args:
+            account: Only schedules of this Instagram user id (None for all)
+        """
+        shows = sorted(
+            (show for show in cls._read().values() if account is None or show['account'] == account),
+            key=lambda show: show['start_at']
+        )
+        return [cls._public(show) for show in shows]
+
+    @classmethod
+    def cancel(cls, schedule_id: str) -> Dict[str, Any]:
+        """
+        Cancel a schedule, stopping its broadcast if it is on air.
+
+        Args:
+            schedule_id: Id of the schedule
+
+        Returns:
+            Dict with success status or error message
+        """
+        with cls._exclusive():
+            shows = cls._read()
+            show = shows.get(schedule_id)
+            if not show:
+                return {'success': False, 'message': 'Schedule not found'}
+            if show['status'] not in cls.ACTIVE:
+                return {'success': False, 'message': f"Schedule already {show['status']}"}
+            running = show['broadcast_id'] if show['status'] == 'running' else None
+            show.update(status='cancelled', cookies=None, updated_at=time.time())
+            cls._write(shows)
+
+        if running:
+            BroadcastService.delete(running)
+        return {'success': True, 'message': 'Schedule cancelled'}
+
+    @staticmethod
+    def parse_time(value: Any) -> Optional[float]:
+        """Unix timestamp from a number or an ISO 8601 string (local time if naive), or None."""
+        try:
+            timestamp = float(value)
+        except (TypeError, ValueError):
+            pass
+        else:
+            return timestamp if math.isfinite(timestamp) else None
+        try:
+            return datetime.fromisoformat(str(value).strip()).timestamp()
+        except (ValueError, OverflowError, OSError):
+            return None
+
+    @classmethod
+    def _run(cls) -> None:
+        while True:
+            with cls._condition:
+                if not cls._lead():
+                    cls._condition.wait(Config.SCHEDULE_POLL_INTERVAL)
+                    continue
+
+                cls._reload()
+                now = time.time()
+                wake_at = now + Config.SCHEDULE_POLL_INTERVAL
+                if cls._heap:
+                    wake_at = min(wake_at, cls._heap[0][0])
+                if wake_at > now:
+                    cls._condition.wait(wake_at - now)
+                    continue
+                due_at, _, schedule_id = heapq.heappop(cls._heap)
+
+            try:
+                with cls._app.app_context():
+                    cls._step(schedule_id, due_at)
+            except Exception as e:
+                cls._app.logger.error(f"Scheduler error for {schedule_id}: {str(e)}")
+
+    @classmethod
+    def _step(cls, schedule_id: str, due_at: float) -> None:
+        """Carry out a schedule's pending step, if the heap entry is still current."""
+        show = cls._read().get(schedule_id)
+        if not show or show['status'] not in cls.ACTIVE or show['due_at'] != due_at:
+            return
+
+        now = time.time()
+        poll_at = now + Config.SCHEDULE_POLL_INTERVAL
+        if show['status'] == 'scheduled' and not show['prewarmed']:
+            updates = {'prewarmed': True, 'due_at': max(show['start_at'], now), **cls._prewarm(show)}
+        elif show['status'] == 'scheduled':
+            total = sum(item['duration'] for item in show['playlist'])
+            if now > show['start_at'] + total:
+                updates = {'status': 'failed', 'message': 'Missed its air time'}
+            elif now < cls._last_start + Config.SCHEDULE_STAGGER_SECONDS:
+                updates = {'due_at': cls._last_start + Config.SCHEDULE_STAGGER_SECONDS}
+            else:
+                cls._last_start = now
+                updates = cls._play(show)
+        else:
+            broadcast = BroadcastService.get(show['broadcast_id'])
+            if broadcast and broadcast['status'] not in BroadcastService.FINISHED:
+                updates = {'due_at': poll_at}
+            elif not broadcast:
+                updates = {'status': 'failed', 'message': 'Broadcast was lost in a restart'}
+            elif broadcast['status'] != 'ended':
+                updates = {'status': 'failed', 'message': broadcast['message'] or f"Broadcast {broadcast['status']}"}
+            else:
+                updates = {'status': 'done'}
+
+        cls._commit(schedule_id, updates)
+
+    @classmethod
+    def _prewarm(cls, show: Dict[str, Any]) -> Dict[str, Any]:
+        """Get videos prepared and the account logged in ahead of air time."""
+        for filename in {item['filename'] for item in show['playlist']}:
+            entry = VideoLibrary.get(filename) or {}
+            if entry.get('prepared') not in ('ready', 'pending'):
+                PrepareService.schedule(filename)
+
+        result = StreamService.validate_cookies(show['cookies'])
+        return {} if result['success'] else {'message': f"Cookie check failed: {result['message']}"}
+
+    @classmethod
+    def _play(cls, show: Dict[str, Any]) -> Dict[str, Any]:
+        """Start the broadcast of the playlist."""
+        playlist = show['playlist']
+        result = BroadcastService.create(
+            show['cookies'], playlist[0]['filename'], show['title'],
+            *BroadcastService.split_duration(sum(item['duration'] for item in playlist)),
+            # A single video is looped for its duration like any broadcast
+            playlist=playlist if len(playlist) > 1 else None
+        )
+        if not result['success']:
+            return {'status': 'failed', 'message': result['message']}
+
+        broadcast_id = result['broadcast']['id']
+        return {
+            'status': 'running',
+            'message': None,
+            'broadcast_id': broadcast_id,
+            'due_at': time.time() + Config.SCHEDULE_POLL_INTERVAL
+        }
+
+    @classmethod
+    def _commit(cls, schedule_id: str, updates: Dict[str, Any]) -> None:
+        """Apply a step's outcome, unless the schedule was cancelled meanwhile."""
+        orphan = None
+        with cls._exclusive():
+            shows = cls._read()
+            show = shows.get(schedule_id)
+            if not show:
+                return
+            if show['status'] not in cls.ACTIVE:
+                orphan = updates.get('broadcast_id')
+            else:
+                show.update(updates, updated_at=time.time())
+                if show['status'] not in cls.ACTIVE:
+                    # Finished schedules no longer need the account's cookies
+                    show['cookies'] = None
+                cls._write(shows)
+
+        if orphan:
+            BroadcastService.delete(orphan)
+
+    @classmethod
+    def _lead(cls) -> bool:
+        """Become the process running schedules, if no other process is."""
+        if cls._leader_file:
+            return True
+        os.makedirs(Config.DATA_FOLDER, exist_ok=True)
+        leader_file = open(cls._snapshot_path() + '.leader', 'a')
+        try:
+            fcntl.flock(leader_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            leader_file.close()
+            return False
+        cls._leader_file = leader_file
+        cls._snapshot_stat = None
+        return True
+
+    @classmethod
+    def _reload(cls) -> None:
+        """Rebuild the heap when the snapshot changed; called with the condition held."""
+        try:
+            st = os.stat(cls._snapshot_path())
+        except OSError:
+            return
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if signature == cls._snapshot_stat:
+            return
+
+        cls._snapshot_stat = signature
+        cls._heap = [
+            (show['due_at'], next(cls._counter), show['id'])
+            for show in cls._read().values() if show['status'] in cls.ACTIVE
+        ]
+        heapq.heapify(cls._heap)
+
+    @staticmethod
+    def _public(show: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in show.items() if key != 'cookies'}
+
+    @staticmethod
+    def _snapshot_path() -> str:
+        return os.path.join(Config.DATA_FOLDER, 'schedule.json')
+
+    @staticmethod
+    @contextmanager
+    def _exclusive() -> Iterator[None]:
+        """Serialize snapshot writers across worker processes."""
+        os.makedirs(Config.DATA_FOLDER, exist_ok=True)
+        with open(BroadcastScheduler._snapshot_path() + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read() -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(BroadcastScheduler._snapshot_path(), 'r', encoding='utf-8') as f:
+                return {show['id']: show for show in json.load(f).get('schedules', [])}
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write(shows: Dict[str, Dict[str, Any]]) -> None:
+        # Finished schedules are kept for the job retention period
+        cutoff = time.time() - Config.JOB_RETENTION_SECONDS
+        shows = {
+            schedule_id: show for schedule_id, show in shows.items()
+            if show['status'] in BroadcastScheduler.ACTIVE or show['updated_at'] > cutoff
+        }
+        path = BroadcastScheduler._snapshot_path()
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        # Holds account cookies: readable by the app's user only
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'schedules': list(shows.values())}, f)
+        os.replace(tmp_path, path)
+
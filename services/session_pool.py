@@ -0,0 +1,234 @@
+"""Pool of authenticated pygramcl sessions, one per Instagram account."""
+
+from typing import Any, Callable, Dict, Optional
+from pygramcl import Live, Client
+from pygramcl.parser import Parser
+from pygramcl.utils import Cookie
+from pygramcl.video import Video
+import hashlib
+import requests
+import subprocess
+import threading
+import time
+
+from config import Config
+from helpers import timed_upstream
+from .ingest import spawn_copy_ingest
+
+
+class PooledLive(Live):
+    """Live bound to a pooled client whose account is already known."""
+
+    def __init__(self, client: Client, live_user: Dict[str, Any]):
+        # Live.__init__ would build a new Client and fetch the account again
+        self.client = client
+        self.jazoest = None
+        self.live_user = live_user
+        self.live_time = int(time.time())
+        self.live_info = {
+            'broadcast_id': None,
+            'viewer_count': 0,
+            'comment_count': 0,
+            'comment_users': []
+        }
+        self.live_loop = None
+        self.live_started = False
+        self.live_process = None
+
+    def start(self, video: str, title: Optional[str] = None, hours: int = 0, minutes: int = 0,
+              seconds: int = 0, copy: bool = False,
+              ingest: Optional[Callable[[str], subprocess.Popen]] = None) -> bool:
+        """
+        Create and start the broadcast, then launch ffmpeg on the video.
+
+        Same flow as Live.start; with ``copy`` the video must already be
+        ingest-ready and is pushed without re-encoding. ``ingest``, if
+        given, launches ffmpeg itself from the upload URL instead, and the
+        video is neither looped nor pushed.
+        """
+        try:
+            stream_url = self._create_broadcast(title)['upload_url']
+            if ingest:
+                self.live_process = ingest(stream_url)
+                self.live_started = True
+                return True
+            if hours * 3600 + minutes * 60 + seconds > 0:
+                # Video.loop stream-copies, so a prepared video stays ingest-ready
+                self.live_loop = Video.loop(video, hours, minutes, seconds)
+                video = self.live_loop
+            self.live_process = spawn_copy_ingest(video, stream_url) if copy else Video.stream(video, stream_url)
+            self.live_started = True
+            return True
+        except Exception:
+            return False
+
+    @timed_upstream('stream', 'start')
+    def _create_broadcast(self, title: Optional[str]) -> Dict[str, Any]:
+        """Create and start the broadcast on Instagram; returns the create response."""
+        html = self.client.web_request(method='get', endpoint='?hl=en')
+        data = Parser.data(html.text)
+        response = self.client.web_request(
+            data={
+                'broadcast_message': title or 'LIVE',
+                'internal_only': 'false',
+                'source_type': '203',
+                'visibility': '0',
+                'jazoest': data.get('jazoest')
+            },
+            method='post',
+            endpoint='/api/v1/live/create/?hl=en'
+        )
+        response_json = response.json()
+        broadcast_id = response_json.get('broadcast_id')
+        self.client.web_request(method='post', endpoint=f'/api/v1/live/{broadcast_id}/start/?hl=en')
+        self.jazoest = data.get('jazoest')
+        self.live_info['broadcast_id'] = broadcast_id
+        return response_json
+
+
+class _PooledClient(Client):
+    """
+    Client that gives each thread its own HTTP session.
+
+    One pooled client serves every request thread of its account, but a
+    requests.Session is not safe to share between threads. The account
+    setup (cookies, device, csrf token) is shared; the session and its
+    connection pool are per thread.
+    """
+
+    def __init__(self, cookies: str):
+        self._local = threading.local()
+        super().__init__(cookies)
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    @session.setter
+    def session(self, session: requests.Session) -> None:
+        self._local.session = session
+
+
+class _PooledSession:
+    """One account's client and the last known state of its login."""
+
+    def __init__(self, client: Client, fingerprint: str):
+        self.client = client
+        self.fingerprint = fingerprint
+        self.live_user: Optional[Dict[str, Any]] = None
+        self.checked_at = 0.0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class SessionPool:
+    """
+    Reuse authenticated pygramcl clients across requests.
+
+    Clients are keyed by ``ds_user_id``, so every action of one account
+    shares a single account lookup and reuses HTTP connections (pooled per
+    thread, see _PooledClient). The
+    lookup is repeated as a health check at most once per
+    SESSION_HEALTH_INTERVAL; a failed check or new cookies for the account
+    replace the client. Clients unused for SESSION_IDLE_TTL are evicted by
+    the reaper. Each broadcast still gets its own Live, since Live keeps
+    per-broadcast state, but it borrows the pooled client.
+    """
+
+    _sessions: Dict[str, _PooledSession] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def client(cls, cookies: str) -> Client:
+        """Pooled client for the account the cookies belong to."""
+        return cls._session(cookies).client
+
+    @classmethod
+    def account(cls, cookies: str) -> Optional[Dict[str, Any]]:
+        """
+        Account info for the cookies, checked against Instagram when stale.
+
+        Args:
+            cookies: Instagram session cookies string
+
+        Returns:
+            Account dict (username, id, ...) or None if the session is invalid
+        """
+        pooled = cls._session(cookies)
+        with pooled.lock:
+            # Concurrent callers share one check instead of each hitting Instagram
+            if pooled.live_user and time.monotonic() - pooled.checked_at < Config.SESSION_HEALTH_INTERVAL:
+                return pooled.live_user
+
+            user = pooled.client.account_info()
+            pooled.live_user = user.to_dict() if user and user.username else None
+            pooled.checked_at = time.monotonic()
+
+        if pooled.live_user is None:
+            cls._discard(pooled)
+        return pooled.live_user
+
+    @classmethod
+    def live(cls, cookies: str) -> Optional[PooledLive]:
+        """New Live for one broadcast on the pooled client, or None if the session is invalid."""
+        live_user = cls.account(cookies)
+        if not live_user:
+            return None
+        return PooledLive(cls.client(cookies), live_user)
+
+    @classmethod
+    def invalidate(cls, cookies: str) -> None:
+        """Forget the pooled client of the account the cookies belong to."""
+        with cls._lock:
+            cls._sessions.pop(cls.account_key(cookies), None)
+
+    @classmethod
+    def evict_idle(cls) -> int:
+        """
+        Drop clients unused for SESSION_IDLE_TTL.
+
+        Lives already holding an evicted client keep using it until their
+        broadcast ends.
+
+        Returns:
+            Number of clients evicted
+        """
+        cutoff = time.monotonic() - Config.SESSION_IDLE_TTL
+        with cls._lock:
+            idle = [key for key, pooled in cls._sessions.items() if pooled.last_used < cutoff]
+            for key in idle:
+                del cls._sessions[key]
+        return len(idle)
+
+    @classmethod
+    def size(cls) -> int:
+        """Number of pooled clients."""
+        with cls._lock:
+            return len(cls._sessions)
+
+    @classmethod
+    def _session(cls, cookies: str) -> _PooledSession:
+        key = cls.account_key(cookies)
+        fingerprint = hashlib.sha256(cookies.encode()).hexdigest()
+        with cls._lock:
+            pooled = cls._sessions.get(key)
+            if pooled is None or pooled.fingerprint != fingerprint:
+                pooled = _PooledSession(_PooledClient(cookies), fingerprint)
+                cls._sessions[key] = pooled
+            pooled.last_used = time.monotonic()
+            return pooled
+
+    @classmethod
+    def _discard(cls, pooled: _PooledSession) -> None:
+        with cls._lock:
+            for key, current in list(cls._sessions.items()):
+                if current is pooled:
+                    del cls._sessions[key]
+
+    @staticmethod
+    def account_key(cookies: str) -> str:
+        """Account the cookies belong to, without asking Instagram."""
+        return str(Cookie.parser('ds_user_id', cookies, '')) or hashlib.sha256(cookies.encode()).hexdigest()
@@ -1,15 +1,38 @@
 """Stream service for Instagram live streaming operations."""
 
-from typing import Optional, Dict, Any
-from pygramcl import Live, Client
+from typing import Optional, Dict, Any, Callable, List
 from flask import current_app
+import hashlib
+import os
+import threading
 import uuid
 import time
 
+from config import Config
+from helpers import TTLCache, timed_upstream
+from utils import LiveStreamManager
+from .admission import StreamAdmission
+from .comment_feed import CommentFeed
+from .ingest import IngestWatcher, spawn_playlist_ingest
+from .job_service import JobManager
+from .prepare_service import PrepareService
+from .session_pool import SessionPool
+from .telemetry import IngestTelemetry
+
 
 class StreamService:
     """Handle Instagram streaming operations."""
     
+    # Shared across requests so concurrent pollers of one broadcast
+    # cost at most one upstream info() call per TTL window.
+    _info_cache = TTLCache(Config.STREAM_INFO_CACHE_TTL)
+    # Keyed by a hash of the cookie string so the secret never sits in memory twice
+    _validation_cache = TTLCache(Config.COOKIE_VALIDATION_TTL)
+    _comment_feeds: Dict[Any, CommentFeed] = {}
+    _feeds_lock = threading.Lock()
+    
+    start_jobs = JobManager('stream-start', Config.STREAM_START_WORKERS)
+    
     @staticmethod
     def validate_cookies(cookies: str) -> Dict[str, Any]:
         """
@@ -33,23 +56,13 @@ class StreamService:
                     'message': f'Missing required cookie fields: {", ".join(missing_fields)}'
                 }
             
-            # Validate with Instagram
-            live = Live(cookies)
-            if not hasattr(live, 'live_user') or not live.live_user:
-                return {
-                    'success': False,
-                    'message': 'Invalid Instagram session cookies or session expired'
-                }
-            
-            username = live.live_user.get('username', 'unknown')
-            userid = str(live.live_user.get('id', '0'))
-            
-            return {
-                'success': True,
-                'username': username,
-                'userid': userid,
-                'session_valid': True
-            }
+            # Repeated and concurrent validations of the same cookies share one check
+            result = StreamService._validation_cache.get_or_load(
+                hashlib.sha256(cookies.encode()).hexdigest(),
+                lambda: StreamService._check_cookies(cookies),
+                ttl_for=lambda r: Config.COOKIE_VALIDATION_TTL if r['success'] else Config.COOKIE_VALIDATION_NEGATIVE_TTL
+            )
+            return dict(result)
             
         except Exception as e:
             current_app.logger.error(f"Cookie validation error: {str(e)}")
@@ -66,6 +79,24 @@ class StreamService:
             
             return {'success': False, 'message': message}
     
+    @staticmethod
+    @timed_upstream('stream', 'validate_cookies')
+    def _check_cookies(cookies: str) -> Dict[str, Any]:
+        """Validate cookies with Instagram, reusing the account's pooled client."""
+        live_user = SessionPool.account(cookies)
+        if not live_user:
+            return {
+                'success': False,
+                'message': 'Invalid Instagram session cookies or session expired'
+            }
+        
+        return {
+            'success': True,
+            'username': live_user.get('username', 'unknown'),
+            'userid': str(live_user.get('id', '0')),
+            'session_valid': True
+        }
+    
     @staticmethod
     def start_stream(
         cookies: str,
@@ -73,7 +104,9 @@ class StreamService:
         title: str,
         hours: int,
         minutes: int,
-        seconds: int
+        seconds: int,
+        on_status: Optional[Callable[[str], None]] = None,
+        playlist: Optional[List[Dict[str, Any]]] = None
     ) -> Dict[str, Any]:
         """
         Start Instagram live stream.
@@ -85,32 +118,60 @@ class StreamService:
             hours: Duration hours
             minutes: Duration minutes
             seconds: Duration seconds
+            on_status: Called with 'ingesting' once the broadcast exists
+                and ffmpeg has been launched
+            playlist: Videos to play back to back instead of video_path,
+                as dicts with ``filename`` and ``duration`` in seconds; they
+                go through one ffmpeg process, so the broadcast never
+                restarts between them
             
         Returns:
             Dict with success status and stream info or error message
         """
         try:
-            live = Live(cookies)
+            if Config.STREAM_SUPERVISOR_SOCKET:
+                return StreamService._start_supervised_stream(
+                    cookies, video_path, title, hours, minutes, seconds, on_status, playlist
+                )
             
-            if not live.live_user:
+            live = SessionPool.live(cookies)
+            
+            if not live:
                 return {
                     'success': False,
                     'message': 'Invalid Instagram session. Please reconfigure cookies.'
                 }
             
+            # A prepared copy streams with -c copy instead of a live transcode
+            prepared_path = PrepareService.prepared_path(os.path.basename(video_path))
             stream_started = live.start(
-                video=video_path,
+                video=prepared_path or video_path,
                 title=title,
                 hours=hours,
                 minutes=minutes,
-                seconds=seconds
+                seconds=seconds,
+                copy=prepared_path is not None,
+                ingest=StreamService._playlist_ingest(playlist) if playlist else None
             )
             
-            time.sleep(3)  # Wait for stream to initialize
-            
             if stream_started:
+                if on_status:
+                    on_status('ingesting')
+                
+                # Wait for ffmpeg to actually push frames instead of a fixed delay
+                watcher = IngestWatcher(live.live_process)
+                live.ingest_watcher = watcher
+                if not watcher.wait_started(Config.STREAM_START_TIMEOUT):
+                    live.stop()
+                    detail = watcher.last_output or 'no output from ffmpeg'
+                    return {
+                        'success': False,
+                        'message': f'Video ingest did not start: {detail}'
+                    }
+                
                 session_id = str(uuid.uuid4())
                 broadcast_id = live.live_info.get('broadcast_id')
+                live.telemetry = IngestTelemetry.track(watcher, label=broadcast_id)
                 
                 return {
                     'success': True,
@@ -133,6 +194,170 @@ class StreamService:
             }
     
     @staticmethod
+    def _start_supervised_stream(
+        cookies: str,
+        video_path: str,
+        title: str,
+        hours: int,
+        minutes: int,
+        seconds: int,
+        on_status: Optional[Callable[[str], None]] = None,
+        playlist: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """Start the stream in the streaming supervisor instead of this process."""
+        from .supervisor import SupervisorClient, RemoteLive
+        
+        result = SupervisorClient.call(
+            'start',
+            on_status=on_status,
+            cookies=cookies,
+            video_path=video_path,
+            title=title,
+            hours=hours,
+            minutes=minutes,
+            seconds=seconds,
+            playlist=playlist
+        )
+        if not result.get('success'):
+            return result
+        
+        # The supervisor's stream id doubles as session id, so any worker
+        # can reattach to the broadcast from the session cookie alone.
+        return {
+            'success': True,
+            'session_id': result['stream_id'],
+            'broadcast_id': result['broadcast_id'],
+            'start_time': result['start_time'],
+            'live_instance': RemoteLive(
+                result['stream_id'], result['broadcast_id'], result['start_time']
+            )
+        }
+    
+    @staticmethod
+    def _playlist_ingest(playlist: List[Dict[str, Any]]) -> Callable[[str], Any]:
+        """Launcher of one ffmpeg process playing a playlist, for PooledLive.start."""
+        sources, codec_args = PrepareService.playlist_plan([item['filename'] for item in playlist])
+        items = [(source, item.get('duration')) for source, item in zip(sources, playlist)]
+        return lambda url: spawn_playlist_ingest(items, url, codec_args)
+    
+    @staticmethod
+    def queue_start(
+        cookies: str,
+        video_path: str,
+        title: str,
+        hours: int,
+        minutes: int,
+        seconds: int
+    ) -> str:
+        """
+        Start a live stream in the background once a pipeline slot is free.
+        
+        Args:
+            cookies: Instagram session cookies
+            video_path: Path to video file
+            title: Stream title
+            hours: Duration hours
+            minutes: Duration minutes
+            seconds: Duration seconds
+            
+        Returns:
+            Id of the job in StreamService.start_jobs, 'queued' until admitted
+        """
+        jobs = StreamService.start_jobs
+        job_id = jobs.create(status='queued')
+        StreamAdmission.enqueue(
+            job_id,
+            SessionPool.account_key(cookies),
+            lambda: jobs.run(
+                job_id, StreamService.run_start_job,
+                cookies, video_path, title, hours, minutes, seconds
+            )
+        )
+        return job_id
+    
+    @staticmethod
+    def run_start_job(
+        job_id: str,
+        cookies: str,
+        video_path: str,
+        title: str,
+        hours: int,
+        minutes: int,
+        seconds: int
+    ) -> Dict[str, Any]:
+        """
+        Start a live stream as a background job.
+        
+        Runs once StreamAdmission granted the job a pipeline slot, see
+        queue_start. The job moves through queued -> ingesting -> live, or
+        failed. Once live, the instance is registered with
+        LiveStreamManager so it exists even if the client never polls the
+        job again, and its stop is scheduled with the reaper when a
+        duration was requested.
+        
+        Args:
+            job_id: Id of the job in StreamService.start_jobs
+            cookies: Instagram session cookies
+            video_path: Path to video file
+            title: Stream title
+            hours: Duration hours
+            minutes: Duration minutes
+            seconds: Duration seconds
+            
+        Returns:
+            Dict with session_id, broadcast_id and start_time, or empty on failure
+        """
+        jobs = StreamService.start_jobs
+        try:
+            result = StreamService.start_stream(
+                cookies, video_path, title, hours, minutes, seconds,
+                on_status=lambda status: jobs.update(job_id, status=status)
+            )
+        except Exception:
+            StreamAdmission.release(job_id)
+            raise
+        
+        if not result['success']:
+            StreamAdmission.release(job_id)
+            jobs.update(job_id, status='failed', message=result['message'])
+            return {}
+        
+        StreamService.hold_slot(result, job_id)
+        LiveStreamManager.create_instance(
+            result['session_id'],
+            result['live_instance'],
+            broadcast_id=result['broadcast_id'],
+            title=title,
+            start_time=result['start_time']
+        )
+        jobs.update(job_id, status='live', message='Live stream started successfully')
+        
+        duration = hours * 3600 + minutes * 60 + seconds
+        if duration > 0:
+            from .reaper_service import StreamReaper
+            StreamReaper.schedule_stop(result['session_id'], time.time() + duration)
+        return {
+            'session_id': result['session_id'],
+            'broadcast_id': result['broadcast_id'],
+            'start_time': result['start_time']
+        }
+    
+    @staticmethod
+    def hold_slot(result: Dict[str, Any], ticket: str) -> None:
+        """
+        Tie an admission slot to a started stream.
+        
+        The slot is released again when the stream is stopped.
+        
+        Args:
+            result: Successful result of start_stream
+            ticket: Ticket the slot was acquired with
+        """
+        result['live_instance'].admission_ticket = ticket
+        StreamAdmission.attach(ticket, result['session_id'])
+    
+    @staticmethod
+    @timed_upstream('stream', 'stop')
     def stop_stream(live_instance: Any) -> Dict[str, Any]:
         """
         Stop Instagram live stream.
@@ -145,7 +370,16 @@ class StreamService:
         """
         try:
             if live_instance:
-                live_instance.stop()
+                key = StreamService._info_cache_key(live_instance)
+                StreamService._info_cache.invalidate(key)
+                with StreamService._feeds_lock:
+                    StreamService._comment_feeds.pop(key, None)
+                try:
+                    live_instance.stop()
+                finally:
+                    ticket = getattr(live_instance, 'admission_ticket', None)
+                    if ticket:
+                        StreamAdmission.release(ticket)
             
             return {
                 'success': True,
@@ -160,12 +394,14 @@ class StreamService:
             }
     
     @staticmethod
-    def get_stream_info(live_instance: Any) -> Dict[str, Any]:
+    def get_stream_info(live_instance: Any, since: Optional[int] = None) -> Dict[str, Any]:
         """
         Get live stream information.
         
         Args:
             live_instance: Live stream instance
+            since: Comment cursor; only comments newer than it are returned.
+                When omitted, all buffered comments are returned.
             
         Returns:
             Dict with success status and stream info or error message
@@ -177,28 +413,22 @@ class StreamService:
                     'message': 'Live stream instance not found'
                 }
             
-            info = live_instance.info()
-            if not info:
-                return {
-                    'success': False,
-                    'message': 'Failed to fetch stream information'
-                }
+            result = StreamService._info_cache.get_or_load(
+                StreamService._info_cache_key(live_instance),
+                lambda: StreamService._fetch_stream_info(live_instance)
+            )
             
-            return {
-                'success': True,
-                'data': {
-                    'broadcast_id': info.get('broadcast_id'),
-                    'viewer_count': info.get('viewer_count', 0),
-                    'comment_count': info.get('comment_count', 0),
-                    'comments': [
-                        {
-                            'user': comment.get('user', 'unknown'),
-                            'text': comment.get('text', ''),
-                            'time': comment.get('time', '')
-                        } for comment in info.get('comment_users', [])
-                    ]
-                }
-            }
+            if not result['success']:
+                return dict(result)
+            
+            # Callers annotate the payload, so never hand out the cached dicts
+            feed = StreamService.get_comment_feed(live_instance)
+            data = dict(result['data'])
+            data['cursor'] = feed.cursor
+            data['comments'] = feed.since(since)
+            health = StreamService.get_stream_health(live_instance, limit=0)
+            data['health'] = health['current'] if health else None
+            return {**result, 'data': data}
             
         except Exception as e:
             current_app.logger.error(f"Stream info error: {str(e)}")
@@ -208,6 +438,101 @@ class StreamService:
             }
     
     @staticmethod
+    def get_stream_health(live_instance: Any, limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Ingest telemetry of a live stream, see IngestTelemetry.snapshot.
+        
+        Args:
+            live_instance: Live stream instance
+            limit: Return only the newest samples (None for all)
+            
+        Returns:
+            Dict with the current sample and time series, or None if the
+            stream has no telemetry
+        """
+        telemetry = getattr(live_instance, 'telemetry', None)
+        if telemetry is None:
+            return None
+        try:
+            return telemetry.snapshot(limit)
+        except Exception as e:
+            current_app.logger.error(f"Stream health error: {str(e)}")
+            return None
+    
+    @staticmethod
+    def get_host_health() -> Dict[str, Any]:
+        """
+        Ingest load of all streams this process runs, for capacity planning.
+        
+        Returns:
+            Dict with totals over running streams (CPU percent of one core,
+            resident bytes, bitrate, stalled count), host CPU count and load
+            average, and the current sample of each stream labelled by its
+            broadcast id (session ids grant control of a stream, so they
+            are never listed)
+        """
+        streams = []
+        for session_id in LiveStreamManager.session_ids():
+            live = LiveStreamManager.get_instance(session_id)
+            health = StreamService.get_stream_health(live, limit=0)
+            if health and health['current']:
+                record = LiveStreamManager.get_metadata(session_id) or {}
+                broadcast_id = record.get('broadcast_id') or live.live_info.get('broadcast_id')
+                streams.append({'broadcast_id': broadcast_id, **health['current']})
+        
+        running = [stream for stream in streams if stream['running']]
+        return {
+            'streams': len(running),
+            'stalled': sum(1 for stream in running if stream['stalled']),
+            'cpu_percent': round(sum(stream.get('cpu_percent') or 0 for stream in running), 1),
+            'rss_bytes': sum(stream.get('rss_bytes') or 0 for stream in running),
+            'bitrate_kbps': round(sum(stream.get('bitrate_kbps') or 0 for stream in running), 1),
+            'cpu_count': os.cpu_count(),
+            'load_average': os.getloadavg() if hasattr(os, 'getloadavg') else None,
+            'per_stream': streams
+        }
+    
+    @staticmethod
+    def get_comment_feed(live_instance: Any) -> CommentFeed:
+        """Get (or create) the comment feed of a live instance's broadcast."""
+        key = StreamService._info_cache_key(live_instance)
+        with StreamService._feeds_lock:
+            feed = StreamService._comment_feeds.get(key)
+            if feed is None:
+                feed = CommentFeed(Config.STREAM_COMMENT_BUFFER_SIZE)
+                StreamService._comment_feeds[key] = feed
+            return feed
+    
+    @staticmethod
+    @timed_upstream('stream', 'info')
+    def _fetch_stream_info(live_instance: Any) -> Dict[str, Any]:
+        """Fetch stream information from Instagram, bypassing the cache."""
+        info = live_instance.info()
+        if not info:
+            return {
+                'success': False,
+                'message': 'Failed to fetch stream information'
+            }
+        
+        StreamService.get_comment_feed(live_instance).ingest(info.get('comment_users', []))
+        
+        return {
+            'success': True,
+            'data': {
+                'broadcast_id': info.get('broadcast_id'),
+                'viewer_count': info.get('viewer_count', 0),
+                'comment_count': info.get('comment_count', 0)
+            }
+        }
+    
+    @staticmethod
+    def _info_cache_key(live_instance: Any) -> Any:
+        """Cache key for a live instance, preferring its broadcast id."""
+        live_info = getattr(live_instance, 'live_info', None) or {}
+        return live_info.get('broadcast_id') or id(live_instance)
+    
+    @staticmethod
+    @timed_upstream('stream', 'comment')
     def post_comment(live_instance: Any, text: str) -> Dict[str, Any]:
         """
         Post comment to live stream.
@@ -0,0 +1,389 @@
+"""Out-of-process supervisor owning all live broadcasts.
+
+Run it next to the web workers with::
+
+    STREAM_SUPERVISOR_SOCKET=/run/instream/supervisor.sock python -m services.supervisor
+
+Each broadcast runs in its own child process holding the pygramcl Live
+object and its ffmpeg pipeline. Web workers talk to the supervisor over a
+local Unix socket, so restarting or adding workers does not touch streams.
+"""
+
+from multiprocessing.connection import Client, Listener
+from typing import Any, Callable, Dict, Optional
+from flask import Flask
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import uuid
+
+from config import Config
+from utils import LiveStreamManager
+from .stream_service import StreamService
+
+
+class SupervisorError(Exception):
+    """Raised when the supervisor rejects or fails a request."""
+
+
+class StreamGone(SupervisorError):
+    """Raised when the supervisor no longer runs the requested stream."""
+
+
+def _authkey() -> bytes:
+    # Never fall back to the Flask secret key, whose default is public
+    if not Config.STREAM_SUPERVISOR_AUTHKEY:
+        raise SupervisorError('STREAM_SUPERVISOR_AUTHKEY must be set')
+    return Config.STREAM_SUPERVISOR_AUTHKEY.encode()
+
+
+def _broadcast_main(conn: Any, params: Dict[str, Any]) -> None:
+    """Child process entry point: own one Live instance until it stops."""
+    # The child must start the stream itself, not forward it back here
+    Config.STREAM_SUPERVISOR_SOCKET = ''
+    app = Flask('instream-broadcast')
+
+    with app.app_context():
+        result = StreamService.start_stream(
+            **params,
+            on_status=lambda status: conn.send(('status', status))
+        )
+        if not result['success']:
+            conn.send(('result', result))
+            return
+
+        live = result['live_instance']
+        conn.send(('result', {
+            'success': True,
+            'broadcast_id': result['broadcast_id'],
+            'start_time': result['start_time']
+        }))
+
+        duration = params['hours'] * 3600 + params['minutes'] * 60 + params['seconds']
+        expires_at = time.time() + duration if duration > 0 else None
+
+        while True:
+            timeout = max(0.0, expires_at - time.time()) if expires_at else None
+            try:
+                if not conn.poll(timeout):
+                    app.logger.info(f"Broadcast {result['broadcast_id']} reached its duration")
+                    StreamService.stop_stream(live)
+                    return
+                op, args = conn.recv()
+            except (EOFError, OSError):
+                # Supervisor went away; do not leave an orphaned broadcast
+                StreamService.stop_stream(live)
+                return
+
+            try:
+                if op == 'info':
+                    info = live.info()
+                    reply = None
+                    if info:
+                        comments = info.get('comment_users', [])
+                        reply = {
+                            'broadcast_id': info.get('broadcast_id'),
+                            'viewer_count': info.get('viewer_count', 0),
+                            'comment_count': info.get('comment_count', 0),
+                            'comment_users': comments[args.get('offset', 0):]
+                        }
+                elif op == 'comment':
+                    reply = live.comment(args['text'])
+                elif op == 'telemetry':
+                    telemetry = getattr(live, 'telemetry', None)
+                    reply = telemetry.snapshot(args.get('limit')) if telemetry else None
+                elif op == 'describe':
+                    reply = {
+                        'broadcast_id': live.live_info.get('broadcast_id'),
+                        'start_time': live.live_time
+                    }
+                elif op == 'stop':
+                    conn.send(StreamService.stop_stream(live))
+                    return
+                else:
+                    reply = None
+                conn.send(reply)
+            except Exception as e:
+                app.logger.error(f"Broadcast child {op} error: {str(e)}")
+                conn.send(None)
+
+
+class _Broadcast:
+    """Supervisor-side handle of one broadcast child."""
+
+    def __init__(self, process: Any, conn: Any):
+        self.process = process
+        self.conn = conn
+        self.lock = threading.Lock()
+
+    def request(self, op: str, **args: Any) -> Any:
+        with self.lock:
+            self.conn.send((op, args))
+            return self.conn.recv()
+
+
+class StreamSupervisor:
+    """Own broadcast child processes and serve requests for them."""
+
+    def __init__(self, address: str):
+        self.address = address
+        self._context = multiprocessing.get_context('spawn')
+        self._broadcasts: Dict[str, _Broadcast] = {}
+        self._lock = threading.Lock()
+        self._listener: Optional[Listener] = None
+
+    def serve_forever(self) -> None:
+        """Accept connections until the process is told to stop."""
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        self._listener = Listener(self.address, family='AF_UNIX', authkey=_authkey())
+        os.chmod(self.address, 0o600)
+
+        signal.signal(signal.SIGTERM, lambda *_: self.shutdown())
+        threading.Thread(target=self._monitor, name='supervisor-monitor', daemon=True).start()
+
+        try:
+            while True:
+                try:
+                    conn = self._listener.accept()
+                except OSError:
+                    break
+                except Exception:
+                    # Failed authentication or a client that hung up early
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            self.shutdown()
+
+    def shutdown(self) -> None:
+        """Stop every broadcast and close the socket."""
+        with self._lock:
+            broadcasts = list(self._broadcasts.items())
+            self._broadcasts.clear()
+        for stream_id, broadcast in broadcasts:
+            try:
+                broadcast.request('stop')
+            except Exception:
+                broadcast.process.terminate()
+            broadcast.process.join(timeout=10)
+
+        if self._listener is not None:
+            listener, self._listener = self._listener, None
+            listener.close()
+            if os.path.exists(self.address):
+                os.remove(self.address)
+
+    def _handle(self, conn: Any) -> None:
+        with conn:
+            try:
+                request = conn.recv()
+                op = request.pop('op')
+                if op == 'start':
+                    self._start(conn, request)
+                elif op == 'list':
+                    with self._lock:
+                        ids = list(self._broadcasts)
+                    conn.send({'event': 'result', 'result': ids})
+                else:
+                    conn.send({'event': 'result', 'result': self._forward(op, request)})
+            except SupervisorError as e:
+                conn.send({'event': 'error', 'message': str(e), 'gone': isinstance(e, StreamGone)})
+            except (EOFError, OSError):
+                pass
+
+    def _start(self, conn: Any, params: Dict[str, Any]) -> None:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_broadcast_main,
+            args=(child_conn, params),
+            name='instream-broadcast',
+            daemon=False
+        )
+        process.start()
+        child_conn.close()
+
+        # Relay progress until the child reports the outcome
+        try:
+            while True:
+                kind, payload = parent_conn.recv()
+                if kind == 'status':
+                    conn.send({'event': 'status', 'status': payload})
+                    continue
+                break
+        except EOFError:
+            payload = {'success': False, 'message': 'Broadcast process exited during start'}
+
+        if payload.get('success'):
+            stream_id = str(uuid.uuid4())
+            with self._lock:
+                self._broadcasts[stream_id] = _Broadcast(process, parent_conn)
+            payload['stream_id'] = stream_id
+        else:
+            process.join(timeout=10)
+        conn.send({'event': 'result', 'result': payload})
+
+    def _forward(self, op: str, request: Dict[str, Any]) -> Any:
+        stream_id = request.pop('stream_id', None)
+        with self._lock:
+            broadcast = self._broadcasts.get(stream_id)
+        if broadcast is None:
+            raise StreamGone('Unknown stream')
+
+        try:
+            reply = broadcast.request(op, **request)
+        except (EOFError, OSError):
+            self._forget(stream_id)
+            raise StreamGone('Broadcast process is gone')
+
+        if op == 'stop':
+            self._forget(stream_id)
+        return reply
+
+    def _forget(self, stream_id: str) -> None:
+        with self._lock:
+            broadcast = self._broadcasts.pop(stream_id, None)
+        if broadcast:
+            broadcast.process.join(timeout=10)
+
+    def _monitor(self) -> None:
+        """Drop children that exited on their own (duration over, crash)."""
+        while self._listener is not None:
+            time.sleep(5)
+            with self._lock:
+                dead = [k for k, b in self._broadcasts.items() if not b.process.is_alive()]
+            for stream_id in dead:
+                self._forget(stream_id)
+
+
+class SupervisorClient:
+    """Talk to the streaming supervisor from a web worker."""
+
+    @staticmethod
+    def call(op: str, on_status: Optional[Callable[[str], None]] = None, **params: Any) -> Any:
+        """
+        Send one request to the supervisor.
+
+        Args:
+            op: Operation name (start, info, comment, telemetry, describe, stop, list)
+            on_status: Called with progress updates of a start request
+            **params: Operation parameters
+
+        Returns:
+            Operation result
+
+        Raises:
+            StreamGone: If the supervisor does not run the stream (anymore)
+            SupervisorError: If the supervisor rejected the request
+        """
+        with Client(Config.STREAM_SUPERVISOR_SOCKET, family='AF_UNIX', authkey=_authkey()) as conn:
+            conn.send({'op': op, **params})
+            while True:
+                message = conn.recv()
+                if message['event'] == 'status':
+                    if on_status:
+                        on_status(message['status'])
+                    continue
+                if message['event'] == 'error':
+                    raise (StreamGone if message.get('gone') else SupervisorError)(message['message'])
+                return message['result']
+
+
+class _RemoteTelemetry:
+    """Stand-in for IngestTelemetry of a broadcast child."""
+
+    def __init__(self, stream_id: str):
+        self.stream_id = stream_id
+
+    def snapshot(self, limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        return RemoteLive.call(self.stream_id, 'telemetry', limit=limit)
+
+
+class RemoteLive:
+    """Stand-in for pygramcl.Live whose broadcast runs in the supervisor."""
+
+    def __init__(self, stream_id: str, broadcast_id: Optional[str], start_time: int):
+        self.stream_id = stream_id
+        self.live_time = start_time
+        self.telemetry = _RemoteTelemetry(stream_id)
+        self.live_info = {
+            'broadcast_id': broadcast_id,
+            'viewer_count': 0,
+            'comment_count': 0,
+            'comment_users': []
+        }
+
+    @classmethod
+    def attach(cls, stream_id: str) -> Optional['RemoteLive']:
+        """
+        Reconnect to a broadcast started by another worker process.
+
+        Returns None if the supervisor does not know the stream (anymore);
+        errors reaching the supervisor are raised, since they say nothing
+        about the stream.
+        """
+        try:
+            info = SupervisorClient.call('describe', stream_id=stream_id)
+        except StreamGone:
+            return None
+        if not info:
+            return None
+        return cls(stream_id, info['broadcast_id'], info['start_time'])
+
+    @staticmethod
+    def call(stream_id: str, op: str, **params: Any) -> Any:
+        """
+        Send a request about one stream to the supervisor.
+
+        A stream the supervisor no longer runs (stopped by another worker,
+        or its process exited) is dropped from LiveStreamManager, so this
+        worker stops reporting it as live.
+
+        Raises:
+            StreamGone: If the stream is gone
+            SupervisorError: If the supervisor rejected the request
+        """
+        try:
+            return SupervisorClient.call(op, stream_id=stream_id, **params)
+        except StreamGone:
+            LiveStreamManager.forget(stream_id)
+            raise StreamGone('Live stream has ended')
+
+    def info(self) -> Optional[Dict[str, Any]]:
+        # Only fetch comments this proxy has not mirrored yet
+        info = RemoteLive.call(self.stream_id, 'info', offset=len(self.live_info['comment_users']))
+        if not info:
+            return None
+
+        self.live_info['broadcast_id'] = info['broadcast_id']
+        self.live_info['viewer_count'] = info['viewer_count']
+        self.live_info['comment_count'] = info['comment_count']
+        self.live_info['comment_users'].extend(info['comment_users'])
+        return self.live_info
+
+    def comment(self, text: str) -> Optional[bool]:
+        return RemoteLive.call(self.stream_id, 'comment', text=text)
+
+    def stop(self) -> bool:
+        try:
+            SupervisorClient.call('stop', stream_id=self.stream_id)
+        except SupervisorError:
+            # Already stopped by another worker or by its duration
+            pass
+        return True
+
+
+def main() -> None:
+    if not Config.STREAM_SUPERVISOR_SOCKET:
+        raise SystemExit('STREAM_SUPERVISOR_SOCKET must be set')
+    if not Config.STREAM_SUPERVISOR_AUTHKEY:
+        raise SystemExit('STREAM_SUPERVISOR_AUTHKEY must be set')
+    StreamSupervisor(Config.STREAM_SUPERVISOR_SOCKET).serve_forever()
+
+
+if __name__ == '__main__':
+    # Import through the package so spawned children can unpickle
+    # _broadcast_main as services.supervisor._broadcast_main.
+    from services.supervisor import main as package_main
+    package_main()
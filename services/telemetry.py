@@ -0,0 +1,175 @@
+"""Health telemetry of the ffmpeg processes pushing video to Instagram."""
+
+from collections import deque
+from typing import Any, Dict, Optional, Set, Tuple
+from flask import Flask, current_app, has_app_context
+import os
+import threading
+import time
+
+from config import Config
+from .ingest import IngestWatcher
+
+
+class IngestTelemetry:
+    """
+    Time series of one ingest process's throughput and resource usage.
+
+    Every TELEMETRY_INTERVAL seconds a sample combines the last progress
+    line ffmpeg printed (bitrate, fps, dropped frames, speed; parsed by
+    IngestWatcher) with the process's CPU usage and resident memory from
+    ``/proc``. The newest TELEMETRY_SAMPLES samples are kept in a ring
+    buffer. A stream whose progress has not advanced for
+    TELEMETRY_STALL_SECONDS (counted from when tracking started until the
+    first progress line) is reported as stalled, and logged once when it
+    becomes so.
+
+    One collector thread per process samples every tracked stream; a
+    stream is dropped from collection once its ffmpeg process exits, its
+    samples stay readable.
+    """
+
+    _tracked: Set['IngestTelemetry'] = set()
+    _registry_lock = threading.Lock()
+    _thread: Optional[threading.Thread] = None
+    _app: Optional[Flask] = None
+
+    def __init__(self, watcher: IngestWatcher, label: Optional[str] = None):
+        self.watcher = watcher
+        self.label = label or str(watcher.process.pid)
+        self.stalled = False
+        self.tracked_at = time.monotonic()
+        self._samples: deque = deque(maxlen=Config.TELEMETRY_SAMPLES)
+        self._lock = threading.Lock()
+        self._cpu_mark: Optional[Tuple[float, float]] = None
+
+    @classmethod
+    def track(cls, watcher: IngestWatcher, label: Optional[str] = None) -> 'IngestTelemetry':
+        """
+        Start collecting telemetry of an ingest process.
+
+        Args:
+            watcher: Watcher draining the process's stderr
+            label: Name of the stream in log messages, e.g. its broadcast id
+
+        Returns:
+            The stream's telemetry, already holding a first sample
+        """
+        telemetry = cls(watcher, label)
+        telemetry.sample()
+        with cls._registry_lock:
+            if has_app_context():
+                cls._app = current_app._get_current_object()
+            cls._tracked.add(telemetry)
+            if not (cls._thread and cls._thread.is_alive()):
+                cls._thread = threading.Thread(target=cls._collect, name='ingest-telemetry', daemon=True)
+                cls._thread.start()
+        return telemetry
+
+    def sample(self) -> Dict[str, Any]:
+        """Take a sample now and append it to the ring buffer."""
+        process = self.watcher.process
+        now = time.monotonic()
+        running = process.poll() is None
+
+        cpu_percent = rss_bytes = None
+        usage = process_usage(process.pid) if running else None
+        if usage:
+            cpu_seconds, rss_bytes = usage
+            if self._cpu_mark and now > self._cpu_mark[0]:
+                cpu_percent = round((cpu_seconds - self._cpu_mark[1]) / (now - self._cpu_mark[0]) * 100, 1)
+            self._cpu_mark = (now, cpu_seconds)
+
+        progress_at = self.watcher.progress_at
+        progress_age = round(now - progress_at, 1) if progress_at is not None else None
+        # Before the first progress line, the wait counts from when tracking started
+        idle = now - (progress_at if progress_at is not None else self.tracked_at)
+        stalled = running and idle > Config.TELEMETRY_STALL_SECONDS
+
+        sample = {
+            'time': time.time(),
+            'running': running,
+            'stalled': stalled,
+            **self.watcher.progress,
+            'progress_age': progress_age,
+            'cpu_percent': cpu_percent,
+            'rss_bytes': rss_bytes
+        }
+        with self._lock:
+            self._samples.append(sample)
+            became_stalled = stalled and not self.stalled
+            self.stalled = stalled
+
+        if became_stalled and self._app is not None:
+            self._app.logger.warning(
+                f"Ingest of {self.label} stalled: no progress for {idle:.1f}s "
+                f"({self.watcher.last_output or 'no output'})"
+            )
+        return sample
+
+    def snapshot(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Latest sample and the buffered time series.
+
+        Args:
+            limit: Return only the newest samples (None for all, 0 for none)
+
+        Returns:
+            Dict with the current sample, the samples oldest first and the
+            sampling interval
+        """
+        with self._lock:
+            samples = list(self._samples)
+        current = samples[-1] if samples else None
+        if limit is not None:
+            samples = samples[-limit:] if limit > 0 else []
+        return {
+            'current': current,
+            'samples': samples,
+            'interval': Config.TELEMETRY_INTERVAL
+        }
+
+    @classmethod
+    def _collect(cls) -> None:
+        while True:
+            time.sleep(Config.TELEMETRY_INTERVAL)
+            with cls._registry_lock:
+                tracked = list(cls._tracked)
+            for telemetry in tracked:
+                try:
+                    sample = telemetry.sample()
+                except Exception as e:
+                    if cls._app is not None:
+                        cls._app.logger.error(f"Telemetry error for {telemetry.label}: {str(e)}")
+                    continue
+                if not sample['running']:
+                    with cls._registry_lock:
+                        cls._tracked.discard(telemetry)
+
+
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def process_usage(pid: int) -> Optional[Tuple[float, int]]:
+    """
+    CPU time and resident memory of a process, from ``/proc``.
+
+    Args:
+        pid: Process id
+
+    Returns:
+        Tuple of CPU seconds used so far (user + system) and resident bytes,
+        or None where ``/proc`` is unavailable or the process is gone
+    """
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            # The command name may contain spaces; fields follow its closing paren
+            fields = f.read().rsplit(b')', 1)[1].split()
+        with open(f'/proc/{pid}/statm', 'rb') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    # utime and stime are fields 14 and 15 of stat, indexes 11 and 12 after the name
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+    return cpu_seconds, resident_pages * _PAGE_SIZE
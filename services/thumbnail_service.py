@@ -0,0 +1,156 @@
+"""Thumbnails and preview sprites of library videos."""
+
+from typing import Any, Dict, Optional
+from flask import current_app
+import os
+import subprocess
+
+from config import Config
+from helpers import MediaProbe, VideoLibrary
+from .content_store import ContentStore
+from .job_service import JobManager, JobOutcome
+
+
+class ThumbnailService:
+    """
+    Render a poster frame and a low-res preview strip per video.
+
+    Both are small JPEGs in ``UPLOAD_FOLDER/.thumbs`` named after the
+    video's content digest, so they never change once written and can be
+    served with immutable cache headers; duplicates share them. The state
+    is kept as ``thumbnail`` (pending / ready / failed) on the library
+    entry.
+    """
+
+    THUMBS_DIR = '.thumbs'
+
+    jobs = JobManager('thumbnail', Config.THUMBNAIL_WORKERS)
+
+    @staticmethod
+    def schedule(filename: str) -> Optional[str]:
+        """
+        Queue thumbnail generation of a library video; never raises.
+
+        Args:
+            filename: Video in the upload folder
+
+        Returns:
+            Job id, or None if it could not be queued
+        """
+        try:
+            VideoLibrary.annotate(filename, thumbnail='pending')
+            return ThumbnailService.jobs.submit(ThumbnailService.run_thumbnail_job, filename)
+        except Exception as e:
+            current_app.logger.error(f"Thumbnail schedule error: {str(e)}")
+            return None
+
+    @staticmethod
+    def run_thumbnail_job(job_id: str, filename: str) -> JobOutcome:
+        """
+        Generate previews as a background job.
+
+        Args:
+            job_id: Id of the job in ThumbnailService.jobs
+            filename: Video in the upload folder
+
+        Returns:
+            Outcome whose result is a dict with the digest the previews are
+            named after, or empty on failure
+        """
+        result = ThumbnailService.generate(filename)
+        if not result['success']:
+            VideoLibrary.annotate(filename, thumbnail='failed')
+            return JobOutcome('failed', result['message'], {})
+
+        return JobOutcome('done', result['message'], {'digest': result['digest']})
+
+    @staticmethod
+    def generate(filename: str) -> Dict[str, Any]:
+        """
+        Write the poster frame and preview strip of a video, if missing.
+
+        Args:
+            filename: Video in the upload folder
+
+        Returns:
+            Dict with success status and digest or error message
+        """
+        try:
+            path = os.path.join(Config.UPLOAD_FOLDER, filename)
+            entry = VideoLibrary.get(filename) or {}
+            digest = entry.get('digest') or ContentStore.hash_file(path)
+            poster = ThumbnailService.path(digest)
+            sprite = ThumbnailService.path(digest, sprite=True)
+
+            if not (os.path.exists(poster) and os.path.exists(sprite)):
+                media = MediaProbe.get(filename) or {}
+                duration = media.get('duration')
+                if not media.get('video_codec') or not duration:
+                    return {'success': False, 'message': 'No video stream to take previews from'}
+
+                os.makedirs(os.path.dirname(poster), exist_ok=True)
+                frames = Config.THUMBNAIL_SPRITE_FRAMES
+                # Poster a tenth in, past intros and black leaders
+                ThumbnailService._render(poster, [
+                    '-ss', f'{duration * 0.1:.3f}', '-i', path,
+                    '-frames:v', '1',
+                    '-vf', f'scale={Config.THUMBNAIL_WIDTH}:-2'
+                ])
+                # Evenly spaced frames tiled into one horizontal strip
+                ThumbnailService._render(sprite, [
+                    '-skip_frame', 'nokey', '-i', path,
+                    '-frames:v', '1',
+                    '-vf', f'fps={frames}/{duration:.3f},scale={Config.THUMBNAIL_SPRITE_WIDTH}:-2,tile={frames}x1'
+                ])
+
+            VideoLibrary.annotate(filename, digest=digest, thumbnail='ready')
+            return {
+                'success': True,
+                'message': 'Thumbnails generated',
+                'digest': digest
+            }
+
+        except Exception as e:
+            current_app.logger.error(f"Thumbnail error: {str(e)}")
+            return {
+                'success': False,
+                'message': f'Thumbnail generation failed: {str(e)}'
+            }
+
+    @staticmethod
+    def path(digest: str, sprite: bool = False) -> str:
+        """Path of a video's poster frame, or of its preview strip."""
+        name = f'{digest}_sprite.jpg' if sprite else f'{digest}.jpg'
+        return os.path.join(Config.UPLOAD_FOLDER, ThumbnailService.THUMBS_DIR, name)
+
+    @staticmethod
+    def collect() -> int:
+        """Remove previews no library video refers to anymore."""
+        root = os.path.join(Config.UPLOAD_FOLDER, ThumbnailService.THUMBS_DIR)
+        if not os.path.isdir(root):
+            return 0
+
+        live = {e.get('digest') for e in VideoLibrary.page()['items']}
+        removed = 0
+        for entry in os.scandir(root):
+            digest = entry.name.split('.', 1)[0].split('_', 1)[0]
+            if digest in live or '.tmp' in entry.name:
+                continue
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except OSError:
+                continue
+        return removed
+
+    @staticmethod
+    def _render(output: str, args: list) -> None:
+        tmp_path = f'{output}.{os.getpid()}.tmp.jpg'
+        command = ['ffmpeg', '-y', '-v', 'error', *args, '-q:v', '5', tmp_path]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            detail = completed.stderr.strip().splitlines()[-1:] or ['ffmpeg failed']
+            raise RuntimeError(detail[0])
+        os.replace(tmp_path, output)
@@ -0,0 +1,301 @@
+"""Resumable chunked uploads written in place into the upload folder."""
+
+from typing import Any, BinaryIO, Dict, List, Optional
+from werkzeug.utils import secure_filename
+from flask import current_app
+import os
+import time
+import uuid
+
+from config import Config
+from helpers import VideoLibrary, get_state_backend
+from utils import allowed_file
+from .content_store import ContentStore
+from .prepare_service import PrepareService
+from .thumbnail_service import ThumbnailService
+
+
+class UploadService:
+    """
+    Handle init / chunk / finalize uploads.
+
+    Chunks are written with positional writes straight into
+    ``<filename>.part`` in the upload folder, so nothing is spooled to a
+    temp file and copied again. The byte ranges received so far are kept in
+    the shared state backend; a client that lost its connection asks for
+    them and only resends the gaps. Finalize hands the part file to the
+    content store once the ranges cover the whole file.
+    """
+
+    NAMESPACE = 'uploads'
+    PART_SUFFIX = '.part'
+    WRITE_BLOCK = 1024 * 1024
+
+    @staticmethod
+    def init_upload(original_name: str, size: int) -> Dict[str, Any]:
+        """
+        Create an upload session and its part file.
+
+        Args:
+            original_name: Client-side file name, used for validation and display
+            size: Total file size in bytes
+
+        Returns:
+            Dict with success status, upload id and chunk size or error message
+        """
+        try:
+            if not original_name or not allowed_file(original_name):
+                return {
+                    'success': False,
+                    'message': f'Invalid file format. Allowed: {", ".join(Config.ALLOWED_VIDEO_EXTENSIONS)}'
+                }
+
+            if size <= 0 or size > Config.MAX_UPLOAD_SIZE:
+                return {
+                    'success': False,
+                    'message': f'File size must be between 1 byte and {Config.MAX_UPLOAD_SIZE // (1024 * 1024)} MB'
+                }
+
+            upload_id = uuid.uuid4().hex
+            _, ext = os.path.splitext(secure_filename(original_name))
+            filename = f"ig_upload_{int(time.time())}_{upload_id[:8]}{ext}"
+
+            # Size the part file up front; unwritten regions stay sparse
+            with open(UploadService._part_path(filename), 'wb') as f:
+                f.truncate(size)
+
+            now = time.time()
+            get_state_backend().set(UploadService.NAMESPACE, upload_id, {
+                'id': upload_id,
+                'filename': filename,
+                'original_name': original_name,
+                'size': size,
+                'ranges': [],
+                'created_at': now,
+                'updated_at': now
+            }, ttl=Config.UPLOAD_SESSION_TTL)
+
+            return {
+                'success': True,
+                'upload_id': upload_id,
+                'filename': filename,
+                'chunk_size': Config.UPLOAD_CHUNK_SIZE
+            }
+
+        except Exception as e:
+            current_app.logger.error(f"Upload init error: {str(e)}")
+            return {
+                'success': False,
+                'message': f'Failed to start upload: {str(e)}'
+            }
+
+    @staticmethod
+    def write_chunk(upload_id: str, offset: int, stream: BinaryIO, length: Optional[int]) -> Dict[str, Any]:
+        """
+        Write one chunk at the given offset.
+
+        Args:
+            upload_id: Upload session id
+            offset: Byte offset of the chunk within the file
+            stream: Request body stream
+            length: Declared chunk length (Content-Length)
+
+        Returns:
+            Dict with success status and received ranges or error message
+        """
+        try:
+            upload = get_state_backend().get(UploadService.NAMESPACE, upload_id)
+            if not upload:
+                return {'success': False, 'message': 'Upload not found or expired'}
+
+            if length is None:
+                return {'success': False, 'message': 'Content-Length header is required'}
+
+            if offset < 0 or length <= 0 or offset + length > upload['size']:
+                return {'success': False, 'message': 'Chunk is outside the file'}
+
+            written = 0
+            fd = os.open(UploadService._part_path(upload['filename']), os.O_WRONLY)
+            try:
+                while written < length:
+                    block = stream.read(min(UploadService.WRITE_BLOCK, length - written))
+                    if not block:
+                        break
+                    view = memoryview(block)
+                    while view:
+                        count = os.pwrite(fd, view, offset + written)
+                        view = view[count:]
+                        written += count
+            finally:
+                os.close(fd)
+                # Record whatever arrived, even if the client hung up mid-chunk
+                if written:
+                    upload = UploadService._add_range(upload_id, offset, offset + written) or upload
+
+            if written < length:
+                return {
+                    'success': False,
+                    'message': 'Chunk was truncated',
+                    'ranges': upload['ranges']
+                }
+
+            return {
+                'success': True,
+                'ranges': upload['ranges'],
+                'complete': UploadService._is_complete(upload)
+            }
+
+        except Exception as e:
+            current_app.logger.error(f"Upload chunk error: {str(e)}")
+            return {
+                'success': False,
+                'message': f'Failed to write chunk: {str(e)}'
+            }
+
+    @staticmethod
+    def get_upload(upload_id: str) -> Dict[str, Any]:
+        """
+        Get the state of an upload session for resuming.
+
+        Args:
+            upload_id: Upload session id
+
+        Returns:
+            Dict with success status, size and received ranges or error message
+        """
+        upload = get_state_backend().get(UploadService.NAMESPACE, upload_id)
+        if not upload:
+            return {'success': False, 'message': 'Upload not found or expired'}
+
+        return {
+            'success': True,
+            'upload_id': upload_id,
+            'size': upload['size'],
+            'ranges': upload['ranges'],
+            'complete': UploadService._is_complete(upload),
+            'chunk_size': Config.UPLOAD_CHUNK_SIZE
+        }
+
+    @staticmethod
+    def finalize_upload(upload_id: str) -> Dict[str, Any]:
+        """
+        Move a fully received upload into the library.
+
+        Args:
+            upload_id: Upload session id
+
+        Returns:
+            Dict with success status and filename or error message
+        """
+        try:
+            backend = get_state_backend()
+            upload = backend.get(UploadService.NAMESPACE, upload_id)
+            if not upload:
+                return {'success': False, 'message': 'Upload not found or expired'}
+
+            if not UploadService._is_complete(upload):
+                return {
+                    'success': False,
+                    'message': 'Upload is incomplete',
+                    'ranges': upload['ranges']
+                }
+
+            # Only the request that removes the session gets to finalize it
+            if not backend.delete(UploadService.NAMESPACE, upload_id):
+                return {'success': False, 'message': 'Upload is already finalized'}
+
+            # Chunks may arrive out of order, so the digest needs one sequential pass here
+            filename = upload['filename']
+            part_path = UploadService._part_path(filename)
+            digest = ContentStore.hash_file(part_path)
+            stored = ContentStore.store(part_path, digest, filename)
+            VideoLibrary.add(filename, digest=digest)
+            PrepareService.schedule(filename)
+            ThumbnailService.schedule(filename)
+
+            return {
+                'success': True,
+                'message': 'Video uploaded successfully',
+                'filename': filename,
+                'deduplicated': stored['deduplicated']
+            }
+
+        except Exception as e:
+            current_app.logger.error(f"Upload finalize error: {str(e)}")
+            return {
+                'success': False,
+                'message': f'Failed to finalize upload: {str(e)}'
+            }
+
+    @staticmethod
+    def abort_upload(upload_id: str) -> Dict[str, Any]:
+        """
+        Cancel an upload session and delete its part file.
+
+        Args:
+            upload_id: Upload session id
+
+        Returns:
+            Dict with success status or error message
+        """
+        backend = get_state_backend()
+        upload = backend.get(UploadService.NAMESPACE, upload_id)
+        if not upload or not backend.delete(UploadService.NAMESPACE, upload_id):
+            return {'success': False, 'message': 'Upload not found or expired'}
+
+        try:
+            os.remove(UploadService._part_path(upload['filename']))
+        except OSError:
+            pass
+        return {'success': True, 'message': 'Upload cancelled'}
+
+    @staticmethod
+    def cleanup_stale_parts() -> int:
+        """Delete part files whose upload session or download has expired."""
+        live = {upload['filename'] for _, upload in get_state_backend().items(UploadService.NAMESPACE)}
+        cutoff = time.time() - Config.UPLOAD_SESSION_TTL
+        removed = 0
+
+        with os.scandir(Config.UPLOAD_FOLDER) as it:
+            for entry in it:
+                if not entry.name.endswith(UploadService.PART_SUFFIX):
+                    continue
+                if entry.name[:-len(UploadService.PART_SUFFIX)] in live:
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                    # Resume state of an abandoned ranged download
+                    if os.path.exists(entry.path + '.state') and not os.path.exists(entry.path):
+                        os.remove(entry.path + '.state')
+                except OSError:
+                    continue
+        return removed
+
+    @staticmethod
+    def _part_path(filename: str) -> str:
+        return os.path.join(Config.UPLOAD_FOLDER, filename + UploadService.PART_SUFFIX)
+
+    @staticmethod
+    def _add_range(upload_id: str, start: int, end: int) -> Optional[Dict[str, Any]]:
+        def merge(upload: Dict[str, Any]) -> Dict[str, Any]:
+            upload['ranges'] = UploadService._merge_ranges(upload['ranges'] + [[start, end]])
+            upload['updated_at'] = time.time()
+            return upload
+
+        return get_state_backend().modify(UploadService.NAMESPACE, upload_id, merge)
+
+    @staticmethod
+    def _merge_ranges(ranges: List[List[int]]) -> List[List[int]]:
+        merged: List[List[int]] = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+    @staticmethod
+    def _is_complete(upload: Dict[str, Any]) -> bool:
+        return upload['ranges'] == [[0, upload['size']]]
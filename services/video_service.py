@@ -1,21 +1,75 @@
 """Video service for video operations."""
 
-from typing import Dict, Any, Optional
+from collections import deque
+from typing import Callable, Deque, Dict, Any, Optional, Tuple
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
-from pygramcl import Download, Client
+from pygramcl import Download
 from flask import current_app
 from urllib.parse import urlparse
 import os
+import threading
 import time
+import uuid
 
 from config import Config
+from helpers import VideoLibrary, timed_upstream, upstream_call
 from utils import allowed_file, get_file_size, format_file_size
+from .content_store import ContentStore
+from .download_cache import DownloadCache
+from .downloader import DOWNLOADED_BYTES, DOWNLOAD_THROUGHPUT, RangedDownloader
+from .job_service import JobManager, JobOutcome
+from .prepare_service import PrepareService
+from .thumbnail_service import ThumbnailService
+from .session_pool import SessionPool
+
+
+class _DownloadProgress:
+    """Throttled progress reporter for a download job; also relays cancellation."""
+    
+    INTERVAL = 0.5
+    
+    def __init__(self, jobs: JobManager, job_id: str):
+        self.jobs = jobs
+        self.job_id = job_id
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._baseline: Optional[int] = None
+        self._last_report = 0.0
+    
+    def __call__(self, done: int, total: Optional[int]) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self._baseline is None:
+                # Bytes already on disk from an earlier attempt do not count towards the rate
+                self._baseline = done
+            if now - self._last_report < self.INTERVAL and done != total:
+                return not self.cancelled
+            self._last_report = now
+            
+            rate = (done - self._baseline) / max(now - self._started, 1e-3)
+            eta = (total - done) / rate if total and rate > 0 else None
+            job = self.jobs.update(self.job_id, progress={
+                'bytes_done': done,
+                'bytes_total': total,
+                'percent': round(done * 100 / total, 1) if total else None,
+                'rate_bps': int(rate),
+                'eta_seconds': round(eta) if eta is not None else None
+            })
+            if job and job.get('cancel_requested'):
+                self.cancelled = True
+            return not self.cancelled
 
 
 class VideoService:
     """Handle video upload and download operations."""
     
+    download_jobs = JobManager('download', Config.DOWNLOAD_WORKERS)
+    _host_active: Dict[str, int] = {}  # host -> connections in use
+    _host_queues: Dict[str, Deque[Tuple[str, Callable[[], None]]]] = {}
+    _host_lock = threading.Lock()
+    
     @staticmethod
     def upload_video(video_file: FileStorage) -> Dict[str, Any]:
         """
@@ -45,12 +99,17 @@ class VideoService:
             filename = f"ig_upload_{int(time.time())}{ext}"
             
             filepath = os.path.join(Config.UPLOAD_FOLDER, filename)
-            video_file.save(filepath)
+            digest, _ = ContentStore.write_stream(video_file.stream, filepath)
+            stored = ContentStore.store(filepath, digest, filename)
+            VideoLibrary.add(filename, digest=digest)
+            PrepareService.schedule(filename)
+            ThumbnailService.schedule(filename)
             
             return {
                 'success': True,
                 'message': 'Video uploaded successfully',
-                'filename': filename
+                'filename': filename,
+                'deduplicated': stored['deduplicated']
             }
             
         except Exception as e:
@@ -61,13 +120,19 @@ class VideoService:
             }
     
     @staticmethod
-    def download_video(url: str, cookies: Optional[str] = None) -> Dict[str, Any]:
+    def download_video(
+        url: str,
+        cookies: Optional[str] = None,
+        on_progress: Optional[Callable[[int, Optional[int]], bool]] = None
+    ) -> Dict[str, Any]:
         """
         Download video from URL (supports Instagram URLs).
         
         Args:
             url: Video URL
             cookies: Instagram cookies (required for Instagram URLs)
+            on_progress: Called with (bytes_done, total) during direct
+                downloads; returning False cancels the download
             
         Returns:
             Dict with success status and file info or error message
@@ -82,7 +147,7 @@ class VideoService:
                 }
             
             # Handle Instagram URLs
-            if 'instagram.com' in url and ('/p/' in url or '/reel/' in url):
+            if VideoService._is_instagram_post(url):
                 if not cookies:
                     return {
                         'success': False,
@@ -92,7 +157,7 @@ class VideoService:
                 return VideoService._download_instagram_video(url, cookies)
             
             # Handle direct video URLs
-            return VideoService._download_direct_url(url)
+            return VideoService._download_direct_url(url, on_progress)
             
         except Exception as e:
             current_app.logger.error(f"Download error: {str(e)}")
@@ -101,21 +166,165 @@ class VideoService:
                 'message': f'Download process failed: {str(e)}'
             }
     
+    @staticmethod
+    def queue_download(url: str, cookies: Optional[str] = None) -> str:
+        """
+        Queue a download job.
+        
+        Downloads from the same host take one of DOWNLOAD_PER_HOST
+        connections, so a burst of jobs cannot flood one server. A job only
+        goes to the download pool once its host has a free connection;
+        until then it waits in the host's queue without holding a thread.
+        
+        Args:
+            url: Video URL
+            cookies: Instagram cookies (required for Instagram URLs)
+            
+        Returns:
+            Id of the job in VideoService.download_jobs
+        """
+        jobs = VideoService.download_jobs
+        host = (urlparse(url).hostname or '').lower()
+        job_id = jobs.create(status='queued')
+        jobs.update(job_id, message=f'Waiting for a free connection to {host}')
+        
+        start = lambda: jobs.run(job_id, VideoService.run_download_job, url, cookies, host)
+        with VideoService._host_lock:
+            if VideoService._host_active.get(host, 0) < Config.DOWNLOAD_PER_HOST:
+                VideoService._host_active[host] = VideoService._host_active.get(host, 0) + 1
+            else:
+                VideoService._host_queues.setdefault(host, deque()).append((job_id, start))
+                start = None
+        if start:
+            start()
+        return job_id
+    
+    @staticmethod
+    def cancel_download(job_id: str) -> Dict[str, Any]:
+        """
+        Cancel a queued or running download.
+        
+        Args:
+            job_id: Id of the job in VideoService.download_jobs
+            
+        Returns:
+            Dict with success status and message
+        """
+        jobs = VideoService.download_jobs
+        with VideoService._host_lock:
+            withdrawn = False
+            for host, queue in list(VideoService._host_queues.items()):
+                for waiter in queue:
+                    if waiter[0] == job_id:
+                        queue.remove(waiter)
+                        if not queue:
+                            del VideoService._host_queues[host]
+                        withdrawn = True
+                        break
+        if withdrawn:
+            jobs.finish(job_id, JobOutcome('cancelled', 'Download cancelled', {}))
+            return {'success': True, 'message': 'Download cancelled'}
+        
+        job = jobs.get(job_id)
+        if job and not job['done'] and not job.get('cancellable', True):
+            return {'success': False, 'message': 'Instagram downloads cannot be cancelled once started'}
+        if not jobs.cancel(job_id):
+            return {'success': False, 'message': 'Download is not running'}
+        return {'success': True, 'message': 'Download is being cancelled'}
+    
+    @staticmethod
+    def run_download_job(job_id: str, url: str, cookies: Optional[str], host: str) -> JobOutcome:
+        """
+        Download a video as a background job.
+        
+        Queued by queue_download, and run once a connection to the host is
+        held; the connection is handed to the host's next queued job when
+        this one ends. The job moves through queued -> downloading -> done,
+        or failed / cancelled. Instagram downloads cannot be cancelled once
+        they run.
+        
+        Args:
+            job_id: Id of the job in VideoService.download_jobs
+            url: Video URL
+            cookies: Instagram cookies (required for Instagram URLs)
+            host: Host of the URL, whose connection this job holds
+            
+        Returns:
+            Outcome whose result is a dict with filename, filesize and
+            deduplicated, or empty on failure
+        """
+        jobs = VideoService.download_jobs
+        try:
+            job = jobs.update(
+                job_id, status='downloading', message=None,
+                cancellable=not VideoService._is_instagram_post(url)
+            )
+            if job and job.get('cancel_requested'):
+                return JobOutcome('cancelled', 'Download cancelled', {})
+            
+            progress = _DownloadProgress(jobs, job_id)
+            result = VideoService.download_video(url, cookies, on_progress=progress)
+        finally:
+            VideoService._release_host(host)
+        
+        if not result['success']:
+            if progress.cancelled:
+                return JobOutcome('cancelled', 'Download cancelled', {})
+            return JobOutcome('failed', result['message'], {})
+        
+        return JobOutcome('done', result['message'], {
+            'filename': result['filename'],
+            'filesize': result['filesize'],
+            'deduplicated': result.get('deduplicated', False)
+        })
+    
+    @staticmethod
+    def _release_host(host: str) -> None:
+        """Hand a host connection to the host's next queued job, or free it."""
+        with VideoService._host_lock:
+            queue = VideoService._host_queues.get(host)
+            if queue:
+                _, start = queue.popleft()
+                if not queue:
+                    del VideoService._host_queues[host]
+            else:
+                start = None
+                VideoService._host_active[host] -= 1
+                if not VideoService._host_active[host]:
+                    del VideoService._host_active[host]
+        if start:
+            start()
+    
+    @staticmethod
+    def _is_instagram_post(url: str) -> bool:
+        return 'instagram.com' in url and ('/p/' in url or '/reel/' in url)
+    
     @staticmethod
     def _download_instagram_video(post_url: str, cookies: str) -> Dict[str, Any]:
         """Download video from Instagram post using pygramcl."""
         try:
-            from pygramcl import Client
+            # Downloads run concurrently, so the second alone does not make the name unique
+            filename = f'ig_download_{int(time.time())}_{uuid.uuid4().hex[:8]}'
             
-            client = Client(cookies=cookies)
-            filename = f'ig_download_{int(time.time())}'
+            # Posts never change, so a cached shortcode skips Instagram entirely
+            cache_key = DownloadCache.cache_key(post_url)
+            cached = DownloadCache.lookup(cache_key)
+            if cached:
+                stored = DownloadCache.serve(cache_key, cached, f'{filename}.mp4')
+                if stored:
+                    return VideoService._cached_download_result(stored, 'Instagram video downloaded successfully')
+            
+            client = SessionPool.client(cookies)
             
             # Use Client's download_post method
-            result = client.download_post(
+            started = time.monotonic()
+            download_post = timed_upstream('video', 'instagram_download')(client.download_post)
+            result = download_post(
                 url=post_url,
                 filename=filename,
                 directory=Config.UPLOAD_FOLDER
             )
+            elapsed = time.monotonic() - started
             
             if not result:
                 return {
@@ -139,11 +348,24 @@ class VideoService:
                 filename = f"{filename}.mp4"  # Default extension
                 filesize = 'Unknown'
             
+            # pygramcl writes the file itself, so hash it in one extra read
+            filepath = os.path.join(Config.UPLOAD_FOLDER, filename)
+            size_bytes = get_file_size(filepath)
+            DOWNLOADED_BYTES.inc(size_bytes, source='instagram')
+            DOWNLOAD_THROUGHPUT.observe(size_bytes / max(elapsed, 1e-3), source='instagram')
+            digest = ContentStore.hash_file(filepath)
+            stored = ContentStore.store(filepath, digest, filename)
+            VideoLibrary.add(filename, digest=digest)
+            DownloadCache.put(cache_key, digest, filename)
+            PrepareService.schedule(filename)
+            ThumbnailService.schedule(filename)
+            
             return {
                 'success': True,
                 'message': 'Instagram video downloaded successfully',
                 'filename': filename,
-                'filesize': filesize
+                'filesize': filesize,
+                'deduplicated': stored['deduplicated']
             }
             
         except Exception as e:
@@ -154,31 +376,45 @@ class VideoService:
             }
     
     @staticmethod
-    def _download_direct_url(url: str) -> Dict[str, Any]:
+    def _download_direct_url(
+        url: str,
+        on_progress: Optional[Callable[[int, Optional[int]], bool]] = None
+    ) -> Dict[str, Any]:
         """Download video from direct URL."""
         try:
-            import requests
-            
-            filename = f'ig_download_{int(time.time())}.mp4'
+            filename = f'ig_download_{int(time.time())}_{uuid.uuid4().hex[:8]}.mp4'
             filepath = os.path.join(Config.UPLOAD_FOLDER, filename)
+            cache_key = DownloadCache.cache_key(url)
             
-            # Download with streaming
-            response = requests.get(url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            # Check if it's actually a video
-            content_type = response.headers.get('content-type', '')
-            if not any(vtype in content_type.lower() for vtype in ['video', 'octet-stream']):
-                return {
-                    'success': False,
-                    'message': f'URL does not point to a video file (Content-Type: {content_type})'
-                }
+            with RangedDownloader(url, on_progress) as downloader:
+                with upstream_call('video', 'direct_probe'):
+                    probe = downloader.probe()
+                
+                # A conditional probe is all a cache hit costs
+                cached = DownloadCache.lookup(cache_key)
+                if cached and DownloadCache.is_fresh(cached, probe):
+                    stored = DownloadCache.serve(cache_key, cached, filename)
+                    if stored:
+                        return VideoService._cached_download_result(stored, 'Video downloaded successfully')
+                
+                # Check if it's actually a video
+                content_type = downloader.content_type
+                if not any(vtype in content_type.lower() for vtype in ['video', 'octet-stream']):
+                    return {
+                        'success': False,
+                        'message': f'URL does not point to a video file (Content-Type: {content_type})'
+                    }
+                
+                # Segmented downloads arrive out of order and are hashed afterwards
+                with upstream_call('video', 'direct_download'):
+                    digest = downloader.download(probe)
+                digest = digest or ContentStore.hash_file(downloader.part_path)
+                stored = ContentStore.store(downloader.part_path, digest, filename)
             
-            # Save the file
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+            VideoLibrary.add(filename, digest=stored['digest'])
+            DownloadCache.put(cache_key, stored['digest'], filename, probe)
+            PrepareService.schedule(filename)
+            ThumbnailService.schedule(filename)
             
             # Get file size
             size_bytes = os.path.getsize(filepath)
@@ -188,7 +424,8 @@ class VideoService:
                 'success': True,
                 'message': 'Video downloaded successfully',
                 'filename': filename,
-                'filesize': filesize
+                'filesize': filesize,
+                'deduplicated': stored['deduplicated']
             }
             
         except Exception as e:
@@ -198,6 +435,21 @@ class VideoService:
                 'message': f'Failed to download video: {str(e)}'
             }
     
+    @staticmethod
+    def _cached_download_result(stored: Dict[str, Any], message: str) -> Dict[str, Any]:
+        """Build the download response for content answered from the download cache."""
+        VideoLibrary.add(stored['filename'], digest=stored['digest'])
+        PrepareService.schedule(stored['filename'])
+        ThumbnailService.schedule(stored['filename'])
+        size_bytes = os.path.getsize(os.path.join(Config.UPLOAD_FOLDER, stored['filename']))
+        return {
+            'success': True,
+            'message': message,
+            'filename': stored['filename'],
+            'filesize': f"{size_bytes / (1024*1024):.2f} MB",
+            'deduplicated': True
+        }
+    
     @staticmethod
     def delete_video(filename: str) -> Dict[str, Any]:
         """
@@ -219,7 +471,13 @@ class VideoService:
             
             filepath = os.path.join(Config.UPLOAD_FOLDER, secure_name)
             if os.path.exists(filepath):
+                entry = VideoLibrary.get(secure_name)
                 os.remove(filepath)
+                VideoLibrary.remove(secure_name)
+                digest = entry.get('digest') if entry else None
+                # The download cache may still want the content for a repeat download
+                if digest not in DownloadCache.pinned_digests():
+                    ContentStore.release(digest)
                 return {
                     'success': True,
                     'message': 'Video deleted successfully'
@@ -238,10 +496,11 @@ class VideoService:
             }
     
     @staticmethod
+    @timed_upstream('video', 'instagram_media_info')
     def _extract_instagram_video_url(post_url: str, cookies: str) -> Optional[str]:
         """Extract video URL from Instagram post."""
         try:
-            client = Client(cookies=cookies)
+            client = SessionPool.client(cookies)
             media = client.media_info(post_url)
             
             if not media:
@@ -0,0 +1,16 @@
+// Hover scrubbing over a video's preview strip; the poster shows otherwise.
+function scrubPreview(event, el) {
+    const frames = parseInt(el.dataset.frames, 10);
+    if (!el.dataset.sprite || !frames) return;
+    const rect = el.getBoundingClientRect();
+    const index = Math.min(frames - 1, Math.floor((event.clientX - rect.left) / rect.width * frames));
+    el.style.backgroundImage = `url('${el.dataset.sprite}')`;
+    el.style.backgroundSize = `${frames * 100}% 100%`;
+    el.style.backgroundPosition = `${frames > 1 ? index * 100 / (frames - 1) : 0}% 0`;
+}
+
+function resetPreview(el) {
+    el.style.backgroundImage = el.dataset.poster ? `url('${el.dataset.poster}')` : '';
+    el.style.backgroundSize = 'cover';
+    el.style.backgroundPosition = 'center';
+}
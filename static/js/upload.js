@@ -0,0 +1,97 @@
+// Resumable chunked uploads against /api/upload/init, /api/upload/<id> and /api/upload/<id>/finalize.
+// The upload id is remembered per file, so picking the same file again after a
+// dropped connection only sends the missing ranges.
+
+const CHUNK_RETRIES = 3;
+
+function uploadStorageKey(file) {
+    return `upload:${file.name}:${file.size}:${file.lastModified}`;
+}
+
+function missingRanges(ranges, size) {
+    const gaps = [];
+    let position = 0;
+    for (const [start, end] of ranges) {
+        if (start > position) {
+            gaps.push([position, start]);
+        }
+        position = Math.max(position, end);
+    }
+    if (position < size) {
+        gaps.push([position, size]);
+    }
+    return gaps;
+}
+
+async function resumeOrInitUpload(file) {
+    const storedId = localStorage.getItem(uploadStorageKey(file));
+    if (storedId) {
+        const response = await fetch(`/api/upload/${storedId}`);
+        const status = await response.json();
+        if (status.success) {
+            return {uploadId: storedId, ranges: status.ranges, chunkSize: status.chunk_size};
+        }
+        localStorage.removeItem(uploadStorageKey(file));
+    }
+
+    const response = await fetch('/api/upload/init', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({filename: file.name, size: file.size})
+    });
+    const result = await response.json();
+    if (!result.success) {
+        throw new Error(result.message);
+    }
+    localStorage.setItem(uploadStorageKey(file), result.upload_id);
+    return {uploadId: result.upload_id, ranges: [], chunkSize: result.chunk_size};
+}
+
+async function putChunk(uploadId, file, start, end) {
+    let lastError = null;
+    for (let attempt = 0; attempt < CHUNK_RETRIES; attempt++) {
+        try {
+            const response = await fetch(`/api/upload/${uploadId}?offset=${start}`, {
+                method: 'PUT',
+                headers: {'Content-Type': 'application/octet-stream'},
+                body: file.slice(start, end)
+            });
+            const result = await response.json();
+            if (result.success) {
+                return result;
+            }
+            lastError = new Error(result.message);
+        } catch (error) {
+            lastError = error;
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+    }
+    throw lastError;
+}
+
+async function uploadInChunks(file, onProgress) {
+    const {uploadId, ranges, chunkSize} = await resumeOrInitUpload(file);
+
+    let received = ranges.reduce((total, [start, end]) => total + (end - start), 0);
+    if (onProgress) {
+        onProgress(received, file.size);
+    }
+
+    for (const [gapStart, gapEnd] of missingRanges(ranges, file.size)) {
+        for (let start = gapStart; start < gapEnd; start += chunkSize) {
+            const end = Math.min(start + chunkSize, gapEnd);
+            await putChunk(uploadId, file, start, end);
+            received += end - start;
+            if (onProgress) {
+                onProgress(received, file.size);
+            }
+        }
+    }
+
+    const response = await fetch(`/api/upload/${uploadId}/finalize`, {method: 'POST'});
+    const result = await response.json();
+    if (result.success) {
+        localStorage.removeItem(uploadStorageKey(file));
+    }
+    return result;
+}
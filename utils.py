@@ -1,9 +1,13 @@
 import os
 import time
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from werkzeug.utils import secure_filename
 from flask import current_app
-from config import Config
+from helpers.cache import TTLCache
+from helpers.state import get_state_backend
+from helpers.library import VideoLibrary
+from helpers.process import process_alive, process_token
 
 # Import validators from helpers module
 from helpers.validators import validate_file as allowed_file
@@ -46,85 +50,307 @@ def safe_remove_file(filepath):
         current_app.logger.error(f"Failed to remove file {filepath}: {str(e)}")
     return False
 
+def format_video_entry(entry):
+    """Add display fields to a library index entry"""
+    entry['size_formatted'] = format_file_size(entry['size_bytes'])
+    entry['upload_date'] = datetime.fromtimestamp(entry['created_at']).strftime('%Y-%m-%d %H:%M:%S')
+    media = entry.get('media') or {}
+    if media.get('duration'):
+        minutes, seconds = divmod(int(media['duration']), 60)
+        hours, minutes = divmod(minutes, 60)
+        entry['duration_formatted'] = f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+    if media.get('width') and media.get('height'):
+        entry['resolution'] = f"{media['width']}x{media['height']}"
+    if entry.get('thumbnail') == 'ready' and entry.get('digest'):
+        entry['thumbnail_url'] = f"/thumbnails/{entry['digest']}.jpg"
+        entry['sprite_url'] = f"/thumbnails/{entry['digest']}_sprite.jpg"
+    return entry
+
+def get_video_page(offset=0, limit=None, sort=VideoLibrary.DEFAULT_SORT, query=None):
+    """Get one page of uploaded videos with metadata, newest first by default"""
+    page = VideoLibrary.page(offset=offset, limit=limit, sort=sort, query=query)
+    page['items'] = [format_video_entry(entry) for entry in page['items']]
+    return page
+
 def get_video_files():
     """Get list of uploaded video files with metadata"""
-    video_files = []
-    upload_folder = Config.UPLOAD_FOLDER
-    
     try:
-        for filename in os.listdir(upload_folder):
-            if allowed_file(filename):
-                filepath = os.path.join(upload_folder, filename)
-                video_files.append({
-                    'filename': filename,
-                    'size_bytes': get_file_size(filepath),
-                    'size_formatted': format_file_size(get_file_size(filepath)),
-                    'upload_date': get_file_creation_date(filepath),
-                    'secure_filename': secure_filename(filename)
-                })
-        
-        # Sort by upload date (newest first)
-        video_files.sort(key=lambda x: x['upload_date'], reverse=True)
-        
+        return get_video_page()['items']
     except OSError as e:
         current_app.logger.error(f"Failed to list video files: {str(e)}")
-    
-    return video_files
+        return []
 
 class LiveStreamManager:
-    """Manage live stream instances and sessions"""
+    """Manage live stream instances and sessions
+    
+    Stream records (active flag, broadcast id, title, start time) live in
+    the shared state backend so every worker process sees the same streams;
+    claiming a stream deletes its record atomically, so exactly one worker
+    wins a concurrent stop. Live objects themselves stay in this process's
+    ``_instances``, guarded by a registry lock plus striped per-session
+    locks (always taken stripe first, registry second).
+    """
+    
+    NAMESPACE = 'streams'
+    LOCK_STRIPES = 32
+    RESOLVER_MISS_TTL = 5  # seconds a session the resolver did not know is not asked again
     
     _instances = {}
+    _inactive = OrderedDict()  # session_id -> inactive_since, oldest first
+    _registry_lock = threading.Lock()
+    _session_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+    _resolver = None
+    _misses = TTLCache(RESOLVER_MISS_TTL, max_entries=4096)
     
     @classmethod
-    def create_instance(cls, session_id, live_obj):
-        """Create new live stream instance"""
-        cls._instances[session_id] = {
-            'live': live_obj,
-            'created_at': time.time(),
-            'active': True
-        }
+    def set_resolver(cls, resolver):
+        """Set a callable that recovers a live object for an unknown session id
+        
+        Used when streams are owned by another process, so a worker that did
+        not start a stream can still reach it.
+        """
+        cls._resolver = resolver
+    
+    @classmethod
+    def _session_lock(cls, session_id):
+        """Striped lock for a session"""
+        return cls._session_locks[hash(session_id) % cls.LOCK_STRIPES]
+    
+    @classmethod
+    def _lookup(cls, session_id):
+        """Shared record for a session, asking the resolver on a miss
+        
+        A record of a stream this process does not hold is checked against
+        its owner first and deleted if the owner is gone.
+        """
+        if not session_id:
+            return None
+        backend = get_state_backend()
+        record = backend.get(cls.NAMESPACE, session_id)
+        if record is None and cls._resolver:
+            live = cls._resolve(session_id)
+            if live:
+                cls.create_instance(
+                    session_id, live,
+                    broadcast_id=live.live_info.get('broadcast_id'),
+                    start_time=live.live_time
+                )
+                record = backend.get(cls.NAMESPACE, session_id)
+        elif record is not None and session_id not in cls._instances and cls._is_stale(session_id, record):
+            backend.delete(cls.NAMESPACE, session_id)
+            record = None
+        return record
+    
+    @classmethod
+    def _resolve(cls, session_id):
+        """Live object from the resolver, or None if it has none or is unreachable
+        
+        Misses are remembered for RESOLVER_MISS_TTL seconds, so polls for a
+        session without a stream do not reach the resolver every time.
+        """
+        if cls._misses.get(session_id):
+            return None
+        try:
+            live = cls._resolver(session_id)
+        except Exception:
+            return None
+        if live is None:
+            cls._misses.set(session_id, True)
+        return live
+    
+    @classmethod
+    def _is_stale(cls, session_id, record):
+        """Whether the stream of a record held by another process is gone
+        
+        With a resolver the streams are owned by the supervisor, so it is
+        asked (and a found stream attached locally); otherwise the record's
+        owner process must still be running. An unreachable supervisor
+        proves nothing, so the record is kept.
+        """
+        if cls._resolver:
+            try:
+                live = cls._resolver(session_id)
+            except Exception:
+                return False
+            if live is None:
+                return True
+            with cls._registry_lock:
+                cls._instances.setdefault(session_id, {'live': live})
+            return False
+        return not process_alive(record.get('owner_pid'), record.get('owner_token'))
+    
+    @classmethod
+    def purge_stale(cls):
+        """Delete records of streams whose owner is gone, e.g. from before a restart
+        
+        Returns the number of records deleted.
+        """
+        backend = get_state_backend()
+        removed = 0
+        for session_id, record in backend.items(cls.NAMESPACE):
+            if session_id in cls._instances or not cls._is_stale(session_id, record):
+                continue
+            if backend.delete(cls.NAMESPACE, session_id):
+                removed += 1
+        return removed
+    
+    @classmethod
+    def create_instance(cls, session_id, live_obj, **metadata):
+        """Create new live stream instance
+        
+        Extra keyword arguments (broadcast_id, title, start_time, ...) are
+        stored in the shared record. Returns False without replacing anything
+        if the session already has an active instance.
+        """
+        backend = get_state_backend()
+        with cls._session_lock(session_id):
+            existing = backend.get(cls.NAMESPACE, session_id)
+            # A record left behind by a stream that is gone is replaced
+            if existing and existing['active'] and (
+                session_id in cls._instances or not cls._is_stale(session_id, existing)
+            ):
+                return False
+            backend.set(cls.NAMESPACE, session_id, {
+                **metadata,
+                'created_at': time.time(),
+                'active': True,
+                'owner_pid': os.getpid(),
+                'owner_token': process_token()
+            })
+            with cls._registry_lock:
+                cls._inactive.pop(session_id, None)
+                cls._instances[session_id] = {'live': live_obj}
+            cls._misses.invalidate(session_id)
+            return True
     
     @classmethod
     def get_instance(cls, session_id):
         """Get live stream instance"""
-        return cls._instances.get(session_id, {}).get('live')
+        instance = cls._instances.get(session_id)
+        if instance:
+            return instance['live']
+        
+        # A stream of another worker is attached locally by the lookup
+        cls._lookup(session_id)
+        instance = cls._instances.get(session_id)
+        return instance['live'] if instance else None
+    
+    @classmethod
+    def get_metadata(cls, session_id):
+        """Shared record of a session's stream, or None"""
+        return cls._lookup(session_id)
     
     @classmethod
-    def remove_instance(cls, session_id):
-        """Remove live stream instance"""
-        if session_id in cls._instances:
-            instance = cls._instances[session_id]
-            if instance.get('live'):
-                try:
-                    instance['live'].stop()
-                except Exception as e:
-                    current_app.logger.error(f"Error stopping live instance: {str(e)}")
-            del cls._instances[session_id]
+    def claim_instance(cls, session_id, only_inactive=False):
+        """Atomically detach an instance from the registry
+        
+        Only one caller, across all workers, can claim a given instance; it
+        becomes responsible for stopping the returned live object. With
+        only_inactive, an instance that is (again) active is left in place.
+        """
+        live = cls.get_instance(session_id) if not only_inactive else None
+        backend = get_state_backend()
+        
+        with cls._session_lock(session_id):
+            record = backend.get(cls.NAMESPACE, session_id)
+            if not record or (only_inactive and record['active']):
+                return None
+            with cls._registry_lock:
+                instance = cls._instances.get(session_id)
+            live = live or (instance['live'] if instance else None)
+            if live is None:
+                # Owned by a process we cannot reach; leave it to its owner
+                return None
+            if not backend.delete(cls.NAMESPACE, session_id):
+                return None
+            with cls._registry_lock:
+                cls._instances.pop(session_id, None)
+                cls._inactive.pop(session_id, None)
+        return live
+    
+    @classmethod
+    def forget(cls, session_id):
+        """Drop a session's record and live object without stopping anything
+        
+        For a stream that already ended elsewhere, e.g. stopped by another
+        worker or whose broadcast process exited.
+        """
+        with cls._session_lock(session_id):
+            get_state_backend().delete(cls.NAMESPACE, session_id)
+            with cls._registry_lock:
+                cls._instances.pop(session_id, None)
+                cls._inactive.pop(session_id, None)
+        cls._misses.set(session_id, True)
+    
+    @classmethod
+    def remove_instance(cls, session_id, only_inactive=False, stop=None):
+        """Remove live stream instance, stopping it with stop(live) if given"""
+        live = cls.claim_instance(session_id, only_inactive)
+        if live:
+            # Network call, so done outside of any lock
+            try:
+                if stop:
+                    stop(live)
+                else:
+                    live.stop()
+            except Exception as e:
+                current_app.logger.error(f"Error stopping live instance: {str(e)}")
     
     @classmethod
     def is_active(cls, session_id):
         """Check if live stream is active"""
-        instance = cls._instances.get(session_id)
-        return instance and instance.get('active', False)
+        record = cls._lookup(session_id)
+        return bool(record and record['active'])
     
     @classmethod
     def set_inactive(cls, session_id):
         """Set live stream as inactive"""
-        if session_id in cls._instances:
-            cls._instances[session_id]['active'] = False
+        with cls._session_lock(session_id):
+            now = time.time()
+            record = get_state_backend().update(
+                cls.NAMESPACE, session_id, active=False, inactive_since=now
+            )
+            if record and session_id in cls._instances:
+                with cls._registry_lock:
+                    cls._inactive[session_id] = now
     
     @classmethod
-    def cleanup_old_instances(cls, max_age_hours=24):
-        """Cleanup old inactive instances"""
-        current_time = time.time()
-        max_age_seconds = max_age_hours * 3600
+    def session_ids(cls):
+        """Snapshot of session ids with a live object in this process"""
+        with cls._registry_lock:
+            return list(cls._instances)
+    
+    @classmethod
+    def snapshot(cls):
+        """Snapshot of stream records of all workers keyed by session id"""
+        return {
+            session_id: {
+                'active': record['active'],
+                'created_at': record['created_at'],
+                'broadcast_id': record.get('broadcast_id'),
+                'owner_pid': record.get('owner_pid')
+            } for session_id, record in get_state_backend().items(cls.NAMESPACE)
+        }
+    
+    @classmethod
+    def cleanup_old_instances(cls, max_age_hours=24, stop=None):
+        """Cleanup instances that have been inactive for longer than max_age_hours
+        
+        Walks this process's inactive index from the oldest entry and stops
+        at the first one that is still young, so live sessions are never
+        scanned.
+        """
+        cutoff = time.time() - max_age_hours * 3600
         
         to_remove = []
-        for session_id, instance in cls._instances.items():
-            age = current_time - instance.get('created_at', current_time)
-            if age > max_age_seconds and not instance.get('active', False):
+        with cls._registry_lock:
+            while cls._inactive:
+                session_id, inactive_since = next(iter(cls._inactive.items()))
+                if inactive_since > cutoff:
+                    break
+                cls._inactive.popitem(last=False)
                 to_remove.append(session_id)
         
         for session_id in to_remove:
-            cls.remove_instance(session_id)
\ No newline at end of file
+            cls.remove_instance(session_id, only_inactive=True, stop=stop)
+        return len(to_remove)